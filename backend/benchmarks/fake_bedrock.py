@@ -0,0 +1,175 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import io
+import json
+import math
+import random
+import struct
+import time
+from typing import List, Dict, Any
+
+import httpx
+
+from services.context_builder import estimate_tokens
+from services.lexical_index import tokenize
+
+# Faux `bedrock-runtime` pour mesurer le chatbot hors ligne :
+# - Titan : embeddings déterministes (hashing de mots, mêmes mots => vecteurs proches)
+# - Claude : réponse scriptée renvoyée en `application/vnd.amazon.eventstream`
+# La latence de chaque étape est configurable pour simuler la région eu-west-3,
+# ainsi qu'une part de streams Claude bloqués avant le premier token (queue de latence).
+
+DEFAULT_ANSWER = (
+    "Berthoni Passo est Data Analyst à Paris, certifié Power BI Data Analyst Associate "
+    "et Microsoft Fabric Data Engineer. Il conçoit des pipelines de données, des tableaux "
+    "de bord Power BI et Qlik Sense, ainsi que des projets d'IA générative sur AWS."
+)
+
+
+def fake_embedding(text: str, dimensions: int = 512) -> List[float]:
+    """
+    Embedding déterministe : chaque mot (sans accents ni mots vides) est haché
+    vers une dimension et un signe, puis le vecteur est normalisé.
+    """
+    vector = [0.0] * dimensions
+    for token in tokenize(text) or [text.strip().lower()]:
+        digest = hashlib.md5(token.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "big") % dimensions
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def _event_header(name: str, value: str) -> bytes:
+    name_bytes, value_bytes = name.encode(), value.encode()
+    # Type 7 = chaîne de caractères
+    return bytes([len(name_bytes)]) + name_bytes + bytes([7]) + struct.pack(">H", len(value_bytes)) + value_bytes
+
+
+def encode_event(payload: dict) -> bytes:
+    """
+    Un message eventstream `chunk` tel que l'envoie InvokeModelWithResponseStream.
+    """
+    inner = json.dumps(payload).encode("utf-8")
+    body = json.dumps({"bytes": base64.b64encode(inner).decode()}).encode("utf-8")
+    headers = _event_header(":message-type", "event") + _event_header(":event-type", "chunk") \
+        + _event_header(":content-type", "application/json")
+    prelude = struct.pack(">II", 12 + len(headers) + len(body) + 4, len(headers))
+    prelude += struct.pack(">I", binascii.crc32(prelude))
+    message = prelude + headers + body
+    return message + struct.pack(">I", binascii.crc32(message))
+
+
+def prompt_tokens(request_body: dict) -> int:
+    """
+    Taille estimée du prompt envoyé à Claude (system + tous les messages).
+    """
+    texts = [request_body.get("system", "")]
+    for message in request_body.get("messages", []):
+        texts.extend(part.get("text", "") for part in message.get("content", []))
+    return sum(estimate_tokens(t) for t in texts)
+
+
+class FakeBedrockRuntime:
+    """
+    Remplace le client boto3 `bedrock-runtime` (appels synchrones de bedrock_service)
+    et fournit un transport httpx pour le client asyncio de bedrock_async.
+    Chaque requête Claude reçue est conservée dans `claude_requests` (taille du prompt).
+    """
+
+    def __init__(self, embed_latency: float = 0.05, first_token_latency: float = 0.4,
+                 token_latency: float = 0.02, answer: str = DEFAULT_ANSWER, dimensions: int = 512,
+                 stall_rate: float = 0.0, stall_latency: float = 5.0, seed: int = 0):
+        self.embed_latency = embed_latency
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.answer = answer
+        self.dimensions = dimensions
+        self.stall_rate = stall_rate
+        self.stall_latency = stall_latency
+        self._random = random.Random(seed)
+        self.embedding_calls = 0
+        self.claude_requests: List[Dict[str, Any]] = []
+
+    def _answer_deltas(self) -> List[str]:
+        words = self.answer.split(" ")
+        return [w + (" " if i < len(words) - 1 else "") for i, w in enumerate(words)]
+
+    def _record_claude_request(self, body: dict):
+        self.claude_requests.append({"prompt_tokens": prompt_tokens(body), "messages": len(body.get("messages", []))})
+
+    def _embedding_response(self, body: dict) -> dict:
+        self.embedding_calls += 1
+        text = body["inputText"]
+        return {"embedding": fake_embedding(text, body.get("dimensions", self.dimensions)),
+                "inputTextTokenCount": estimate_tokens(text)}
+
+    def _stream_events(self, body: dict) -> List[bytes]:
+        events = [encode_event({"type": "message_start",
+                                "message": {"usage": {"input_tokens": prompt_tokens(body)}}})]
+        events += [encode_event({"type": "content_block_delta", "index": 0,
+                                 "delta": {"type": "text_delta", "text": delta}})
+                   for delta in self._answer_deltas()]
+        events.append(encode_event({"type": "message_stop"}))
+        return events
+
+    # --- Interface boto3 (services/bedrock_service.py) ---
+    def invoke_model(self, body: str, modelId: str, accept: str = None, contentType: str = None) -> dict:
+        request = json.loads(body)
+        if "inputText" in request:
+            time.sleep(self.embed_latency)
+            return {"body": io.BytesIO(json.dumps(self._embedding_response(request)).encode("utf-8"))}
+        self._record_claude_request(request)
+        time.sleep(self.first_token_latency)
+        response = {"content": [{"type": "text", "text": self.answer}]}
+        return {"body": io.BytesIO(json.dumps(response).encode("utf-8"))}
+
+    def invoke_model_with_response_stream(self, body: str, modelId: str, accept: str = None,
+                                          contentType: str = None) -> dict:
+        request = json.loads(body)
+        self._record_claude_request(request)
+
+        def events():
+            time.sleep(self.first_token_latency)
+            for delta in self._answer_deltas():
+                inner = json.dumps({"type": "content_block_delta", "delta": {"text": delta}}).encode("utf-8")
+                yield {"chunk": {"bytes": inner}}
+                time.sleep(self.token_latency)
+
+        return {"body": events()}
+
+    # --- Transport httpx (services/bedrock_async.py) ---
+    async def _handle(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        if request.url.path.endswith("/invoke"):
+            await asyncio.sleep(self.embed_latency)
+            return httpx.Response(200, json=self._embedding_response(body))
+
+        self._record_claude_request(body)
+        events = self._stream_events(body)
+        stalled = self._random.random() < self.stall_rate
+
+        async def stream():
+            await asyncio.sleep(self.stall_latency if stalled else self.first_token_latency)
+            for i, event in enumerate(events):
+                if i > 1:
+                    await asyncio.sleep(self.token_latency)
+                yield event
+
+        return httpx.Response(200, headers={"Content-Type": "application/vnd.amazon.eventstream"},
+                              content=stream())
+
+    def transport(self) -> httpx.AsyncBaseTransport:
+        return httpx.MockTransport(self._handle)
+
+    def install(self):
+        """
+        Branche ce faux Bedrock sur bedrock_service (boto3) et bedrock_async (httpx).
+        """
+        from services import bedrock_service, bedrock_async
+        bedrock_service.bedrock_runtime = self
+        bedrock_async._transport = self.transport()
+        bedrock_async._clients.clear()
+        bedrock_async._semaphores.clear()
@@ -0,0 +1,300 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Dict, Any
+
+# Ajouter le dossier backend au path (exécution via `python benchmarks/run_rag_benchmark.py`)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rag_questions.json")
+CV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cv_berthoni_rag.txt")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark hors ligne du chatbot RAG (faux Bedrock, SQLite en mémoire, index NumPy)."
+    )
+    parser.add_argument("--questions", default=QUESTIONS_PATH, help="Jeu de questions (JSON)")
+    parser.add_argument("--k", type=int, default=int(os.getenv("RAG_TOP_K", "3")), help="Passages retenus (recall@k)")
+    parser.add_argument("--repeat", type=int, default=20, help="Répétitions par question pour la latence de recherche")
+    parser.add_argument("--no-hybrid", action="store_true", help="Recherche vectorielle seule (sans BM25)")
+    parser.add_argument("--quantization", choices=["none", "int8", "binary"],
+                        default=os.getenv("RAG_VECTOR_QUANTIZATION", "none"), help="Format de l'index vectoriel")
+    parser.add_argument("--distractors", type=int, default=0,
+                        help="Chunks factices ajoutés au corpus (ex: 20000) : sans eux, le corpus compte moins de "
+                             "k * RAG_RESCORE_FACTOR chunks et l'index quantifié re-classe tout, sans rien filtrer")
+    parser.add_argument("--dimensions", default=os.getenv("RAG_EMBEDDING_DIMENSIONS", "512"),
+                        help="Dimension(s) Titan, ex: 256,512,1024 pour comparer recall / mémoire / latence")
+    parser.add_argument("--embed-latency-ms", type=float, default=50.0, help="Latence simulée d'un appel Titan")
+    parser.add_argument("--first-token-ms", type=float, default=400.0, help="Latence simulée avant le premier token Claude")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="Latence simulée entre deux tokens Claude")
+    parser.add_argument("--stall-rate", type=float, default=0.0,
+                        help="Part des streams Claude bloqués avant le premier token (ex: 0.1)")
+    parser.add_argument("--stall-ms", type=float, default=5000.0, help="Durée d'un stream Claude bloqué")
+    parser.add_argument("--hedge-delay-ms", type=float,
+                        help="Active une route Claude de secours, doublée après ce délai sans premier token")
+    parser.add_argument("--json", dest="json_path", help="Écrit aussi les résultats dans ce fichier JSON")
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    # À faire avant tout import des services : leur configuration est lue au chargement
+    os.environ["RAG_TOP_K"] = str(args.k)
+    os.environ["RAG_HYBRID_SEARCH"] = "false" if args.no_hybrid else "true"
+    os.environ["RAG_RETRIEVAL_BACKEND"] = "numpy"
+    os.environ["RAG_NUMPY_INDEX_PATH"] = ""
+    os.environ["RAG_VECTOR_QUANTIZATION"] = args.quantization
+    os.environ["RAG_EMBEDDING_DIMENSIONS"] = args.dimensions
+    os.environ["EMBEDDING_CACHE_DB"] = "false"
+    os.environ["ANSWER_CACHE_ENABLED"] = "false"
+    os.environ["CHAT_SESSION_ORACLE"] = "false"
+    os.environ["CHAT_BUDGET_ENABLED"] = "false"
+    if args.hedge_delay_ms is not None:
+        os.environ["CLAUDE_CHAT_FALLBACKS"] = "@eu-central-1"
+        os.environ["CLAUDE_HEDGE_DELAY_MS"] = str(args.hedge_delay_ms)
+    # La signature SigV4 du client asyncio a besoin d'identifiants, même factices
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(p / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def build_corpus(projects: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    import models
+    from services.chunking import chunk_text
+    from services.rag_indexer import project_document, project_source
+
+    with open(CV_PATH, "r", encoding="utf-8") as f:
+        chunks = chunk_text(f.read(), "cv_complet")
+    for project in projects:
+        chunks += chunk_text(project_document(models.Project(**project)), project_source(project["id"]))
+    return chunks
+
+
+def distractor_chunks(chunks: List[Dict[str, Any]], count: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """
+    Chunks factices faits de mots inventés, de la longueur des vrais chunks : jamais un passage attendu,
+    ils ne font que grossir l'index que le scan quantifié doit filtrer.
+    """
+    import random
+    import string
+    from services.chunking import content_hash
+
+    rng = random.Random(seed)
+    sizes = [len(c["content"].split()) for c in chunks]
+    distractors = []
+    for i in range(count):
+        content = " ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10)))
+                           for _ in range(rng.choice(sizes)))
+        distractors.append({"source": f"distractor_{i}", "section": None, "chunk_index": 0,
+                            "content": content, "content_hash": content_hash(content)})
+    return distractors
+
+
+def label(source: str, section: str) -> str:
+    return f"{source}#{section}" if section else source
+
+
+def recall(retrieved: List[str], expected: List[str]) -> float:
+    # Un passage attendu "project_2" est trouvé par n'importe quel chunk de cette source
+    found = [e for e in expected if any(r == e or r.split("#", 1)[0] == e for r in retrieved)]
+    return len(found) / len(expected)
+
+
+async def measure_chat(rag, db, questions: List[Dict[str, Any]], fake) -> List[Dict[str, Any]]:
+    results = []
+    for item in questions:
+        requests_before = len(fake.claude_requests)
+        start = time.perf_counter()
+        response = await rag.ask_chatbot(None, item["question"], db=db)
+        first_byte = None
+        async for chunk in response.body_iterator:
+            if first_byte is None and chunk:
+                first_byte = time.perf_counter() - start
+        total = time.perf_counter() - start
+        tokens = fake.claude_requests[-1]["prompt_tokens"] if len(fake.claude_requests) > requests_before else 0
+        results.append({"ttfb": first_byte or total, "total": total, "prompt_tokens": tokens})
+    return results
+
+
+def compare_dimensions(args, sizes: List[int]):
+    """
+    Un process par dimension (la configuration est lue à l'import des services),
+    puis un tableau recall / mémoire de l'index / latence pour choisir la plus petite taille suffisante.
+    """
+    rows = []
+    forwarded = ["--questions", args.questions, "--k", str(args.k), "--repeat", str(args.repeat),
+                 "--distractors", str(args.distractors),
+                 "--quantization", args.quantization, "--embed-latency-ms", str(args.embed_latency_ms),
+                 "--first-token-ms", str(args.first_token_ms), "--token-ms", str(args.token_ms),
+                 "--stall-rate", str(args.stall_rate), "--stall-ms", str(args.stall_ms)]
+    if args.no_hybrid:
+        forwarded.append("--no-hybrid")
+    if args.hedge_delay_ms is not None:
+        forwarded += ["--hedge-delay-ms", str(args.hedge_delay_ms)]
+    for size in sizes:
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+            path = tmp.name
+        try:
+            print(f"=== {size} dimensions ===")
+            subprocess.run([sys.executable, os.path.abspath(__file__), *forwarded,
+                            "--dimensions", str(size), "--json", path], check=True)
+            with open(path, "r", encoding="utf-8") as f:
+                rows.append(json.load(f)["summary"])
+        finally:
+            os.remove(path)
+
+    recall_key = f"recall@{args.k}"
+    print(f"\n{'dimensions':>10} {recall_key:>10} {'vs exact':>9} {'scan KiB':>10} {'float32 KiB':>12} "
+          f"{'search p50':>11} {'search p95':>11} {'ttfb p50':>9}")
+    for row in rows:
+        print(f"{row['dimensions']:>10} {row[recall_key]:>10.2f} {row['vector_recall_vs_exact']:>9.2f} "
+              f"{row['index_scan_bytes'] / 1024:>10.1f} "
+              f"{row['index_float32_bytes'] / 1024:>12.1f} {row['retrieval_ms_p50']:>9.2f}ms "
+              f"{row['retrieval_ms_p95']:>9.2f}ms {row['ttfb_ms_p50']:>7.0f}ms")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"dimensions": rows}, f, ensure_ascii=False, indent=2)
+        print(f"Résultats écrits dans {args.json_path}")
+
+
+def main():
+    args = parse_args()
+    sizes = [int(d) for d in args.dimensions.split(",") if d.strip()]
+    if len(sizes) > 1:
+        compare_dimensions(args, sizes)
+        return
+    configure_environment(args)
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+
+    import models
+    from benchmarks.fake_bedrock import FakeBedrockRuntime
+    from routers import rag
+    from benchmarks.fake_bedrock import fake_embedding
+    from services import rag_ingest, bedrock_service, vector_store
+    from services.embedding_index import EmbeddingIndex
+    from services.vector_store import RAG_RESCORE_FACTOR
+
+    fake = FakeBedrockRuntime(
+        embed_latency=args.embed_latency_ms / 1000,
+        first_token_latency=args.first_token_ms / 1000,
+        token_latency=args.token_ms / 1000,
+        stall_rate=args.stall_rate,
+        stall_latency=args.stall_ms / 1000,
+    )
+    fake.install()
+
+    # Base SQLite en mémoire : mêmes tables que sur Oracle, vecteurs dans l'index NumPy
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+    with open(args.questions, "r", encoding="utf-8") as f:
+        dataset = json.load(f)
+    questions = dataset["questions"]
+
+    chunks = build_corpus(dataset.get("projects", []))
+    distractors = distractor_chunks(chunks, args.distractors)
+    print(f"--- Benchmark RAG : {len(chunks)} chunks + {len(distractors)} factices, {len(questions)} questions, "
+          f"k={args.k}, {sizes[0]} dimensions, "
+          f"{'vectoriel seul' if args.no_hybrid else 'hybride vectoriel + BM25'} ---")
+    candidates = args.k * RAG_RESCORE_FACTOR
+    if args.quantization != "none" and len(chunks) + len(distractors) <= candidates:
+        print(f"⚠️  {len(chunks) + len(distractors)} chunks <= k * RAG_RESCORE_FACTOR = {candidates} : "
+              f"le scan {args.quantization} re-classe tout l'index, ajouter --distractors pour le mesurer")
+
+    # Index chargé (vide) avant l'ingestion : les vecteurs insérés y sont ajoutés directement
+    store = vector_store.get_vector_store()
+    store.ensure_loaded(db)
+    embeddings = rag_ingest.embed_texts([c["content"] for c in chunks])
+    ids = rag_ingest.insert_chunks(db, chunks, embeddings)
+    # Vecteurs des chunks factices calculés localement : aucun appel au faux Titan (et à sa latence)
+    distractor_embeddings = [fake_embedding(c["content"], sizes[0]) for c in distractors]
+    ids += rag_ingest.insert_chunks(db, distractors, distractor_embeddings)
+    db.commit()
+
+    # Référence float32 exacte, pour mesurer ce que la quantification fait perdre à la recherche vectorielle
+    exact_index = EmbeddingIndex(sizes[0])
+    all_chunks = chunks + distractors
+    exact_index.add(ids, [c["source"] for c in all_chunks], [c["content"] for c in all_chunks],
+                    embeddings + distractor_embeddings)
+    labels = {row.id: label(row.source, row.section)
+              for row in db.query(models.RagPortfolio.id, models.RagPortfolio.source, models.RagPortfolio.section)}
+
+    # 1. Chatbot de bout en bout (embeddings de questions encore froids) : TTFB et taille du prompt
+    chat = asyncio.run(measure_chat(rag, db, questions, fake))
+
+    # 2. Recherche seule : recall@k et latence (index déjà chargé, question déjà vectorisée)
+    rag._retrieve(db, questions[0]["question"], bedrock_service.get_embedding(questions[0]["question"]))
+    retrieval_times, recalls, overlaps, per_question = [], [], [], []
+    for item, chat_result in zip(questions, chat):
+        embedding = bedrock_service.get_embedding(item["question"])
+        exact = {d["id"] for d in exact_index.search(embedding, args.k)}
+        overlaps.append(len(exact & {d["id"] for d in store.search(db, embedding, args.k)}) / len(exact))
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            docs = rag._retrieve(db, item["question"], embedding)
+            retrieval_times.append(time.perf_counter() - start)
+        retrieved = [labels.get(d.get("id"), d["source"]) for d in docs]
+        score = recall(retrieved, item["expected"])
+        recalls.append(score)
+        per_question.append({"question": item["question"], "recall": score, "retrieved": retrieved, **chat_result})
+
+    index = vector_store.index_stats()
+    ttfbs = [r["ttfb"] for r in chat]
+    tokens = [r["prompt_tokens"] for r in chat]
+    summary = {
+        "k": args.k,
+        "hybrid": not args.no_hybrid,
+        "quantization": args.quantization,
+        "dimensions": sizes[0],
+        "chunks": len(chunks),
+        "distractors": len(distractors),
+        "questions": len(questions),
+        f"recall@{args.k}": sum(recalls) / len(recalls),
+        # Top-k vectoriel identique au scan float32 exact (1.0 sans quantification)
+        "vector_recall_vs_exact": sum(overlaps) / len(overlaps),
+        "retrieval_ms_p50": percentile(retrieval_times, 50) * 1000,
+        "retrieval_ms_p95": percentile(retrieval_times, 95) * 1000,
+        "prompt_tokens_mean": sum(tokens) / len(tokens),
+        "prompt_tokens_max": max(tokens),
+        "ttfb_ms_p50": percentile(ttfbs, 50) * 1000,
+        "ttfb_ms_p95": percentile(ttfbs, 95) * 1000,
+        "ttfb_ms_p99": percentile(ttfbs, 99) * 1000,
+        "total_ms_p50": percentile([r["total"] for r in chat], 50) * 1000,
+        "index_scan_bytes": index["scan_bytes"],
+        "index_float32_bytes": index["float32_bytes"],
+        "claude_requests": len(fake.claude_requests),
+    }
+
+    for result in per_question:
+        mark = "✅" if result["recall"] == 1 else ("🟡" if result["recall"] else "❌")
+        print(f"{mark} {result['question'][:60]:<60} recall={result['recall']:.2f} "
+              f"ttfb={result['ttfb'] * 1000:.0f}ms tokens={result['prompt_tokens']}")
+    print()
+    for key, value in summary.items():
+        print(f"{key:<20} {value:.2f}" if isinstance(value, float) else f"{key:<20} {value}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "questions": per_question}, f, ensure_ascii=False, indent=2)
+        print(f"Résultats écrits dans {args.json_path}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
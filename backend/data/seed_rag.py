@@ -4,9 +4,12 @@ import os
 # Ajouter le parent folder au path pour l'import relatif si on exécute depuis `backend/data`
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from database import SessionLocal
+from database import SessionLocal, engine
 from models import RagPortfolio
-from services import bedrock_service
+from migrations import run_migrations
+from services import rag_ingest
+from services.chunking import chunk_text
+from services.embedding_versions import active_version
 
 def seed_rag():
     print("--- Démarrage de l'Ingestion RAG ---")
@@ -15,34 +18,37 @@ def seed_rag():
     with open(cv_path, "r", encoding="utf-8") as f:
         content = f.read()
 
-    print("1. Appel à AWS Bedrock (Titan) pour vectoriser le texte...")
+    chunks = chunk_text(content, "cv_complet")
+    run_migrations(engine)
+    db = SessionLocal()
+    # Vecteurs calculés dans la version d'embedding active (celle qu'interroge le chatbot)
+    version = active_version(db)
+    print(f"1. Appel à AWS Bedrock (Titan) pour vectoriser les {len(chunks)} chunks...")
     try:
-        embedding = bedrock_service.get_embedding(content)
-        print(f"✅ Vectorisation terminée (Dimensions: {len(embedding)})")
+        embeddings = rag_ingest.embed_texts([c["content"] for c in chunks], version=version)
+        print(f"✅ Vectorisation terminée ({version.key})")
     except Exception as e:
         print(f"❌ Erreur Bedrock: {e}")
+        db.close()
         return
 
     print("2. Sauvegarde dans Oracle 23ai...")
-    db = SessionLocal()
     try:
-        # Nettoyer toute l'ancienne base pour être sûr de retirer "Thiais"
-        print("Nettoyage de l'ancienne base RAG...")
-        db.query(RagPortfolio).delete()
-        db.commit()
-
-        db_item = RagPortfolio(source="cv_complet", content=content)
-        db.add(db_item)
+        # Remplacer l'ancien CV (pour être sûr de retirer "Thiais") sans toucher aux chunks des projets
+        # ni aux lignes d'une version d'embedding en construction. Suppression et insertion dans
+        # la même transaction : le chatbot ne voit jamais une base vide.
+        print("Remplacement des chunks du CV...")
+        db.query(RagPortfolio).filter(RagPortfolio.source == "cv_complet",
+                                      RagPortfolio.embedding_version == version.key) \
+          .delete(synchronize_session=False)
+
+        # Une ligne par chunk (executemany) + écriture des vecteurs
+        rag_ingest.insert_chunks(db, chunks, embeddings, version)
         db.commit()
-        db.refresh(db_item)
-        
-        # Simulated vector column update (until Oracle VECTOR column is fully active)
-        # sql = text("UPDATE rag_portfolio SET vector_data = :vec WHERE id = :id")
-        # db.execute(sql, {"vec": str(embedding), "id": db_item.id})
-        # db.commit()
 
         print("✅ Le cerveau du Chatbot RAG a été mis à jour avec le profil !")
     except Exception as e:
+        db.rollback()
         print(f"❌ Erreur Base de données: {e}")
     finally:
         db.close()
@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,8 +7,10 @@ from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from sqlalchemy.orm import Session
-import models, database, auth
+from starlette.concurrency import run_in_threadpool
+import models, database, auth, migrations
 from routers import projects, interactions, rag, analytics, emotion
+from services.analytics_buffer import analytics_buffer
 import os
 
 # Rate limiter (basé sur l'IP)
@@ -16,10 +19,19 @@ limiter = Limiter(key_func=get_remote_address, default_limits=["60/minute"])
 # Création des tables dans Oracle
 try:
     models.Base.metadata.create_all(bind=database.engine)
+    migrations.run_migrations(database.engine)
     print("✅ Connexion Oracle OK — tables synchronisées")
 except Exception as e:
     print(f"⚠️  Oracle pas encore prêt au démarrage : {e}")
 
+# Arrêt du serveur : les événements analytics encore en file sont écrits.
+# Sous Lambda, Mangum exécute ce cycle autour de chaque invocation : la file est donc vidée
+# avant que l'environnement ne soit gelé.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await run_in_threadpool(analytics_buffer.flush)
+
 # Désactiver les docs en production
 IS_DEV = os.getenv("ENV", "development") == "development"
 app = FastAPI(
@@ -28,6 +40,7 @@ app = FastAPI(
     docs_url="/docs" if IS_DEV else None,       # Swagger caché en prod
     redoc_url="/redoc" if IS_DEV else None,      # ReDoc caché en prod
     openapi_url="/openapi.json" if IS_DEV else None,
+    lifespan=lifespan,
 )
 
 # Rate limiter
@@ -55,6 +68,7 @@ app.add_middleware(
     allow_credentials=False, # Doit être False si allow_origins=["*"]
     allow_methods=["*"],  # Inclut OPTIONS crucial pour le preflight
     allow_headers=["*"],
+    expose_headers=["X-Chat-Session"],  # identifiant de conversation du chatbot
 )
 
 # ── Security Headers ─────────────────────────────────────────
@@ -0,0 +1,253 @@
+import os
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+# Migrations "légères" exécutées au démarrage, après `create_all`.
+# `create_all` ne modifie jamais une table existante : tout ce qui touche
+# une table déjà en production (colonnes ajoutées, index) passe par ici.
+# Chaque étape est idempotente et n'interrompt jamais le démarrage de l'API.
+
+# Dimension des embeddings Titan v2 de l'index RAG : 256, 512 ou 1024.
+# Chaque dimension a sa propre colonne VECTOR (vector_data pour 512, vector_data_256 /
+# vector_data_1024 sinon) : le job de ré-embedding (services/reembed.py) remplit la colonne
+# d'une nouvelle dimension pendant que l'index courant continue de servir les questions.
+SUPPORTED_EMBEDDING_DIMENSIONS = (256, 512, 1024)
+DEFAULT_EMBEDDING_DIMENSIONS = 512
+EMBEDDING_DIMENSIONS = int(os.getenv("RAG_EMBEDDING_DIMENSIONS", str(DEFAULT_EMBEDDING_DIMENSIONS)))
+if EMBEDDING_DIMENSIONS not in SUPPORTED_EMBEDDING_DIMENSIONS:
+    print(f"Warning: RAG_EMBEDDING_DIMENSIONS={EMBEDDING_DIMENSIONS} non supporté par Titan v2, "
+          f"{DEFAULT_EMBEDDING_DIMENSIONS} utilisé")
+    EMBEDDING_DIMENSIONS = DEFAULT_EMBEDDING_DIMENSIONS
+
+# Index vectoriel optionnel : "hnsw" (graphe en mémoire, nécessite VECTOR_MEMORY_SIZE),
+# "ivf" (partitions sur disque) ou vide pour un scan exact.
+RAG_VECTOR_INDEX = os.getenv("RAG_VECTOR_INDEX", "").strip().lower()
+RAG_VECTOR_INDEX_ACCURACY = int(os.getenv("RAG_VECTOR_INDEX_ACCURACY", "95"))
+
+# Copie compacte des vecteurs pour le scan des candidats : "int8", "binary" ou "none" (défaut).
+# À activer explicitement, une fois vérifié avec benchmarks/run_rag_benchmark.py --quantization
+# --distractors N (N au moins de l'ordre du nombre de chunks en production, et bien au-delà de
+# k * RAG_RESCORE_FACTOR : en dessous le scan compact re-classe tout et ne mesure rien) que recall@k
+# et vector_recall_vs_exact tiennent : la colonne et l'index compacts ne sont créés qu'à ce moment.
+# Chaque format a sa colonne (vector_int8 / vector_binary, suffixée par la dimension
+# hors 512) : en changer ne casse rien.
+RAG_VECTOR_QUANTIZATION = os.getenv("RAG_VECTOR_QUANTIZATION", "none").strip().lower()
+QUANTIZED_VECTOR_FORMATS = {"int8": "INT8", "binary": "BINARY"}
+
+
+def _dimension_suffix(dimensions: int) -> str:
+    # Les colonnes historiques (512 dimensions) gardent leur nom d'origine
+    return "" if dimensions == DEFAULT_EMBEDDING_DIMENSIONS else f"_{dimensions}"
+
+
+def vector_column(dimensions: int = EMBEDDING_DIMENSIONS) -> str:
+    return f"vector_data{_dimension_suffix(dimensions)}"
+
+
+def quantized_vector_column(dimensions: int = EMBEDDING_DIMENSIONS) -> str:
+    return f"vector_{RAG_VECTOR_QUANTIZATION}{_dimension_suffix(dimensions)}"
+
+
+def _column_names(engine: Engine, table: str) -> set:
+    return {c["name"].lower() for c in inspect(engine).get_columns(table)}
+
+
+def _index_names(engine: Engine, table: str) -> set:
+    return {i["name"].lower() for i in inspect(engine).get_indexes(table)}
+
+
+def add_column_if_missing(engine: Engine, table: str, column: str, ddl: str):
+    """
+    Ajoute une colonne à une table existante si elle n'y est pas encore.
+    """
+    try:
+        if column.lower() in _column_names(engine, table):
+            return
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} ADD ({column} {ddl})"))
+        print(f"✅ Colonne {table}.{column} ajoutée")
+    except Exception as e:
+        print(f"⚠️  Ajout de la colonne {table}.{column} impossible : {e}")
+
+
+def ensure_rag_vector_column(engine: Engine, dimensions: int = EMBEDDING_DIMENSIONS) -> bool:
+    """
+    Ajoute la colonne `vector_data VECTOR(512, FLOAT32)` à rag_portfolio (Oracle 23ai),
+    ou sa variante pour une autre dimension (`vector_data_1024 VECTOR(1024, FLOAT32)`).
+    Retourne False si la base ne supporte pas le type VECTOR.
+    """
+    column = vector_column(dimensions)
+    try:
+        if column in _column_names(engine, "rag_portfolio"):
+            return True
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"ALTER TABLE rag_portfolio ADD ({column} VECTOR({dimensions}, FLOAT32))"
+            ))
+        print(f"✅ Colonne rag_portfolio.{column} ajoutée")
+        return True
+    except Exception as e:
+        print(f"⚠️  Colonne VECTOR indisponible (Oracle 23ai requis) : {e}")
+        return False
+
+
+def ensure_rag_quantized_column(engine: Engine, dimensions: int = EMBEDDING_DIMENSIONS) -> bool:
+    """
+    Ajoute la colonne quantifiée (VECTOR(512, INT8) ou VECTOR(512, BINARY)) puis
+    la remplit pour les lignes qui n'ont encore que leur vecteur float32.
+    """
+    if RAG_VECTOR_QUANTIZATION not in QUANTIZED_VECTOR_FORMATS:
+        return False
+    column = quantized_vector_column(dimensions)
+    source = vector_column(dimensions)
+    vector_format = QUANTIZED_VECTOR_FORMATS[RAG_VECTOR_QUANTIZATION]
+    add_column_if_missing(engine, "rag_portfolio", column, f"VECTOR({dimensions}, {vector_format})")
+    try:
+        from services.quantization import oracle_literal
+
+        with engine.connect() as conn:
+            rows = conn.execute(text(
+                f"SELECT id, {source} AS vector_data FROM rag_portfolio "
+                f"WHERE {column} IS NULL AND {source} IS NOT NULL"
+            )).all()
+        if not rows:
+            return True
+        with engine.begin() as conn:
+            conn.execute(
+                text(f"UPDATE rag_portfolio SET {column} = "
+                     f"TO_VECTOR(:qvec, {dimensions}, {vector_format}) WHERE id = :id"),
+                [{"qvec": oracle_literal(RAG_VECTOR_QUANTIZATION, list(r.vector_data)), "id": r.id} for r in rows],
+            )
+        print(f"✅ {len(rows)} vecteur(s) quantifié(s) en {vector_format} dans rag_portfolio.{column}")
+        return True
+    except Exception as e:
+        print(f"⚠️  Quantification des vecteurs RAG impossible : {e}")
+        return False
+
+
+def ensure_rag_vector_index(engine: Engine, dimensions: int = EMBEDDING_DIMENSIONS):
+    """
+    Crée l'index vectoriel HNSW ou IVF si RAG_VECTOR_INDEX le demande,
+    sur la colonne parcourue par la recherche (quantifiée si RAG_VECTOR_QUANTIZATION l'est).
+    """
+    if RAG_VECTOR_INDEX not in ("hnsw", "ivf"):
+        return
+    quantized = RAG_VECTOR_QUANTIZATION in QUANTIZED_VECTOR_FORMATS
+    column = quantized_vector_column(dimensions) if quantized else vector_column(dimensions)
+    kind = RAG_VECTOR_QUANTIZATION if quantized else "vec"
+    index_name = f"rag_portfolio_{kind}{_dimension_suffix(dimensions)}_idx"
+    distance = "HAMMING" if RAG_VECTOR_QUANTIZATION == "binary" else "COSINE"
+    try:
+        if index_name in _index_names(engine, "rag_portfolio"):
+            return
+        organization = "INMEMORY NEIGHBOR GRAPH" if RAG_VECTOR_INDEX == "hnsw" else "NEIGHBOR PARTITIONS"
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE VECTOR INDEX {index_name} ON rag_portfolio ({column}) "
+                f"ORGANIZATION {organization} DISTANCE {distance} "
+                f"WITH TARGET ACCURACY {RAG_VECTOR_INDEX_ACCURACY}"
+            ))
+        print(f"✅ Index vectoriel {RAG_VECTOR_INDEX.upper()} créé sur rag_portfolio.{column}")
+    except Exception as e:
+        print(f"⚠️  Création de l'index vectoriel impossible : {e}")
+
+
+def ensure_rag_embedding_version(engine: Engine):
+    """
+    Ajoute rag_portfolio.embedding_version (et son index) ; les lignes indexées avant
+    le suivi des versions reçoivent la version historique (Titan v2, 512, normalisé).
+    """
+    from services.embedding_versions import LEGACY_VERSION
+
+    add_column_if_missing(engine, "rag_portfolio", "embedding_version", "VARCHAR2(150)")
+    try:
+        with engine.begin() as conn:
+            updated = conn.execute(
+                text("UPDATE rag_portfolio SET embedding_version = :version WHERE embedding_version IS NULL"),
+                {"version": LEGACY_VERSION.key},
+            ).rowcount
+        if updated:
+            print(f"✅ {updated} ligne(s) rag_portfolio marquée(s) en {LEGACY_VERSION.key}")
+        if "ix_rag_portfolio_embedding_version" not in _index_names(engine, "rag_portfolio"):
+            with engine.begin() as conn:
+                conn.execute(text(
+                    "CREATE INDEX ix_rag_portfolio_embedding_version ON rag_portfolio (embedding_version)"
+                ))
+    except Exception as e:
+        print(f"⚠️  Versions d'embedding de rag_portfolio impossibles à initialiser : {e}")
+
+
+def ensure_analytics_rollups(engine: Engine):
+    """
+    Premier démarrage avec les rollups analytics : le calcul depuis l'historique n'est pas lancé ici
+    (démarrages à froid simultanés, durée proportionnelle à l'historique), mais par le job de compaction.
+    """
+    from services import analytics_rollup
+
+    try:
+        if analytics_rollup.needs_backfill():
+            print("⚠️  Rollups analytics vides : lancer POST /api/analytics/rollups/compact?full=true "
+                  "pour les calculer depuis l'historique")
+    except Exception as e:
+        print(f"⚠️  Rollups analytics impossibles à vérifier : {e}")
+
+
+# Tables qui ne sont plus lues ni écrites : supprimées des bases existantes
+OBSOLETE_TABLES = ("analytics_visitors",)
+
+
+def drop_obsolete_tables(engine: Engine):
+    try:
+        existing = {t.lower() for t in inspect(engine).get_table_names()}
+    except Exception as e:
+        print(f"⚠️  Tables obsolètes impossibles à vérifier : {e}")
+        return
+    for table in OBSOLETE_TABLES:
+        if table not in existing:
+            continue
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"DROP TABLE {table}"))
+            print(f"✅ Table obsolète {table} supprimée")
+        except Exception as e:
+            print(f"⚠️  Suppression de la table {table} impossible : {e}")
+
+
+ANALYTICS_INDEXES = {
+    "ix_analytics_created_at_event_type": "created_at, event_type",
+    "ix_analytics_event_type_target_id": "event_type, target_id",
+}
+
+
+def ensure_analytics_indexes(engine: Engine):
+    """
+    Index composites de la table analytics (jusque-là sans autre index que sa clé primaire) :
+    les filtres par période et par type d'événement deviennent des parcours d'intervalle.
+    """
+    try:
+        existing = _index_names(engine, "analytics")
+    except Exception as e:
+        print(f"⚠️  Index de la table analytics impossibles à vérifier : {e}")
+        return
+    for name, columns in ANALYTICS_INDEXES.items():
+        if name in existing:
+            continue
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"CREATE INDEX {name} ON analytics ({columns})"))
+            print(f"✅ Index {name} créé")
+        except Exception as e:
+            print(f"⚠️  Création de l'index {name} impossible : {e}")
+
+
+def run_migrations(engine: Engine):
+    add_column_if_missing(engine, "rag_portfolio", "section", "VARCHAR2(200 CHAR)")
+    add_column_if_missing(engine, "rag_portfolio", "chunk_index", "NUMBER(10)")
+    add_column_if_missing(engine, "rag_portfolio", "content_hash", "VARCHAR2(64)")
+    ensure_rag_embedding_version(engine)
+    ensure_analytics_indexes(engine)
+    ensure_analytics_rollups(engine)
+    drop_obsolete_tables(engine)
+    if ensure_rag_vector_column(engine):
+        ensure_rag_quantized_column(engine)
+        ensure_rag_vector_index(engine)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, UniqueConstraint, Identity
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, UniqueConstraint, Identity, LargeBinary, Index
 from sqlalchemy.orm import relationship
 import datetime
 from database import Base
@@ -73,6 +73,12 @@ class Analytics(Base):
     user_agent = Column(String(255))
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
+    # Parcours d'intervalle sur une période (recalcul des rollups) et par type d'événement / cible
+    __table_args__ = (
+        Index("ix_analytics_created_at_event_type", "created_at", "event_type"),
+        Index("ix_analytics_event_type_target_id", "event_type", "target_id"),
+    )
+
 class Message(Base):
     __tablename__ = "messages"
 
@@ -91,7 +97,83 @@ class RagPortfolio(Base):
 
     id = Column(Integer, Identity(), primary_key=True)
     source = Column(String(100)) # e.g. 'cv', 'project_1'
+    section = Column(String(200)) # titre de section du document d'origine
+    chunk_index = Column(Integer) # position du chunk dans le document
+    content_hash = Column(String(64)) # sha256 du contenu, pour la ré-indexation incrémentale
     content = Column(Text)
-    # The actual vector column might require a raw SQL migration to define it as VECTOR(1536)
-    # in SQLAlchemy, we may map it dynamically or just ignore the column in the simple class
-    # and query it raw.
+    # Modèle Titan / dimension / normalisation du vecteur de la ligne (services/embedding_versions.py).
+    # Pendant une migration, un même chunk existe dans l'ancienne et la nouvelle version.
+    embedding_version = Column(String(150), index=True)
+    # The vector column `vector_data VECTOR(512, FLOAT32)` (one column per embedding size,
+    # e.g. `vector_data_1024`) is added by migrations.py
+    # and deliberately left unmapped here: it is written and queried in raw SQL
+    # (services/vector_store.py) so the ORM keeps working on Oracle versions without VECTOR.
+
+class RagEmbeddingVersion(Base):
+    __tablename__ = "rag_embedding_versions"
+
+    # "amazon.titan-embed-text-v2:0|512|norm"
+    version = Column(String(150), primary_key=True)
+    model_id = Column(String(100), nullable=False)
+    dimensions = Column(Integer, nullable=False)
+    normalize = Column(Boolean, default=True)
+    status = Column(String(20), nullable=False)   # building | active | retired
+    chunks = Column(Integer, default=0)           # chunks ré-embeddés par le dernier job
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    activated_at = Column(DateTime)
+
+class EmbeddingCache(Base):
+    __tablename__ = "embedding_cache"
+
+    # sha256(model_id, dimensions, texte normalisé)
+    key_hash = Column(String(64), primary_key=True)
+    model_id = Column(String(100), nullable=False)
+    dimensions = Column(Integer, nullable=False)
+    embedding = Column(LargeBinary, nullable=False)     # float32 packés (array('f').tobytes())
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class ChatSession(Base):
+    __tablename__ = "chat_sessions"
+
+    # Débordement optionnel des conversations du chatbot (CHAT_SESSION_ORACLE=true)
+    session_id = Column(String(32), primary_key=True)
+    summary = Column(Text)                               # résumé glissant des anciens échanges
+    turns = Column(Text)                                 # derniers messages (JSON)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+class ChatTokenUsage(Base):
+    __tablename__ = "chat_token_usage"
+
+    # Dépense Claude estimée du chatbot, par jour UTC (plafond global, partagé entre process)
+    day = Column(String(10), primary_key=True)          # "2026-10-18"
+    tokens = Column(Integer, default=0, nullable=False)
+    requests = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+class AnalyticsHourly(Base):
+    __tablename__ = "analytics_hourly"
+
+    # Compteurs d'événements par heure UTC, tenus à jour à chaque écriture de lot (services/analytics_rollup.py)
+    bucket = Column(DateTime, primary_key=True)                 # début de l'heure
+    event_type = Column(String(100), primary_key=True)
+    target_id = Column(Integer, primary_key=True, default=0)    # 0 = sans cible
+    events = Column(Integer, default=0, nullable=False)
+
+class AnalyticsDaily(Base):
+    __tablename__ = "analytics_daily"
+
+    # Mêmes compteurs par jour UTC : lus par le dashboard (/api/analytics/summary)
+    bucket = Column(DateTime, primary_key=True)                 # minuit du jour
+    event_type = Column(String(100), primary_key=True)
+    target_id = Column(Integer, primary_key=True, default=0)
+    events = Column(Integer, default=0, nullable=False)
+
+class AnalyticsDailyVisitors(Base):
+    __tablename__ = "analytics_daily_visitors"
+
+    # Sketch HyperLogLog des visiteurs (ip_hash) par jour UTC et par type d'événement ("*" = tous) :
+    # fusionnés pour estimer les visiteurs uniques d'une période quelconque (services/hyperloglog.py)
+    bucket = Column(DateTime, primary_key=True)
+    event_type = Column(String(100), primary_key=True)
+    sketch = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
@@ -1,72 +1,172 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from sqlalchemy.orm import Session
 from sqlalchemy import func
+from starlette.concurrency import run_in_threadpool
 import hashlib
 import models, database, auth
 import datetime
-from pydantic import BaseModel
-from typing import Optional
+import schemas
+from pydantic import Field, TypeAdapter, ValidationError
+from typing import Annotated, Optional, List
+
+from services import analytics_rollup
+from services.analytics_buffer import analytics_buffer, event_row, ANALYTICS_BUFFER_ENABLED
+
+# Lot d'événements envoyé par navigator.sendBeacon (useAnalytics.ts) : au plus N événements
+ANALYTICS_BATCH_MAX_EVENTS = 50
+ANALYTICS_BATCH_MAX_BYTES = 32 * 1024
+_batch_adapter = TypeAdapter(Annotated[List[schemas.AnalyticsCreate], Field(max_length=ANALYTICS_BATCH_MAX_EVENTS)])
 
 router = APIRouter(
     prefix="/api/analytics",
     tags=["Analytics"]
 )
 
-class AnalyticsEventCreate(BaseModel):
-    event_type: str
-    target_id: Optional[int] = None
-
-# 1. Enregistrer un événement public
-@router.post("/")
-def log_event(event: AnalyticsEventCreate, request: Request, db: Session = Depends(database.get_db)):
-    # Hash IP simple ou récupération
+def _client_fingerprint(request: Request):
+    # Hash IP simple (anonymat) et user-agent
     client_ip = request.client.host if request.client else "unknown"
     user_agent = request.headers.get('user-agent', 'unknown')
-    
-    # Simple hash for anonymity (or use auth ip_hash mechanics)
-    import hashlib
-    ip_hash = hashlib.sha256(client_ip.encode('utf-8')).hexdigest()
-
-    new_event = models.Analytics(
-        event_type=event.event_type,
-        target_id=event.target_id,
-        ip_hash=ip_hash,
-        user_agent=user_agent[:250] # Limite de la colonne SQL
-    )
-    db.add(new_event)
+    return hashlib.sha256(client_ip.encode('utf-8')).hexdigest(), user_agent
+
+# 1. Enregistrer un événement public
+# Mis en file et inséré par lots (services/analytics_buffer.py) : 202 sans attendre Oracle
+@router.post("/", status_code=status.HTTP_202_ACCEPTED)
+async def log_event(event: schemas.AnalyticsCreate, request: Request):
+    ip_hash, user_agent = _client_fingerprint(request)
+    row = event_row(event.event_type, event.target_id, ip_hash, user_agent)
+    if not ANALYTICS_BUFFER_ENABLED:
+        try:
+            await run_in_threadpool(analytics_buffer.write, [row])
+        except Exception as e:
+            raise HTTPException(status_code=500, detail="Erreur interne (Oracle Analytics)")
+    elif not analytics_buffer.add(row):
+        return {"status": "dropped", "message": f"Event {event.event_type} not tracked"}
+
+    return {"status": "accepted", "message": f"Event {event.event_type} tracked"}
+
+# 1 bis. Enregistrer plusieurs événements en une requête
+# Corps JSON envoyé en text/plain (navigator.sendBeacon) : requête "simple", sans preflight CORS
+@router.post("/batch", status_code=status.HTTP_202_ACCEPTED)
+async def log_events(request: Request):
+    body = await request.body()
+    if len(body) > ANALYTICS_BATCH_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Lot d'événements trop volumineux")
     try:
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail="Erreur interne (Oracle Analytics)")
-        
-    return {"status": "success", "message": f"Event {event.event_type} tracked"}
+        # Validation de toute la liste en une passe (taille du lot, pattern event_type, target_id >= 1)
+        events = _batch_adapter.validate_json(body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False, include_input=False))
+
+    ip_hash, user_agent = _client_fingerprint(request)
+    rows = [event_row(e.event_type, e.target_id, ip_hash, user_agent) for e in events]
+    if not rows:
+        return {"accepted": 0, "dropped": 0}
+    if not ANALYTICS_BUFFER_ENABLED:
+        try:
+            # Un seul INSERT (executemany) pour tout le lot
+            await run_in_threadpool(analytics_buffer.write, rows)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail="Erreur interne (Oracle Analytics)")
+        return {"accepted": len(rows), "dropped": 0}
+    accepted = analytics_buffer.add_many(rows)
+    return {"accepted": accepted, "dropped": len(rows) - accepted}
 
 # 2. Récupérer les stats (Admin uniquement)
 @router.get("/summary", dependencies=[Depends(auth.get_current_admin_user)])
-def get_analytics_summary(db: Session = Depends(database.get_db)):
+def get_analytics_summary(
+    from_date: Optional[datetime.date] = Query(None, alias="from"),
+    to_date: Optional[datetime.date] = Query(None, alias="to"),
+    event_type: Optional[str] = Query(None, max_length=100, pattern="^[a-zA-Z0-9_]+$"),
+    window_days: int = 7,
+    db: Session = Depends(database.get_db),
+):
+    """
+    Compteurs par type d'événement et par projet, et visiteurs uniques, sur la période `from` - `to`
+    (jours UTC inclus, tout l'historique par défaut), éventuellement pour un seul `event_type`.
+    Les visiteurs uniques sont estimés (±1 %) par fusion des sketches HyperLogLog journaliers :
+    coût indépendant du nombre de visiteurs, avec ou sans filtre.
+    `window_unique_visitors` : visiteurs uniques estimés des `window_days` derniers jours, par type d'événement.
+    """
+    if not 1 <= window_days <= 3660:
+        raise HTTPException(status_code=400, detail="window_days doit être compris entre 1 et 3660")
+    if from_date and to_date and from_date > to_date:
+        raise HTTPException(status_code=400, detail="`from` doit précéder `to`")
+    start = datetime.datetime.combine(from_date, datetime.time()) if from_date else None
+    end = datetime.datetime.combine(to_date, datetime.time()) if to_date else None
+
+    # Événements encore en file : écrits avant le calcul pour des chiffres à jour
+    analytics_buffer.flush()
+
+    # Lecture des seuls rollups : temps constant, quel que soit l'historique de la table analytics
+    # (la clé primaire (bucket, event_type, target_id) sert de parcours d'intervalle sur la période)
+    daily = models.AnalyticsDaily
+
+    def filtered(query, event: Optional[str] = event_type):
+        if start is not None:
+            query = query.filter(daily.bucket >= start)
+        if end is not None:
+            query = query.filter(daily.bucket <= end)
+        if event is not None:
+            query = query.filter(daily.event_type == event)
+        return query
+
     # Compter les occurrences par type d'événement
-    results = db.query(
-        models.Analytics.event_type, 
-        func.count(models.Analytics.id)
-    ).group_by(models.Analytics.event_type).all()
+    results = filtered(db.query(
+        daily.event_type,
+        func.sum(daily.events)
+    )).group_by(daily.event_type).all()
     
-    summary = {event: count for event, count in results}
+    summary = {event: int(count) for event, count in results}
     
-    # Nombre de visiteurs uniques (estimé par ip_hash)
-    unique_visitors = db.query(func.count(func.distinct(models.Analytics.ip_hash))).scalar()
+    # Nombre de visiteurs uniques sur la période : union des sketches HyperLogLog journaliers
+    visitors = analytics_rollup.unique_visitors(db.connection(), start, end)
+    unique_visitors = visitors.get(event_type or analytics_rollup.ALL_EVENTS, 0)
     
     # KPI des Projets vus :
-    project_views = db.query(
-        models.Analytics.target_id,
-        func.count(models.Analytics.id)
-    ).filter(models.Analytics.event_type == 'project_view') \
-     .group_by(models.Analytics.target_id).all()
+    project_stats = {}
+    if event_type in (None, 'project_view'):
+        project_views = filtered(db.query(
+            daily.target_id,
+            func.sum(daily.events)
+        ), 'project_view').filter(daily.target_id != analytics_rollup.NO_TARGET) \
+         .group_by(daily.target_id).all()
      
-    project_stats = {f"project_{pid}": count for pid, count in project_views if pid is not None}
+        project_stats = {f"project_{pid}": int(count) for pid, count in project_views}
+
+    # Visiteurs uniques des derniers jours : fusion des sketches HyperLogLog journaliers
+    since = datetime.datetime.utcnow() - datetime.timedelta(days=window_days - 1)
+    window = analytics_rollup.unique_visitors(db.connection(), since)
 
     return {
+        "range": {"from": from_date, "to": to_date, "event_type": event_type},
         "global": summary,
         "unique_visitors": unique_visitors,
-        "projects_views": project_stats
+        "projects_views": project_stats,
+        "window_unique_visitors": {
+            "days": window_days,
+            "since": analytics_rollup.day_bucket(since).date().isoformat(),
+            "visitors": window.pop(analytics_rollup.ALL_EVENTS),
+            "by_event_type": window,
+        },
     }
+
+# 3. État de la file d'écriture (Admin uniquement)
+@router.get("/buffer/stats", dependencies=[Depends(auth.get_current_admin_user)])
+def get_buffer_stats():
+    """
+    [Admin] Événements en attente, écrits, abandonnés (file pleine ou Oracle indisponible) et lots insérés.
+    """
+    return analytics_buffer.stats()
+
+# 4. Compaction des rollups (Admin uniquement)
+@router.post("/rollups/compact", dependencies=[Depends(auth.get_current_admin_user)])
+def compact_rollups(days: int = 2, full: bool = False):
+    """
+    [Admin] Recalcule les rollups des `days` derniers jours depuis la table analytics
+    (`full=true` : tout l'historique, à lancer une fois à la mise en place des rollups),
+    puis purge les compteurs horaires expirés. À planifier (ex: EventBridge quotidien) pour rattraper tout écart.
+    """
+    if days < 1:
+        raise HTTPException(status_code=400, detail="days doit être positif")
+    analytics_buffer.flush()
+    return analytics_rollup.compact(None if full else days)
@@ -4,7 +4,7 @@ from typing import List
 
 import models, schemas
 from database import get_db
-from services import s3_service
+from services import s3_service, rag_indexer
 from services.github_service import trigger_frontend_build
 from auth import get_current_admin_user
 
@@ -75,6 +75,8 @@ def create_project(project: schemas.ProjectCreate, background_tasks: BackgroundT
     
     # 🚀 Déclenche le Webhook GitHub Actions pour regénérer le site statique
     background_tasks.add_task(trigger_frontend_build)
+    # 🧠 Indexe le projet dans la base de connaissance du chatbot
+    background_tasks.add_task(rag_indexer.sync_project, db_project.id)
     
     return db_project
 
@@ -102,6 +104,8 @@ def update_project(
     
     # 🚀 Déclenche le Webhook GitHub Actions pour regénérer le site statique
     background_tasks.add_task(trigger_frontend_build)
+    # 🧠 Ré-embedde uniquement les chunks RAG dont le contenu a changé
+    background_tasks.add_task(rag_indexer.sync_project, project_id)
     
     return project
 
@@ -125,6 +129,8 @@ def delete_project(project_id: int, background_tasks: BackgroundTasks, db: Sessi
     
     # 🚀 Déclenche le Webhook GitHub Actions pour regénérer le site statique
     background_tasks.add_task(trigger_frontend_build)
+    # 🧠 Retire le projet de la base de connaissance du chatbot
+    background_tasks.add_task(rag_indexer.sync_project, project_id)
     
     return None
 
@@ -1,101 +1,463 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status, UploadFile, File
+from pydantic import ValidationError
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from slowapi.util import get_remote_address
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+import os
+import time
+from contextlib import aclosing
 
 import models, schemas, auth
 from database import get_db
-from services import bedrock_service
+from migrations import SUPPORTED_EMBEDDING_DIMENSIONS
+from services import bedrock_service, bedrock_async, vector_store, chunking, rag_ingest, context_builder, rag_indexer, chat_sessions, chat_stream, reembed
+from services.answer_cache import answer_cache, replay, ANSWER_CACHE_ENABLED
+from services.embedding_cache import embedding_cache
+from services.lexical_index import bm25_index, reciprocal_rank_fusion
+from services.model_router import claude_router
+from services.single_flight import chat_flights, FlightAbandoned
+from services.intent_classifier import intent_classifier, canned_answer, CHAT_LOCAL_CLASSIFIER, QUESTION
+from services.embedding_versions import EmbeddingVersion, active_version, configured_version
+from services.token_budget import (token_budget, BudgetExceeded, Reservation, estimate_chat_tokens,
+                                   CHAT_BUDGET_ENABLED, SYSTEM_PROMPT_TOKENS)
 
 router = APIRouter(
     prefix="/api/rag",
     tags=["RAG & AI Chatbot"]
 )
 
-# Nous devrons exécuter un ALTER TABLE manuellement sous Oracle 23ai pour ajouter la colonne VECTOR
-# car SQLAlchemy Standard n'a pas encore le type Vector natif complet multi-bases.
-# On la gère en SQL brut en cas de besoin.
+# La colonne `vector_data VECTOR(512)` (et ses variantes vector_data_256 / vector_data_1024)
+# n'est pas mappée dans models.RagPortfolio :
+# elle est ajoutée par migrations.py au démarrage et gérée en SQL brut (services/vector_store.py).
+
+# Les routes /ingest et /chat sont asynchrones : les appels Bedrock passent par le
+# client natif asyncio (services/bedrock_async.py) et les accès Oracle, synchrones,
+# par le threadpool. Un stream Claude en cours n'immobilise donc aucun thread.
 
 @router.post("/ingest")
-def ingest_knowledge(
+async def ingest_knowledge(
     source: str, 
     content: str, 
+    chunk_size: int = chunking.RAG_CHUNK_SIZE,
+    overlap: int = chunking.RAG_CHUNK_OVERLAP,
     db: Session = Depends(get_db),
     admin: models.User = Depends(auth.get_current_admin_user)
 ):
     """
     [Admin] Ajoute un bloc de texte (CV, Explication projet...) à la base de connaissance Oracle.
-    Ce texte est d'abord transformé en Vecteur par Amazon Titan (Bedrock).
+    Le texte est découpé en chunks (par section puis par phrase), chaque chunk est
+    transformé en Vecteur par Amazon Titan (Bedrock) puis inséré en une seule requête.
     """
     if len(content.strip()) < 10:
         raise HTTPException(status_code=400, detail="Contenu trop court.")
+    if chunk_size < 100 or not 0 <= overlap < chunk_size:
+        raise HTTPException(status_code=400, detail="Paramètres de découpage invalides.")
+
+    # 1. Découper le document en chunks
+    chunks = chunking.chunk_text(content, source, chunk_size, overlap)
+    if not chunks:
+        raise HTTPException(status_code=422, detail="Aucun contenu indexable dans le document.")
 
-    # 1. Générer l'embedding avec AWS Titan
+    # 2. Générer les embeddings avec AWS Titan (appels parallèles bornés), dans la version active
+    version = await run_in_threadpool(active_version, db)
     try:
-        embedding = bedrock_service.get_embedding(content)
+        embeddings = await rag_ingest.embed_texts_async([c["content"] for c in chunks], version=version)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur Bedrock API: {str(e)}")
 
-    # 2. Sauvegarder dans Oracle
-    # Comme la colonne "vector_data" nécessitera un type 'VECTOR', on gérera d'abord l'insertion standard,
-    # puis l'update vectoriel brut (ou on s'appuiera sur les JSON Arrays convertibles si c'est plus simple).
-    # Pour l'instant, stockons juste le texte si la colonne vectorielle n'est pas prête.
-    
-    db_item = models.RagPortfolio(source=source, content=content)
-    db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
-    
-    # 3. Requête SQL brute pour insérer le vecteur dans Oracle 23ai 
-    # (À activer UNIQUEMENT si la table possède bien "vector_data VECTOR(512)")
-    try:
-        # Example to show intent (Commented out until table structure is verified):
-        # sql = text("UPDATE rag_portfolio SET vector_data = :vector_str WHERE id = :id")
-        # db.execute(sql, {"vector_str": str(embedding), "id": db_item.id})
-        # db.commit()
-        pass 
-    except Exception as e:
-        print(f"Warning: Vector column missing or insert failed: {e}")
+    # 3. Sauvegarder dans Oracle (une ligne par chunk, texte + vecteur dans la même transaction)
+    def save():
+        ids = rag_ingest.insert_chunks(db, chunks, embeddings, version)
+        db.commit()
+        return ids
+    ids = await run_in_threadpool(save)
+
+    # Les réponses en cache ne reflètent plus la base de connaissance
+    answer_cache.clear()
 
     return {
         "status": "success", 
-        "message": f"Connaissance '{source}' indexée.", 
-        "id": db_item.id,
-        "embedding_preview": embedding[:5] # Show first 5 dimensions only
+        "message": f"Connaissance '{source}' indexée ({len(ids)} chunks).", 
+        "ids": ids,
     }
 
-@router.post("/chat")
-def ask_chatbot(question: str, db: Session = Depends(get_db)):
+# Recherche hybride vectorielle + lexicale (noms propres, certifications, outils)
+RAG_HYBRID_SEARCH = os.getenv("RAG_HYBRID_SEARCH", "true").lower() == "true"
+# Nombre de candidats pris dans chaque classement avant la fusion
+RAG_HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "10"))
+
+# Taille max d'un lot d'ingestion (documents par requête)
+RAG_BULK_MAX_DOCUMENTS = 500
+
+async def _bulk_ingest(documents: List[schemas.RagDocumentCreate], db: Session,
+                       statuses: List[schemas.RagDocumentStatus]) -> List[schemas.RagDocumentStatus]:
     """
-    Pose une question au Chatbot. Le système trouve le texte le plus pertinent 
-    en base (Recherche Vectorielle), puis laisse Claude répondre.
+    Découpe tous les documents, vectorise tous leurs chunks dans un seul pool borné,
+    puis insère les chunks des documents réussis en un seul executemany.
+    """
+    per_doc = [chunking.chunk_text(d.content, d.source) for d in documents]
+    all_chunks = [c for chunks in per_doc for c in chunks]
+    version = await run_in_threadpool(active_version, db)
+    results = await rag_ingest.embed_texts_async([c["content"] for c in all_chunks], return_exceptions=True,
+                                                 version=version)
+
+    doc_statuses: List[schemas.RagDocumentStatus] = []
+    kept_chunks, kept_embeddings, indexed = [], [], []
+    position = 0
+    for doc, chunks in zip(documents, per_doc):
+        doc_results = results[position:position + len(chunks)]
+        position += len(chunks)
+        if not chunks:
+            doc_statuses.append(schemas.RagDocumentStatus(source=doc.source, status="error",
+                                                          detail="Aucun contenu indexable dans le document."))
+            continue
+        error = next((r for r in doc_results if isinstance(r, BaseException)), None)
+        if error is not None:
+            doc_statuses.append(schemas.RagDocumentStatus(source=doc.source, status="error", detail=f"Erreur Bedrock API: {error}"))
+            continue
+        doc_statuses.append(schemas.RagDocumentStatus(source=doc.source, status="indexed", chunks=len(chunks)))
+        kept_chunks.extend(chunks)
+        kept_embeddings.extend(doc_results)
+        indexed.append(doc_statuses[-1])
+
+    def save():
+        ids = rag_ingest.insert_chunks(db, kept_chunks, kept_embeddings, version)
+        db.commit()
+        return ids
+    ids = await run_in_threadpool(save) if kept_chunks else []
+    if ids:
+        answer_cache.clear()
+
+    position = 0
+    for doc_status in indexed:
+        doc_status.ids = ids[position:position + doc_status.chunks]
+        position += doc_status.chunks
+    return statuses + doc_statuses
+
+@router.post("/ingest/bulk", response_model=List[schemas.RagDocumentStatus])
+async def ingest_knowledge_bulk(
+    documents: List[schemas.RagDocumentCreate],
+    db: Session = Depends(get_db),
+    admin: models.User = Depends(auth.get_current_admin_user)
+):
+    """
+    [Admin] Ingestion d'un lot de documents [{source, content}, ...] en une requête.
+    Retourne le statut de chaque document.
+    """
+    if len(documents) > RAG_BULK_MAX_DOCUMENTS:
+        raise HTTPException(status_code=400, detail=f"Maximum {RAG_BULK_MAX_DOCUMENTS} documents par lot.")
+    return await _bulk_ingest(documents, db, [])
+
+@router.post("/ingest/jsonl", response_model=List[schemas.RagDocumentStatus])
+async def ingest_knowledge_jsonl(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    admin: models.User = Depends(auth.get_current_admin_user)
+):
+    """
+    [Admin] Ingestion d'un fichier JSONL : une ligne {"source": ..., "content": ...} par document.
+    Les lignes invalides sont signalées sans bloquer le reste du lot.
+    """
+    try:
+        lines = (await file.read()).decode("utf-8").splitlines()
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Le fichier doit être encodé en UTF-8.")
+
+    documents, statuses = [], []
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            documents.append(schemas.RagDocumentCreate.model_validate_json(line))
+        except ValidationError as e:
+            statuses.append(schemas.RagDocumentStatus(
+                source=f"ligne {number}", status="error", detail=e.errors()[0]["msg"]
+            ))
+    if len(documents) > RAG_BULK_MAX_DOCUMENTS:
+        raise HTTPException(status_code=400, detail=f"Maximum {RAG_BULK_MAX_DOCUMENTS} documents par lot.")
+    return await _bulk_ingest(documents, db, statuses)
+
+def _retrieve(db: Session, question: str, q_embedding: List[float],
+              version: Optional[EmbeddingVersion] = None) -> List[Dict[str, Any]]:
+    """
+    Recherche hybride : les candidats vectoriels et lexicaux (BM25) sont fusionnés
+    par Reciprocal Rank Fusion, puis on garde les RAG_TOP_K meilleurs.
+    `version` : version d'embedding de la question (par défaut la version active).
+    """
+    k = vector_store.RAG_TOP_K
+    candidates = RAG_HYBRID_CANDIDATES if RAG_HYBRID_SEARCH else k
+    version = version or active_version(db)
+    try:
+        vector_hits = vector_store.search_similar(db, q_embedding, candidates, version)
+    except Exception as e:
+        print(f"Warning: Vector search unavailable, falling back to lexical/full context: {e}")
+        db.rollback()
+        vector_hits = None
+
+    lexical_hits = []
+    if RAG_HYBRID_SEARCH:
+        bm25_index.ensure_loaded(db, version.key)
+        lexical_hits = bm25_index.search(question, candidates)
+
+    if vector_hits is None:
+        if lexical_hits:
+            return lexical_hits[:k]
+        # Oracle sans support VECTOR : on retombe sur l'ancien comportement (toute la base)
+        rows = db.query(models.RagPortfolio).filter(models.RagPortfolio.embedding_version == version.key).all()
+        return [{"source": d.source, "content": d.content} for d in rows]
+    if not RAG_HYBRID_SEARCH:
+        return vector_hits
+    return reciprocal_rank_fusion([vector_hits, lexical_hits], k)
+
+def _chat_response(request: Optional[Request], upstream, sse: bool, headers: Dict[str, str],
+                   started: float, cached: bool = False) -> StreamingResponse:
+    """
+    Réponse du chatbot en texte brut (par défaut) ou en Server-Sent Events.
+    Dans les deux cas, le stream s'arrête dès que le client se déconnecte.
+    """
+    if sse:
+        return StreamingResponse(chat_stream.sse_stream(request, upstream, started, cached),
+                                 media_type="text/event-stream", headers={**headers, **chat_stream.SSE_HEADERS})
+    return StreamingResponse(chat_stream.text_stream(request, upstream, started, cached),
+                             media_type="text/plain", headers=headers)
+
+async def _answer_stream(question: str, session: chat_sessions.ChatSession, db: Session,
+                         reservation: Optional[Reservation] = None):
     """
-    # 1. Vectoriser la question
+    Prépare la réponse à une question : vectorisation, cache sémantique, recherche, contexte.
+    Retourne (flux de la réponse, réponse en cache, à garder dans l'historique).
+    Le prompt réellement envoyé à Claude est décompté de `reservation`.
+    """
+    history = session.history()
+
+    # 1. Vectoriser la question (même modèle / dimension que l'index actif)
+    version = await run_in_threadpool(active_version, db)
     try:
-        q_embedding = bedrock_service.get_embedding(question)
+        q_embedding = await bedrock_async.get_embedding_async(question, version)
     except Exception as e:
         raise HTTPException(status_code=500, detail="Erreur Bedrock d'analyse de la question.")
 
-    # 2. Chercher les documents Oracle les plus proches (Vector Similarity Search)
-    # En Oracle 23ai : SELECT content FROM rag_portfolio ORDER BY VECTOR_DISTANCE(vector_data, :query_vec) FETCH FIRST 3 ROWS ONLY;
-    
-    # Simuler le RAG si la fonction vectorielle Oracle n'est pas encore activée
-    # (On prendra tout le texte en brut comme contexte temporaire pour prouver que Claude répond).
-    docs = db.query(models.RagPortfolio).all()
-    context_str = "\n\n".join([f"[{d.source}] {d.content}" for d in docs])
+    # 2. Question déjà répondue (ou très proche) sur la même base de connaissance ?
+    # Une question de suivi dépend de la conversation : pas de cache dans ce cas.
+    kb_version = await run_in_threadpool(vector_store.knowledge_version, db)
+    use_answer_cache = ANSWER_CACHE_ENABLED and not history and not session.summary
+    if use_answer_cache:
+        cached_answer = answer_cache.lookup(q_embedding, kb_version)
+        if cached_answer is not None:
+            return chat_stream.iterate(replay(cached_answer)), True, True
+
+    # 3. Chercher les documents les plus proches (recherche vectorielle + BM25)
+    # Pour une question de suivi ("et ses certifications ?"), le BM25 s'appuie aussi sur la question précédente.
+    previous_question = session.last_user_message()
+    lexical_query = f"{previous_question}\n{question}" if previous_question else question
+    docs = await run_in_threadpool(_retrieve, db, lexical_query, q_embedding, version)
+    # 4. Assembler le contexte dans le budget de tokens (ordre de pertinence, sans doublons)
+    context_str = context_builder.build_context(docs)
     
     if not context_str:
         def empty_stream():
             yield "Je suis l'assistant de Berthoni. La base de connaissances est actuellement vide, je ne peux pas encore répondre à vos questions sur son profil !"
-        return StreamingResponse(empty_stream(), media_type="text/plain")
+        return chat_stream.iterate(empty_stream()), False, False
+
+    # 5. Interroger Claude en streaming (la réponse complète alimente le cache sémantique)
+    if reservation is not None:
+        reservation.input_tokens = SYSTEM_PROMPT_TOKENS + context_builder.estimate_tokens(context_str) \
+            + session.history_tokens() + context_builder.estimate_tokens(question)
+
+    async def stream_generator():
+        parts = []
+        # Client déconnecté : le relais ferme ce générateur, qui ferme à son tour le stream Bedrock
+        async with aclosing(bedrock_async.ask_claude_stream_async(
+            prompt=question, context=context_str, history=history, summary=session.summary
+        )) as chunks:
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+        answer = "".join(parts)
+        if use_answer_cache and not answer.endswith(bedrock_service.STREAM_ERROR_MESSAGE):
+            answer_cache.store(q_embedding, answer, kb_version)
+
+    return stream_generator(), False, True
+
+async def _with_history(session: chat_sessions.ChatSession, question: str, upstream, remember: bool):
+    """
+    Relaie la réponse puis l'ajoute à l'historique de la session (si elle est allée au bout).
+    """
+    parts = []
+    async with aclosing(upstream) as chunks:
+        async for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+    answer = "".join(parts)
+    if not remember or answer.endswith(bedrock_service.STREAM_ERROR_MESSAGE):
+        return
+    # Historique borné : au-delà du budget, les anciens échanges sont résumés
+    await run_in_threadpool(chat_sessions.chat_sessions.record, session, question, answer)
+    await run_in_threadpool(chat_sessions.chat_sessions.compact, session,
+                            bedrock_service.summarize_conversation)
 
-    # 3. Interroger Claude en streaming
+async def _metered(upstream, reservation: Optional[Reservation]):
+    """
+    Décompte les tokens de la réponse, puis rend au client la part non consommée de sa réservation.
+    Une réponse qui n'est pas venue de Claude (cache, base vide) ne coûte rien.
+    """
     try:
-        def stream_generator():
-            for chunk in bedrock_service.ask_claude_stream(prompt=question, context=context_str):
+        async with aclosing(upstream) as chunks:
+            async for chunk in chunks:
+                if reservation is not None and reservation.input_tokens:
+                    reservation.output_tokens += context_builder.estimate_tokens(chunk)
                 yield chunk
+    finally:
+        if reservation is not None:
+            reservation.settle()
 
-        return StreamingResponse(stream_generator(), media_type="text/plain")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Erreur du LLM Claude.")
+async def _reserve_budget(request: Optional[Request], question: str,
+                          session: chat_sessions.ChatSession) -> Optional[Reservation]:
+    """
+    Réserve le coût maximal de la question sur le budget du client (IP) et le plafond du jour.
+    Hors budget : 429 immédiat, avant tout appel Bedrock.
+    """
+    if not CHAT_BUDGET_ENABLED:
+        return None
+    client = get_remote_address(request) if request is not None else "local"
+    estimate = estimate_chat_tokens(question, session.history(), session.summary)
+    try:
+        return await run_in_threadpool(token_budget.reserve, client, estimate)
+    except BudgetExceeded as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=e.detail,
+                            headers={"Retry-After": str(e.retry_after)})
+
+@router.post("/chat")
+async def ask_chatbot(request: Request, question: str, session_id: Optional[str] = None, sse: bool = False,
+                      db: Session = Depends(get_db)):
+    """
+    Pose une question au Chatbot. Le système trouve le texte le plus pertinent 
+    en base (Recherche Vectorielle), puis laisse Claude répondre.
+    `session_id` (renvoyé dans l'en-tête X-Chat-Session) permet les questions de suivi :
+    l'historique de la conversation est conservé côté serveur.
+    `sse=true` (ou `Accept: text/event-stream`) renvoie la réponse en Server-Sent Events.
+    """
+    started = time.perf_counter()
+    sse = sse or (request is not None and "text/event-stream" in request.headers.get("accept", ""))
+    if session_id is not None and not chat_sessions.is_valid_session_id(session_id):
+        raise HTTPException(status_code=400, detail="Identifiant de session invalide.")
+    session = await run_in_threadpool(chat_sessions.chat_sessions.get, session_id or chat_sessions.new_session_id())
+    session_headers = {"X-Chat-Session": session.session_id}
+
+    # Charabia et politesses : réponse toute faite, sans appel Titan ni Claude
+    if CHAT_LOCAL_CLASSIFIER:
+        intent = intent_classifier.classify(question)
+        if intent != QUESTION:
+            return _chat_response(request, chat_stream.iterate(replay(canned_answer(intent))), sse,
+                                  session_headers, started, cached=True)
+
+    # Question de suivi : la réponse dépend de la conversation, elle n'est pas partagée.
+    # Budget de tokens du client et plafond quotidien : refus immédiat, avant Titan et Claude
+    if session.turns or session.summary:
+        reservation = await _reserve_budget(request, question, session)
+        try:
+            upstream, cached, remember = await _answer_stream(question, session, db, reservation)
+        except BaseException:
+            if reservation is not None:
+                reservation.settle()
+            raise
+        return _chat_response(request, _with_history(session, question, _metered(upstream, reservation), remember),
+                              sse, session_headers, started, cached)
+
+    # Première question : les visiteurs qui posent la même question au même moment
+    # partagent un seul appel Titan et un seul stream Claude (single-flight).
+    # Seul le leader réserve du budget et une place de génération : les autres ne coûtent rien.
+    kb_version = await run_in_threadpool(vector_store.knowledge_version, db)
+    while True:
+        flight, leader = chat_flights.join(question, kb_version)
+        if not leader:
+            try:
+                await flight.wait_started()
+            except FlightAbandoned:
+                # Leader refusé sur son propre budget : la question est reprise par un des abonnés
+                continue
+            break
+        try:
+            reservation = await _reserve_budget(request, question, session)
+        except HTTPException:
+            flight.fail(FlightAbandoned())
+            raise
+        try:
+            upstream, cached, remember = await _answer_stream(question, session, db, reservation)
+        except HTTPException as e:
+            flight.fail(e)
+            if reservation is not None:
+                reservation.settle()
+            raise
+        except BaseException:
+            flight.fail(HTTPException(status_code=500, detail="Erreur du LLM Claude."))
+            if reservation is not None:
+                reservation.settle()
+            raise
+        flight.start(_metered(upstream, reservation), cached, remember)
+        break
+    return _chat_response(request, _with_history(session, question, flight.subscribe(), flight.remember), sse,
+                          session_headers, started, flight.cached)
+
+@router.post("/reindex/projects", dependencies=[Depends(auth.get_current_admin_user)])
+def reindex_projects():
+    """
+    [Admin] Synchronise la base de connaissance avec la table projects.
+    Seuls les chunks modifiés sont ré-embeddés.
+    """
+    return rag_indexer.sync_all_projects()
+
+@router.post("/reembed", status_code=status.HTTP_202_ACCEPTED,
+             dependencies=[Depends(auth.get_current_admin_user)])
+def reembed_knowledge(background_tasks: BackgroundTasks, dimensions: Optional[int] = None,
+                      db: Session = Depends(get_db)):
+    """
+    [Admin] Ré-embedde en tâche de fond toute la base de connaissance dans la version configurée
+    (TITAN_EMBEDDING_MODEL, RAG_EMBEDDING_DIMENSIONS ou `dimensions`, TITAN_EMBEDDING_NORMALIZE).
+    Le chatbot continue d'utiliser la version active jusqu'à la bascule, faite en fin de job.
+    """
+    if dimensions is not None and dimensions not in SUPPORTED_EMBEDDING_DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"Dimensions supportées : {list(SUPPORTED_EMBEDDING_DIMENSIONS)}")
+    target = configured_version()
+    if dimensions is not None:
+        target = target._replace(dimensions=dimensions)
+    current = active_version(db)
+    if target == current:
+        return {"status": "active", "version": current.key}
+    background_tasks.add_task(reembed.reembed, target)
+    return {"status": "scheduled", "from": current.key, "to": target.key}
+
+@router.get("/embedding-versions", dependencies=[Depends(auth.get_current_admin_user)])
+def list_embedding_versions(db: Session = Depends(get_db)):
+    """
+    [Admin] Versions d'embedding connues (active, en construction, retirées) et nombre de chunks de chacune.
+    """
+    counts = dict(db.query(models.RagPortfolio.embedding_version, func.count(models.RagPortfolio.id))
+                    .group_by(models.RagPortfolio.embedding_version).all())
+    versions = db.query(models.RagEmbeddingVersion).order_by(models.RagEmbeddingVersion.created_at).all()
+    return [{"version": v.version, "status": v.status, "chunks": counts.get(v.version, 0),
+             "created_at": v.created_at, "activated_at": v.activated_at} for v in versions]
+
+@router.get("/cache/stats", dependencies=[Depends(auth.get_current_admin_user)])
+def get_cache_stats():
+    """
+    [Admin] Compteurs hit/miss du cache d'embeddings Titan et du cache de réponses,
+    format et taille de l'index vectoriel.
+    """
+    return {"embeddings": embedding_cache.stats(), "answers": answer_cache.stats(),
+            "vector_index": vector_store.index_stats()}
+
+@router.get("/chat/stats", dependencies=[Depends(auth.get_current_admin_user)])
+def get_chat_stats():
+    """
+    [Admin] Time-to-first-token et durée des derniers streams du chatbot (p50 / p95),
+    nombre de réponses terminées et interrompues par le visiteur, questions mutualisées (single-flight),
+    messages traités localement (charabia, politesses), dépense de tokens (budgets, plafond du jour)
+    et routes Claude (requêtes doublées, bascules, état des disjoncteurs).
+    """
+    return {**chat_stream.stream_metrics.stats(), "single_flight": chat_flights.stats(),
+            "local_intents": intent_classifier.stats(), "token_budget": token_budget.stats(),
+            "model_router": claude_router.stats()}
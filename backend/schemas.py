@@ -118,3 +118,22 @@ class Analytics(AnalyticsCreate):
 
     class Config:
         from_attributes = True
+
+
+# --- RAG (base de connaissance du chatbot) ---
+class RagDocumentCreate(BaseModel):
+    source: str = Field(..., min_length=1, max_length=100)
+    content: str = Field(..., min_length=10, max_length=200000)
+
+    @field_validator("source", "content", mode="before")
+    @classmethod
+    def strip_whitespace(cls, v):
+        # Longueurs vérifiées sans les espaces : un contenu vide ou blanc est refusé (422)
+        return v.strip() if isinstance(v, str) else v
+
+class RagDocumentStatus(BaseModel):
+    source: str
+    status: str                     # 'indexed' ou 'error'
+    chunks: int = 0
+    ids: List[int] = []
+    detail: Optional[str] = None
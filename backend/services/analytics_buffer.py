@@ -0,0 +1,197 @@
+import datetime
+import os
+import threading
+from typing import Dict, List, Any
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+
+import models
+from database import engine
+from services import analytics_rollup
+
+# Les événements analytics (pages vues, clics) ne sont plus écrits un par un : ils sont mis en file
+# en mémoire et un thread les insère par lots (un seul executemany, un seul commit),
+# dès que ANALYTICS_FLUSH_SIZE événements attendent ou au plus tard toutes les ANALYTICS_FLUSH_SECONDS.
+# File bornée : si Oracle ralentit, les nouveaux événements sont abandonnés (et comptés) plutôt que
+# de faire grossir la mémoire ou attendre les visiteurs.
+# Un lot refusé par Oracle pour ses données est coupé en deux jusqu'à isoler les événements fautifs
+# (abandonnés) ; un lot en échec de connexion est rejoué, au plus ANALYTICS_FLUSH_MAX_RETRIES fois.
+# Chaque lot met aussi à jour les rollups horaires et journaliers (services/analytics_rollup.py).
+ANALYTICS_BUFFER_ENABLED = os.getenv("ANALYTICS_BUFFER_ENABLED", "true").lower() == "true"
+ANALYTICS_FLUSH_SIZE = int(os.getenv("ANALYTICS_FLUSH_SIZE", "100"))
+ANALYTICS_FLUSH_SECONDS = float(os.getenv("ANALYTICS_FLUSH_SECONDS", "5"))
+ANALYTICS_BUFFER_MAX_EVENTS = int(os.getenv("ANALYTICS_BUFFER_MAX_EVENTS", "10000"))
+ANALYTICS_FLUSH_MAX_RETRIES = int(os.getenv("ANALYTICS_FLUSH_MAX_RETRIES", "10"))
+
+
+class _WriteInterrupted(Exception):
+    def __init__(self, remaining: List[Dict[str, Any]], rejected: int, error: Exception):
+        super().__init__(str(error))
+        self.remaining = remaining
+        self.rejected = rejected
+
+
+def _transient(error: Exception) -> bool:
+    # Connexion perdue, base indisponible, pool saturé, ou erreur inattendue hors base : lot rejoué tel quel.
+    # Les autres erreurs Oracle (valeur trop longue, contrainte...) viennent des données du lot.
+    if isinstance(error, (OperationalError, InterfaceError, PoolTimeoutError)):
+        return True
+    if isinstance(error, DBAPIError):
+        return error.connection_invalidated
+    return True
+
+
+class EventBuffer:
+    """
+    File d'événements en attente d'insertion dans la table analytics.
+    `flush` peut aussi être appelé directement (arrêt du serveur, fin d'invocation Lambda).
+    """
+
+    def __init__(self, flush_size: int = ANALYTICS_FLUSH_SIZE, flush_seconds: float = ANALYTICS_FLUSH_SECONDS,
+                 max_events: int = ANALYTICS_BUFFER_MAX_EVENTS, max_retries: int = ANALYTICS_FLUSH_MAX_RETRIES):
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self.max_events = max_events
+        self.max_retries = max_retries
+        self._pending: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()   # un seul lot en cours d'écriture à la fois
+        self._wake = threading.Event()
+        self._thread = None
+        self.accepted = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.rejected = 0
+        self._head_failures = 0             # échecs consécutifs du lot en tête de file
+
+    def _ensure_thread(self):
+        # Démarré au premier événement : les scripts qui importent l'application n'ont pas de thread en plus
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="analytics-flush", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+
+    def add_many(self, rows: List[Dict[str, Any]]) -> int:
+        """
+        Met des événements en file. Retourne le nombre accepté (les autres sont abandonnés : file pleine).
+        """
+        with self._lock:
+            room = max(self.max_events - len(self._pending), 0)
+            accepted = rows[:room]
+            self._pending.extend(accepted)
+            self.accepted += len(accepted)
+            self.dropped += len(rows) - len(accepted)
+            full = len(self._pending) >= self.flush_size
+            self._ensure_thread()
+        if len(accepted) < len(rows):
+            print(f"Warning: File analytics pleine, {len(rows) - len(accepted)} événement(s) abandonné(s)")
+        if full:
+            self._wake.set()
+        return len(accepted)
+
+    def add(self, row: Dict[str, Any]) -> bool:
+        return self.add_many([row]) == 1
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def write(self, rows: List[Dict[str, Any]]):
+        # Événements et rollups dans la même transaction. Appelé directement si ANALYTICS_BUFFER_ENABLED=false
+        with engine.begin() as conn:
+            conn.execute(insert(models.Analytics.__table__), rows)
+            analytics_rollup.apply(conn, rows)
+
+    def _write_isolating(self, batch: List[Dict[str, Any]]) -> int:
+        """
+        Écrit `batch`. Sur une erreur de données, le coupe en deux (chaque moitié dans sa transaction)
+        jusqu'à isoler les événements fautifs, qui sont abandonnés. Retourne le nombre d'événements rejetés.
+        Une erreur de connexion lève _WriteInterrupted avec les événements pas encore écrits.
+        """
+        rejected = 0
+        segments = [batch]
+        while segments:
+            segment = segments.pop()
+            try:
+                self.write(segment)
+            except Exception as e:
+                if _transient(e):
+                    raise _WriteInterrupted(segment + [row for rest in reversed(segments) for row in rest], rejected, e)
+                if len(segment) == 1:
+                    rejected += 1
+                    print(f"Warning: Événement analytics rejeté par Oracle ({segment[0].get('event_type')!r}) : {e}")
+                    continue
+                middle = len(segment) // 2
+                segments.extend((segment[middle:], segment[:middle]))
+        return rejected
+
+    def flush(self) -> int:
+        """
+        Insère tous les événements en attente, par lots de `flush_size`. Retourne le nombre écrit.
+        En cas d'erreur de connexion, le reste du lot est remis en tête de file (dans la limite de sa capacité),
+        et abandonné après `max_retries` échecs consécutifs.
+        """
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch, self._pending = self._pending[:self.flush_size], self._pending[self.flush_size:]
+                if not batch:
+                    return written
+                try:
+                    rejected = self._write_isolating(batch)
+                except _WriteInterrupted as e:
+                    remaining = e.remaining
+                    done = len(batch) - len(remaining) - e.rejected
+                    with self._lock:
+                        self.failed_batches += 1
+                        self.rejected += e.rejected
+                        self.written += done
+                        self._head_failures += 1
+                        if self._head_failures >= self.max_retries:
+                            print(f"Warning: Écriture analytics impossible après {self._head_failures} essais, "
+                                  f"{len(remaining)} événement(s) abandonné(s) : {e}")
+                            self._head_failures = 0
+                            self.dropped += len(remaining)
+                        else:
+                            print(f"Warning: Écriture analytics impossible ({len(remaining)} événement(s) en attente) : {e}")
+                            kept = remaining[:max(self.max_events - len(self._pending), 0)]
+                            self._pending[:0] = kept
+                            self.dropped += len(remaining) - len(kept)
+                    return written + done
+                with self._lock:
+                    self._head_failures = 0
+                    self.batches += 1
+                    self.rejected += rejected
+                    self.written += len(batch) - rejected
+                written += len(batch) - rejected
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": ANALYTICS_BUFFER_ENABLED,
+                "pending": len(self._pending),
+                "accepted": self.accepted,
+                "written": self.written,
+                "dropped": self.dropped,
+                "batches": self.batches,
+                "failed_batches": self.failed_batches,
+                "rejected": self.rejected,
+            }
+
+
+def event_row(event_type: str, target_id, ip_hash: str, user_agent: str) -> Dict[str, Any]:
+    # Horodatage à la réception (pas à l'insertion, qui peut avoir lieu plusieurs secondes après)
+    return {"event_type": event_type, "target_id": target_id, "ip_hash": ip_hash,
+            "user_agent": user_agent[:250], "created_at": datetime.datetime.utcnow()}
+
+
+analytics_buffer = EventBuffer()
@@ -0,0 +1,223 @@
+import datetime
+import os
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import bindparam, delete, insert, select, tuple_, update
+from sqlalchemy.engine import Connection
+
+import models
+from database import engine
+from services.hyperloglog import HyperLogLog, merged
+
+# Compteurs pré-agrégés des événements analytics, par heure et par jour UTC et par (event_type, target_id).
+# Ils sont mis à jour dans la même transaction que l'insertion de chaque lot (services/analytics_buffer.py) :
+# le dashboard ne lit plus que ces tables, sa latence ne dépend plus de l'historique de la table analytics.
+# Deux process qui créent la même ligne au même moment : le second lot échoue (clé primaire) et est
+# aussitôt rejoué par moitiés (services/analytics_buffer.py), qui ne font plus qu'un UPDATE.
+# Initialisation depuis l'historique et rattrapage : `compact` (POST /api/analytics/rollups/compact).
+# Visiteurs uniques : un sketch HyperLogLog par jour et par type d'événement, fusionnés à la lecture.
+# Les compteurs horaires plus anciens que ANALYTICS_HOURLY_RETENTION_DAYS sont supprimés par `compact`.
+ANALYTICS_HOURLY_RETENTION_DAYS = int(os.getenv("ANALYTICS_HOURLY_RETENTION_DAYS", "90"))
+
+NO_TARGET = 0          # target_id des événements sans cible (la clé primaire n'accepte pas NULL)
+ALL_EVENTS = "*"       # event_type du sketch de tous les événements du jour
+_IN_CHUNK = 500        # Oracle limite une liste IN à 1000 éléments
+_REBUILD_CHUNK = 5000
+
+_compacting = threading.Lock()
+
+
+def hour_bucket(moment: datetime.datetime) -> datetime.datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(moment: datetime.datetime) -> datetime.datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _key(bucket: datetime.datetime, row) -> tuple:
+    return bucket, row["event_type"], row["target_id"] or NO_TARGET
+
+
+def _add_counts(conn: Connection, table, counts: Counter):
+    """
+    Ajoute `counts` ({(bucket, event_type, target_id): n}) aux compteurs de `table` :
+    un SELECT des clés existantes, un UPDATE et un INSERT groupés (executemany).
+    """
+    if not counts:
+        return
+    keys = list(counts)
+    existing = set()
+    for start in range(0, len(keys), _IN_CHUNK):
+        chunk = keys[start:start + _IN_CHUNK]
+        existing.update(tuple(r) for r in conn.execute(
+            select(table.c.bucket, table.c.event_type, table.c.target_id)
+            .where(tuple_(table.c.bucket, table.c.event_type, table.c.target_id).in_(chunk))
+        ))
+    updates = [{"b_bucket": k[0], "b_event_type": k[1], "b_target_id": k[2], "b_events": counts[k]}
+               for k in keys if k in existing]
+    inserts = [{"bucket": k[0], "event_type": k[1], "target_id": k[2], "events": counts[k]}
+               for k in keys if k not in existing]
+    if updates:
+        conn.execute(
+            update(table).where(table.c.bucket == bindparam("b_bucket"),
+                                table.c.event_type == bindparam("b_event_type"),
+                                table.c.target_id == bindparam("b_target_id"))
+            .values(events=table.c.events + bindparam("b_events")),
+            updates,
+        )
+    if inserts:
+        conn.execute(insert(table), inserts)
+
+
+def _collect_visitor(sketches: Dict[tuple, HyperLogLog], created_at: datetime.datetime, row):
+    if not row["ip_hash"]:
+        return
+    day = day_bucket(created_at)
+    for event_type in (row["event_type"], ALL_EVENTS):
+        sketch = sketches.get((day, event_type))
+        if sketch is None:
+            sketch = sketches[(day, event_type)] = HyperLogLog()
+        sketch.add(row["ip_hash"])
+
+
+def _merge_sketches(conn: Connection, sketches: Dict[tuple, HyperLogLog]):
+    """
+    Fusionne les sketches du lot dans ceux de la base. Les lignes existantes sont verrouillées
+    (SELECT ... FOR UPDATE) : deux process ne peuvent pas écraser la fusion l'un de l'autre.
+    """
+    if not sketches:
+        return
+    table = models.AnalyticsDailyVisitors.__table__
+    keys = list(sketches)
+    existing = set()
+    for start in range(0, len(keys), _IN_CHUNK):
+        for bucket, event_type, data in conn.execute(
+            select(table.c.bucket, table.c.event_type, table.c.sketch)
+            .where(tuple_(table.c.bucket, table.c.event_type).in_(keys[start:start + _IN_CHUNK]))
+            .with_for_update()
+        ):
+            sketches[(bucket, event_type)].merge(HyperLogLog.from_bytes(data))
+            existing.add((bucket, event_type))
+    now = datetime.datetime.utcnow()
+    updates = [{"b_bucket": k[0], "b_event_type": k[1], "sketch": sketches[k].to_bytes(), "updated_at": now}
+               for k in keys if k in existing]
+    inserts = [{"bucket": k[0], "event_type": k[1], "sketch": sketches[k].to_bytes(), "updated_at": now}
+               for k in keys if k not in existing]
+    if updates:
+        conn.execute(
+            update(table).where(table.c.bucket == bindparam("b_bucket"), table.c.event_type == bindparam("b_event_type"))
+            .values(sketch=bindparam("sketch"), updated_at=bindparam("updated_at")),
+            updates,
+        )
+    if inserts:
+        conn.execute(insert(table), inserts)
+
+
+def apply(conn: Connection, rows: List[Dict[str, Any]]):
+    """
+    Reporte un lot d'événements (tels qu'insérés dans analytics) dans les rollups, sur la connexion
+    (et donc dans la transaction) de l'insertion.
+    """
+    hourly, daily, sketches = Counter(), Counter(), {}
+    for row in rows:
+        created_at = row["created_at"]
+        hourly[_key(hour_bucket(created_at), row)] += 1
+        daily[_key(day_bucket(created_at), row)] += 1
+        _collect_visitor(sketches, created_at, row)
+    _add_counts(conn, models.AnalyticsHourly.__table__, hourly)
+    _add_counts(conn, models.AnalyticsDaily.__table__, daily)
+    _merge_sketches(conn, sketches)
+
+
+def rebuild(since: Optional[datetime.datetime] = None) -> Dict[str, int]:
+    """
+    Recalcule les rollups depuis la table analytics (tout l'historique, ou à partir du jour de `since`).
+    Sert à l'initialisation des rollups et à la compaction (POST /api/analytics/rollups/compact).
+    """
+    raw = models.Analytics.__table__
+    start = day_bucket(since) if since else None
+    hourly, daily, sketches, events = Counter(), Counter(), {}, 0
+    query = select(raw.c.created_at, raw.c.event_type, raw.c.target_id, raw.c.ip_hash) \
+        .where(raw.c.created_at.is_not(None))
+    if start is not None:
+        query = query.where(raw.c.created_at >= start)
+
+    with engine.begin() as conn:
+        # Lecture en flux : seuls les compteurs restent en mémoire
+        for row in conn.execution_options(yield_per=_REBUILD_CHUNK).execute(query).mappings():
+            events += 1
+            hourly[_key(hour_bucket(row["created_at"]), row)] += 1
+            daily[_key(day_bucket(row["created_at"]), row)] += 1
+            _collect_visitor(sketches, row["created_at"], row)
+
+        for table, counts in ((models.AnalyticsHourly.__table__, hourly), (models.AnalyticsDaily.__table__, daily)):
+            conn.execute(delete(table) if start is None else delete(table).where(table.c.bucket >= start))
+            if counts:
+                conn.execute(insert(table), [{"bucket": k[0], "event_type": k[1], "target_id": k[2], "events": n}
+                                             for k, n in counts.items()])
+        day_sketches = models.AnalyticsDailyVisitors.__table__
+        conn.execute(delete(day_sketches) if start is None else delete(day_sketches).where(day_sketches.c.bucket >= start))
+        if sketches:
+            conn.execute(insert(day_sketches), [{"bucket": k[0], "event_type": k[1], "sketch": s.to_bytes(),
+                                                 "updated_at": datetime.datetime.utcnow()} for k, s in sketches.items()])
+    return {"events": events, "hourly_rows": len(hourly), "daily_rows": len(daily),
+            "visitor_sketches": len(sketches)}
+
+
+def purge_hourly(retention_days: int = ANALYTICS_HOURLY_RETENTION_DAYS) -> int:
+    """
+    Supprime les compteurs horaires trop anciens (les compteurs journaliers sont conservés).
+    """
+    table = models.AnalyticsHourly.__table__
+    limit = day_bucket(datetime.datetime.utcnow() - datetime.timedelta(days=retention_days))
+    with engine.begin() as conn:
+        return conn.execute(delete(table).where(table.c.bucket < limit)).rowcount
+
+
+def compact(days: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Job de compaction : recalcule les rollups des `days` derniers jours (tous si None : initialisation
+    depuis l'historique) pour rattraper un écart éventuel, puis purge les compteurs horaires expirés.
+    Une seule compaction à la fois par process.
+    """
+    if not _compacting.acquire(blocking=False):
+        return {"error": "Une compaction des rollups est déjà en cours"}
+    try:
+        since = datetime.datetime.utcnow() - datetime.timedelta(days=days) if days is not None else None
+        result = rebuild(since)
+        result["hourly_rows_purged"] = purge_hourly()
+        return result
+    finally:
+        _compacting.release()
+
+
+def unique_visitors(conn: Connection, start: Optional[datetime.datetime],
+                    end: Optional[datetime.datetime] = None) -> Dict[str, int]:
+    """
+    Visiteurs uniques estimés (±1 %) du jour de `start` au jour de `end` inclus (bornes facultatives),
+    au total ("*") et par type d'événement : fusion des sketches journaliers, sans lire la table analytics.
+    """
+    table = models.AnalyticsDailyVisitors.__table__
+    query = select(table.c.event_type, table.c.sketch)
+    if start is not None:
+        query = query.where(table.c.bucket >= day_bucket(start))
+    if end is not None:
+        query = query.where(table.c.bucket <= day_bucket(end))
+    by_type: Dict[str, List[bytes]] = {}
+    for event_type, data in conn.execute(query):
+        by_type.setdefault(event_type, []).append(data)
+    counts = {event_type: merged(sketches).count() for event_type, sketches in by_type.items()}
+    counts.setdefault(ALL_EVENTS, 0)
+    return counts
+
+
+def needs_backfill() -> bool:
+    # Rollups vides alors que la table analytics a déjà un historique (premier démarrage avec les rollups)
+    with engine.connect() as conn:
+        has_rollups = conn.execute(select(models.AnalyticsDaily.__table__.c.bucket).limit(1)).first() is not None \
+            and conn.execute(select(models.AnalyticsDailyVisitors.__table__.c.bucket).limit(1)).first() is not None
+        has_events = conn.execute(select(models.Analytics.__table__.c.id).limit(1)).first() is not None
+    return has_events and not has_rollups
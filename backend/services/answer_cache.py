@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+
+# Cache sémantique des réponses du chatbot : une question suffisamment proche
+# (similarité cosinus des embeddings) d'une question déjà répondue, sur la même
+# version de la base de connaissance, reçoit la réponse déjà générée.
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "256"))
+
+# Taille des morceaux lors du rejeu d'une réponse en streaming
+REPLAY_CHUNK_CHARS = 32
+
+
+class AnswerCache:
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, ttl: int = ANSWER_CACHE_TTL_SECONDS,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._vectors: List[np.ndarray] = []
+        self._answers: List[str] = []
+        self._versions: List[int] = []
+        self._expires: List[float] = []
+        self.hits = 0
+        self.misses = 0
+
+    def _purge(self, kb_version: int):
+        # Entrées expirées ou calculées sur une ancienne version de la base de connaissance
+        now = time.time()
+        keep = [i for i in range(len(self._answers))
+                if self._expires[i] > now and self._versions[i] == kb_version]
+        if len(keep) != len(self._answers):
+            self._vectors = [self._vectors[i] for i in keep]
+            self._answers = [self._answers[i] for i in keep]
+            self._versions = [self._versions[i] for i in keep]
+            self._expires = [self._expires[i] for i in keep]
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding: List[float], kb_version: int) -> Optional[str]:
+        query = self._normalize(embedding)
+        with self._lock:
+            self._purge(kb_version)
+            if self._answers:
+                scores = np.stack(self._vectors) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.hits += 1
+                    return self._answers[best]
+            self.misses += 1
+            return None
+
+    def store(self, embedding: List[float], answer: str, kb_version: int):
+        if not answer.strip():
+            return
+        with self._lock:
+            self._purge(kb_version)
+            if len(self._answers) >= self.max_entries:
+                # Éviction de l'entrée la plus proche de son expiration (la plus ancienne)
+                oldest = int(np.argmin(self._expires))
+                for values in (self._vectors, self._answers, self._versions, self._expires):
+                    del values[oldest]
+            self._vectors.append(self._normalize(embedding))
+            self._answers.append(answer)
+            self._versions.append(kb_version)
+            self._expires.append(time.time() + self.ttl)
+
+    def clear(self):
+        with self._lock:
+            self._vectors, self._answers, self._versions, self._expires = [], [], [], []
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._answers)}
+
+
+def replay(answer: str):
+    """
+    Rejoue une réponse en cache sous forme de flux, comme le ferait ask_claude_stream.
+    """
+    for i in range(0, len(answer), REPLAY_CHUNK_CHARS):
+        yield answer[i:i + REPLAY_CHUNK_CHARS]
+
+
+answer_cache = AnswerCache()
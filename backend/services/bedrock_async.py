@@ -0,0 +1,151 @@
+import asyncio
+import base64
+import json
+import os
+from contextlib import aclosing
+from typing import List, AsyncIterator, Optional
+from urllib.parse import quote
+
+import boto3
+import httpx
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.eventstream import EventStreamBuffer
+from starlette.concurrency import run_in_threadpool
+
+from services import bedrock_service
+from services.embedding_cache import embedding_cache
+from services.embedding_versions import EmbeddingVersion, configured_version
+from services.model_router import Route, NoRouteAvailable, claude_router
+
+# Client Bedrock natif asyncio : requêtes signées SigV4 envoyées avec httpx.AsyncClient.
+# Un stream Claude n'occupe ainsi aucun thread (ni ceux d'AnyIO, ni ceux de boto3) :
+# un seul worker uvicorn peut tenir des centaines de conversations en parallèle.
+region = bedrock_service.region
+BEDROCK_ENDPOINT = os.getenv("BEDROCK_ENDPOINT", f"https://bedrock-runtime.{region}.amazonaws.com")
+BEDROCK_MAX_CONCURRENCY = int(os.getenv("BEDROCK_MAX_CONCURRENCY", "200"))
+BEDROCK_TIMEOUT_SECONDS = float(os.getenv("BEDROCK_TIMEOUT_SECONDS", "60"))
+
+_session = boto3.Session()
+_clients = {}
+_semaphores = {}
+# Transport httpx de remplacement (ex: faux Bedrock local de benchmarks/fake_bedrock.py)
+_transport: Optional[httpx.AsyncBaseTransport] = None
+
+
+class BedrockStreamError(Exception):
+    pass
+
+
+def _client() -> httpx.AsyncClient:
+    # Un client (et son pool de connexions) par boucle d'événements : sous Lambda,
+    # Mangum peut exécuter les invocations successives sur des boucles différentes.
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            transport=_transport,
+            timeout=httpx.Timeout(BEDROCK_TIMEOUT_SECONDS, connect=5.0),
+            limits=httpx.Limits(max_connections=BEDROCK_MAX_CONCURRENCY),
+        )
+        _clients[loop] = client
+        _semaphores[loop] = asyncio.Semaphore(BEDROCK_MAX_CONCURRENCY)
+    return client
+
+
+def _signed_headers(url: str, body: str, accept: str, signing_region: str = region) -> dict:
+    request = AWSRequest(method="POST", url=url, data=body.encode("utf-8"), headers={
+        "Content-Type": "application/json",
+        "Accept": accept,
+    })
+    SigV4Auth(_session.get_credentials(), "bedrock", signing_region).add_auth(request)
+    return dict(request.headers.items())
+
+
+def _endpoint(target_region: str) -> str:
+    # BEDROCK_ENDPOINT ne vaut que pour la région principale (les routes de secours ont la leur)
+    return BEDROCK_ENDPOINT if target_region == region else f"https://bedrock-runtime.{target_region}.amazonaws.com"
+
+
+def _model_url(model_id: str, action: str, target_region: str = region) -> str:
+    return f"{_endpoint(target_region)}/model/{quote(model_id, safe='')}/{action}"
+
+
+async def _invoke(model_id: str, body: str) -> dict:
+    url = _model_url(model_id, "invoke")
+    headers = _signed_headers(url, body, "application/json")
+    client = _client()
+    async with _semaphores[asyncio.get_running_loop()]:
+        response = await client.post(url, content=body.encode("utf-8"), headers=headers)
+    response.raise_for_status()
+    return response.json()
+
+
+async def get_embedding_async(text: str, version: Optional[EmbeddingVersion] = None) -> List[float]:
+    """
+    Version asynchrone de bedrock_service.get_embedding (même cache, même modèle).
+    Le cache peut interroger Oracle : ces accès courts passent par le threadpool.
+    """
+    version = version or configured_version()
+    model, dims = version.cache_model, version.dimensions
+    cached = await run_in_threadpool(embedding_cache.get, model, dims, text)
+    if cached is not None:
+        return cached
+
+    response_body = await _invoke(version.model_id, bedrock_service.build_embedding_body(text, version))
+    embedding = response_body.get("embedding")
+    await run_in_threadpool(embedding_cache.put, model, dims, text, embedding)
+    return embedding
+
+
+def _decode_event(message) -> Optional[dict]:
+    headers = message.headers
+    if headers.get(":message-type") == "exception":
+        raise BedrockStreamError(f"{headers.get(':exception-type')}: {message.payload.decode()}")
+    if headers.get(":event-type") != "chunk":
+        return None
+    payload = json.loads(message.payload)
+    return json.loads(base64.b64decode(payload["bytes"]))
+
+
+async def _stream_claude(route: Route, body: str) -> AsyncIterator[str]:
+    """
+    Un stream Claude sur une route (modèle, région). Les erreurs remontent au routeur.
+    """
+    url = _model_url(route.model_id, "invoke-with-response-stream", route.region)
+    headers = _signed_headers(url, body, "application/vnd.amazon.eventstream", route.region)
+    client = _client()
+
+    async with _semaphores[asyncio.get_running_loop()]:
+        async with client.stream("POST", url, content=body.encode("utf-8"), headers=headers) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise BedrockStreamError(f"HTTP {response.status_code}: {response.text}")
+
+            buffer = EventStreamBuffer()
+            async for data in response.aiter_bytes():
+                buffer.add_data(data)
+                for message in buffer:
+                    chunk_obj = _decode_event(message)
+                    if chunk_obj and chunk_obj["type"] == "content_block_delta":
+                        yield chunk_obj["delta"]["text"]
+
+
+async def ask_claude_stream_async(prompt: str, context: str, history: Optional[List[dict]] = None,
+                                  summary: str = "") -> AsyncIterator[str]:
+    """
+    Version asynchrone de bedrock_service.ask_claude_stream : lit le flux
+    `application/vnd.amazon.eventstream` de Bedrock directement sur la boucle d'événements.
+    La requête passe par le routeur (services/model_router.py) : doublée sur une route de secours
+    si le premier token tarde, et jamais envoyée à une route dont le disjoncteur est ouvert.
+    """
+    body = bedrock_service.build_claude_body(prompt, context, history, summary)
+
+    try:
+        async with aclosing(claude_router.stream(lambda route: _stream_claude(route, body))) as chunks:
+            async for chunk in chunks:
+                yield chunk
+
+    except (httpx.HTTPError, BedrockStreamError, NoRouteAvailable) as e:
+        print(f"Error streaming Claude on Bedrock: {e}")
+        yield bedrock_service.STREAM_ERROR_MESSAGE
@@ -1,33 +1,62 @@
 import boto3
 import json
 import os
-from typing import List
+from typing import List, Optional
 from botocore.exceptions import ClientError
 
+from migrations import EMBEDDING_DIMENSIONS
+
 # Initialize AWS Bedrock clients
 # Ensure AWS credentials are set in environment variables or standard ~/.aws/credentials
 # Note: Bedrock service might be strictly available in certain regions (e.g. us-east-1, us-west-2, eu-central-1, eu-west-3)
 region = os.getenv("AWS_REGION", "eu-west-3") # Paris region or customize as needed
 bedrock_runtime = boto3.client(service_name='bedrock-runtime', region_name=region)
 
-TITAN_EMBEDDING_MODEL = "amazon.titan-embed-text-v2:0"
-CLAUDE_CHAT_MODEL = "anthropic.claude-3-haiku-20240307-v1:0"
+# Changing the model, the size or the normalization creates a new embedding version:
+# rows are re-embedded in the background (services/reembed.py) before the switch.
+TITAN_EMBEDDING_MODEL = os.getenv("TITAN_EMBEDDING_MODEL", "amazon.titan-embed-text-v2:0")
+TITAN_EMBEDDING_DIMENSIONS = EMBEDDING_DIMENSIONS # 256, 512 or 1024 (RAG_EMBEDDING_DIMENSIONS)
+TITAN_EMBEDDING_NORMALIZE = os.getenv("TITAN_EMBEDDING_NORMALIZE", "true").lower() == "true"
+CLAUDE_CHAT_MODEL = os.getenv("CLAUDE_CHAT_MODEL", "anthropic.claude-3-haiku-20240307-v1:0") # primary route (fallbacks: services/model_router.py)
+CLAUDE_MAX_TOKENS = 500 # output cap of a chatbot answer (also reserved by services/token_budget.py)
+
+STREAM_ERROR_MESSAGE = "Désolé, une erreur s'est produite lors de la génération de la réponse."
 
-def get_embedding(text: str) -> List[float]:
+def get_embedding(text: str, version=None) -> List[float]:
     """
     Generate vector embeddings using Amazon Titan Text Embeddings V2.
     Cost: Very low (~$0.02 per 1M tokens)
+    Results are cached (in-process LRU + Oracle table), so a text already embedded
+    never triggers a second Titan call.
+    `version` (services.embedding_versions.EmbeddingVersion) defaults to the configured
+    model / size / normalization; queries pass the active version of the index.
     """
+    from services.embedding_cache import embedding_cache
+    from services.embedding_versions import configured_version
+
+    version = version or configured_version()
+    cached = embedding_cache.get(version.cache_model, version.dimensions, text)
+    if cached is not None:
+        return cached
+
+    embedding = _invoke_titan_embedding(text, version)
+    embedding_cache.put(version.cache_model, version.dimensions, text, embedding)
+    return embedding
+
+def build_embedding_body(text: str, version=None) -> str:
+    return json.dumps({
+        "inputText": text,
+        "dimensions": version.dimensions if version else TITAN_EMBEDDING_DIMENSIONS,
+        "normalize": version.normalize if version else TITAN_EMBEDDING_NORMALIZE
+    })
+
+def _invoke_titan_embedding(text: str, version=None) -> List[float]:
     try:
-        body = json.dumps({
-            "inputText": text,
-            "dimensions": 512, # 512 is standard for Titan v2, can be 256 or 1024
-            "normalize": True
-        })
+        body = build_embedding_body(text, version)
         
         response = bedrock_runtime.invoke_model(
             body=body,
-            modelId=TITAN_EMBEDDING_MODEL,
+            modelId=version.model_id if version else TITAN_EMBEDDING_MODEL,
             accept='application/json',
             contentType='application/json'
         )
@@ -39,11 +68,16 @@ def get_embedding(text: str) -> List[float]:
         print(f"Error calling Bedrock Embeddings: {e}")
         raise
 
-def ask_claude(prompt: str, context: str) -> str:
+def build_system_prompt(context: str, summary: str = "") -> str:
     """
-    Send prompt + RAG context to Claude 3 Haiku for blazing fast, cheap generation.
+    System prompt shared by every Claude call, with the RAG context appended
+    (and the rolling summary of the conversation, if any).
+    The context is capped to RAG_CONTEXT_TOKEN_BUDGET so the prompt size has an upper bound.
     """
-    system_prompt = (
+    from services.context_builder import truncate_to_budget, RAG_CONTEXT_TOKEN_BUDGET
+
+    context = truncate_to_budget(context, RAG_CONTEXT_TOKEN_BUDGET)
+    return (
         "Tu es l'assistant personnel IA de Berthoni Passo sur son portfolio. "
         "Ton but est de répondre aux questions de manière ULTRA-CONCISE, naturelle et directe, comme dans un chat (WhatsApp/Slack). "
         "RÈGLES ABSOLUES DE FORMATAGE :\n"
@@ -56,24 +90,38 @@ def ask_claude(prompt: str, context: str) -> str:
         "- Valorise son expertise Data Analyst / Data Engineer et sa certification Microsoft Fabric Data Engineer Associate.\n"
         "- Tu as été conçu de A à Z par Berthoni lui-même, c'est ton créateur !\n"
         "- Ignore son passé d'agronome sauf question directe dessus.\n"
+        # Gardée même avec le classifieur local (services/intent_classifier.py), qui laisse passer
+        # dans le doute le charabia court qu'il ne sait pas distinguer d'un sigle
         "- Si l'utilisateur envoie du charabia, des caractères aléatoires ou un message sans sens (ex: 'efdsg', 'azerty', 'aaaa'), réponds simplement avec un sourire et invite-le à poser une vraie question sur Berthoni. Ne traite JAMAIS le charabia comme une vraie question.\n\n"
         f"CONTEXTE SUR BERTHONI:\n{context}"
+        + (f"\n\nRÉSUMÉ DE LA CONVERSATION JUSQU'ICI:\n{summary}" if summary else "")
     )
-    
+
+def build_claude_body(prompt: str, context: str, history: Optional[List[dict]] = None, summary: str = "") -> str:
+    """
+    JSON body of a Claude Messages request on Bedrock.
+    `history` holds the previous turns of the conversation ({"role", "content"}).
+    """
+    messages = [
+        {"role": turn["role"], "content": [{"type": "text", "text": turn["content"]}]}
+        for turn in (history or [])
+    ]
+    messages.append({"role": "user", "content": [{"type": "text", "text": prompt}]})
+    return json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": CLAUDE_MAX_TOKENS,
+        "system": build_system_prompt(context, summary),
+        "messages": messages,
+        "temperature": 0.3, # Low temperature for factual RAG responses
+        "top_p": 0.9,
+    })
+
+def ask_claude(prompt: str, context: str) -> str:
+    """
+    Send prompt + RAG context to Claude 3 Haiku for blazing fast, cheap generation.
+    """
     try:
-        body = json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 500,
-            "system": system_prompt,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [{"type": "text", "text": prompt}]
-                }
-            ],
-            "temperature": 0.3, # Low temperature for factual RAG responses
-            "top_p": 0.9,
-        })
+        body = build_claude_body(prompt, context)
 
         response = bedrock_runtime.invoke_model(
             body=body,
@@ -89,42 +137,13 @@ def ask_claude(prompt: str, context: str) -> str:
         print(f"Error calling Claude on Bedrock: {e}")
         raise
 
-def ask_claude_stream(prompt: str, context: str):
+def ask_claude_stream(prompt: str, context: str, history: Optional[List[dict]] = None, summary: str = ""):
     """
-    Send prompt + RAG context to Claude 3 Haiku using response stream.
+    Send prompt + RAG context (+ conversation history) to Claude 3 Haiku using response stream.
     Yields chunks of text as they arrive.
     """
-    system_prompt = (
-        "Tu es l'assistant personnel IA de Berthoni Passo sur son portfolio. "
-        "Ton but est de répondre aux questions de manière ULTRA-CONCISE, naturelle et directe, comme dans un chat (WhatsApp/Slack). "
-        "RÈGLES ABSOLUES DE FORMATAGE :\n"
-        "- Écris TOUJOURS ta réponse en UN SEUL PARAGRAPHE, fluide comme un vrai message.\n"
-        "- AUCUN RETOUR À LA LIGNE, JAMAIS.\n"
-        "- INTERDICTION STRICTE d'utiliser des listes de formatage, des puces (- ou *), ou d'énumérer point par point.\n"
-        "- 1 à 3 phrases MAXIMUM au total.\n"
-        "- Pas d'introduction bateau type 'Voici ce qu'il peut faire...'. Donne juste la réponse directement.\n\n"
-        "RÈGLES DE CONTENU :\n"
-        "- Valorise son expertise Data Analyst / Data Engineer et sa certification Microsoft Fabric Data Engineer Associate.\n"
-        "- Tu as été conçu de A à Z par Berthoni lui-même, c'est ton créateur !\n"
-        "- Ignore son passé d'agronome sauf question directe dessus.\n"
-        "- Si l'utilisateur envoie du charabia, des caractères aléatoires ou un message sans sens (ex: 'efdsg', 'azerty', 'aaaa'), réponds simplement avec un sourire et invite-le à poser une vraie question sur Berthoni. Ne traite JAMAIS le charabia comme une vraie question.\n\n"
-        f"CONTEXTE SUR BERTHONI:\n{context}"
-    )
-
     try:
-        body = json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 500,
-            "system": system_prompt,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [{"type": "text", "text": prompt}]
-                }
-            ],
-            "temperature": 0.3,
-            "top_p": 0.9,
-        })
+        body = build_claude_body(prompt, context, history, summary)
 
         response = bedrock_runtime.invoke_model_with_response_stream(
             body=body,
@@ -134,14 +153,48 @@ def ask_claude_stream(prompt: str, context: str):
         )
 
         # Les chunks arrivent sous forme d'événements
-        for event in response.get('body'):
-            chunk = event.get('chunk')
-            if chunk:
-                # Décoder le JSON du chunk
-                chunk_obj = json.loads(chunk.get('bytes').decode())
-                if chunk_obj['type'] == 'content_block_delta':
-                    yield chunk_obj['delta']['text']
+        event_stream = response.get('body')
+        try:
+            for event in event_stream:
+                chunk = event.get('chunk')
+                if chunk:
+                    # Décoder le JSON du chunk
+                    chunk_obj = json.loads(chunk.get('bytes').decode())
+                    if chunk_obj['type'] == 'content_block_delta':
+                        yield chunk_obj['delta']['text']
+        finally:
+            # Générateur fermé avant la fin (client parti) : on coupe la connexion Bedrock
+            # au lieu de lire (et payer) la réponse jusqu'au bout
+            if hasattr(event_stream, 'close'):
+                event_stream.close()
 
     except ClientError as e:
         print(f"Error streaming Claude on Bedrock: {e}")
-        yield "Désolé, une erreur s'est produite lors de la génération de la réponse."
+        yield STREAM_ERROR_MESSAGE
+
+def summarize_conversation(previous_summary: str, turns: List[dict]) -> str:
+    """
+    Rolling summary: merges older chat turns into the existing conversation summary.
+    """
+    transcript = "\n".join(
+        f"{'Visiteur' if t['role'] == 'user' else 'Assistant'}: {t['content']}" for t in turns
+    )
+    prompt = (
+        "Mets à jour le résumé de cette conversation entre un visiteur et l'assistant du portfolio de Berthoni. "
+        "Garde uniquement les faits utiles pour répondre aux prochaines questions, en 3 phrases maximum.\n\n"
+        f"RÉSUMÉ ACTUEL:\n{previous_summary or '(vide)'}\n\nNOUVEAUX ÉCHANGES:\n{transcript}"
+    )
+    body = json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": 200,
+        "messages": [{"role": "user", "content": [{"type": "text", "text": prompt}]}],
+        "temperature": 0.0,
+    })
+    response = bedrock_runtime.invoke_model(
+        body=body,
+        modelId=CLAUDE_CHAT_MODEL,
+        accept='application/json',
+        contentType='application/json'
+    )
+    response_body = json.loads(response.get('body').read())
+    return response_body['content'][0]['text']
@@ -0,0 +1,143 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import List, Dict, Optional
+
+from sqlalchemy import select, delete, insert
+
+import models
+from database import engine
+from services.context_builder import estimate_tokens
+
+# Historique serveur des conversations du chatbot, par session
+CHAT_SESSION_MAX_TURNS = int(os.getenv("CHAT_SESSION_MAX_TURNS", "12"))        # messages conservés (ring buffer)
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "600"))  # au-delà : résumé glissant
+CHAT_SESSION_TTL_SECONDS = int(os.getenv("CHAT_SESSION_TTL_SECONDS", "1800"))
+CHAT_SESSION_MAX_SESSIONS = int(os.getenv("CHAT_SESSION_MAX_SESSIONS", "5000"))
+# Débordement optionnel vers Oracle (sessions partagées entre Lambdas / workers)
+CHAT_SESSION_ORACLE = os.getenv("CHAT_SESSION_ORACLE", "false").lower() == "true"
+# Nombre de messages récents toujours gardés tels quels lors d'un résumé
+KEEP_RECENT_MESSAGES = 4
+
+_SESSION_ID = re.compile(r"^[a-f0-9]{32}$")
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def is_valid_session_id(session_id: str) -> bool:
+    return bool(session_id and _SESSION_ID.match(session_id))
+
+
+class ChatSession:
+    __slots__ = ("session_id", "summary", "turns", "updated_at")
+
+    def __init__(self, session_id: str, summary: str = "", turns: Optional[List[Dict[str, str]]] = None):
+        self.session_id = session_id
+        self.summary = summary
+        self.turns = deque(turns or [], maxlen=CHAT_SESSION_MAX_TURNS)
+        self.updated_at = time.time()
+
+    def history(self) -> List[Dict[str, str]]:
+        return list(self.turns)
+
+    def history_tokens(self) -> int:
+        return estimate_tokens(self.summary) + sum(estimate_tokens(t["content"]) for t in self.turns)
+
+    def last_user_message(self) -> Optional[str]:
+        for turn in reversed(self.turns):
+            if turn["role"] == "user":
+                return turn["content"]
+        return None
+
+
+class ChatSessionStore:
+    def __init__(self):
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self):
+        now = time.time()
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if len(self._sessions) <= CHAT_SESSION_MAX_SESSIONS and now - oldest.updated_at < CHAT_SESSION_TTL_SECONDS:
+                break
+            self._sessions.popitem(last=False)
+
+    def get(self, session_id: str) -> ChatSession:
+        """
+        Session existante (mémoire, puis Oracle si activé) ou nouvelle session vide.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                return session
+        if CHAT_SESSION_ORACLE:
+            session = self._load(session_id)
+        if session is None:
+            session = ChatSession(session_id)
+        with self._lock:
+            self._sessions[session_id] = session
+            self._evict()
+        return session
+
+    def record(self, session: ChatSession, question: str, answer: str):
+        session.turns.append({"role": "user", "content": question})
+        session.turns.append({"role": "assistant", "content": answer})
+        session.updated_at = time.time()
+        if CHAT_SESSION_ORACLE:
+            self._save(session)
+
+    def compact(self, session: ChatSession, summarize):
+        """
+        Résumé glissant : si l'historique dépasse le budget, les messages les plus anciens
+        sont fondus dans le résumé (via `summarize(ancien_résumé, messages)`),
+        seuls les KEEP_RECENT_MESSAGES derniers restent tels quels.
+        """
+        if session.history_tokens() <= CHAT_HISTORY_TOKEN_BUDGET or len(session.turns) <= KEEP_RECENT_MESSAGES:
+            return
+        turns = list(session.turns)
+        older, recent = turns[:-KEEP_RECENT_MESSAGES], turns[-KEEP_RECENT_MESSAGES:]
+        try:
+            session.summary = summarize(session.summary, older)
+        except Exception as e:
+            # Sans résumé, on se contente d'oublier les messages les plus anciens
+            print(f"Warning: conversation summary failed: {e}")
+        session.turns = deque(recent, maxlen=CHAT_SESSION_MAX_TURNS)
+        if CHAT_SESSION_ORACLE:
+            self._save(session)
+
+    # --- Débordement Oracle ---
+    def _load(self, session_id: str) -> Optional[ChatSession]:
+        table = models.ChatSession.__table__
+        try:
+            with engine.connect() as conn:
+                row = conn.execute(select(table.c.summary, table.c.turns)
+                                   .where(table.c.session_id == session_id)).first()
+        except Exception as e:
+            print(f"Warning: chat session load failed: {e}")
+            return None
+        if row is None:
+            return None
+        return ChatSession(session_id, row.summary or "", json.loads(row.turns or "[]"))
+
+    def _save(self, session: ChatSession):
+        table = models.ChatSession.__table__
+        try:
+            with engine.begin() as conn:
+                conn.execute(delete(table).where(table.c.session_id == session.session_id))
+                conn.execute(insert(table).values(
+                    session_id=session.session_id, summary=session.summary,
+                    turns=json.dumps(session.history(), ensure_ascii=False),
+                ))
+        except Exception as e:
+            print(f"Warning: chat session save failed: {e}")
+
+
+chat_sessions = ChatSessionStore()
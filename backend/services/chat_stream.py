@@ -0,0 +1,169 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import aclosing, suppress
+from typing import AsyncIterator, Iterable, Optional
+
+# Relais des réponses du chatbot vers le navigateur :
+# - arrêt immédiat du stream Bedrock si le visiteur ferme le chatbot
+# - mode Server-Sent Events optionnel (heartbeats, petits deltas regroupés)
+# - mesure du time-to-first-token et de la durée totale de chaque réponse
+CHAT_DISCONNECT_POLL_SECONDS = float(os.getenv("CHAT_DISCONNECT_POLL_SECONDS", "0.5"))
+CHAT_SSE_HEARTBEAT_SECONDS = float(os.getenv("CHAT_SSE_HEARTBEAT_SECONDS", "15"))
+CHAT_SSE_COALESCE_MS = float(os.getenv("CHAT_SSE_COALESCE_MS", "50"))
+CHAT_SSE_COALESCE_CHARS = int(os.getenv("CHAT_SSE_COALESCE_CHARS", "64"))
+CHAT_METRICS_WINDOW = int(os.getenv("CHAT_METRICS_WINDOW", "500"))
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+_END = object()
+
+
+class StreamMetrics:
+    """
+    Fenêtre glissante des derniers streams : TTFT, durée totale et issue (terminé / annulé).
+    """
+
+    def __init__(self, window: int = CHAT_METRICS_WINDOW):
+        self._records = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.cancelled = 0
+
+    def record(self, ttft: Optional[float], duration: float, chars: int, cancelled: bool, cached: bool):
+        with self._lock:
+            self._records.append((ttft, duration, cached))
+            if cancelled:
+                self.cancelled += 1
+            else:
+                self.completed += 1
+        ttft_ms = f"{ttft * 1000:.0f}ms" if ttft is not None else "-"
+        print(f"Chat stream {'annulé' if cancelled else 'terminé'}{' (cache)' if cached else ''} : "
+              f"ttft={ttft_ms} durée={duration * 1000:.0f}ms {chars} caractères")
+
+    @staticmethod
+    def _percentile(values, p: float) -> Optional[float]:
+        if not values:
+            return None
+        ordered = sorted(values)
+        return round(ordered[min(int(p / 100 * len(ordered)), len(ordered) - 1)] * 1000, 1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            records = [r for r in self._records if not r[2]]
+            completed, cancelled = self.completed, self.cancelled
+        ttfts = [r[0] for r in records if r[0] is not None]
+        durations = [r[1] for r in records]
+        return {
+            "completed": completed,
+            "cancelled": cancelled,
+            "ttft_ms_p50": self._percentile(ttfts, 50),
+            "ttft_ms_p95": self._percentile(ttfts, 95),
+            "duration_ms_p50": self._percentile(durations, 50),
+            "duration_ms_p95": self._percentile(durations, 95),
+        }
+
+
+stream_metrics = StreamMetrics()
+
+
+async def iterate(chunks: Iterable[str]) -> AsyncIterator[str]:
+    # Adapte un générateur synchrone (réponse en cache, message fixe) au relais asynchrone
+    for chunk in chunks:
+        yield chunk
+
+
+async def _pump(upstream: AsyncIterator[str], queue: asyncio.Queue):
+    # Le stream Bedrock est entièrement consommé (et fermé) dans cette tâche :
+    # l'annuler ferme aussitôt la connexion HTTP vers Bedrock.
+    try:
+        async with aclosing(upstream) as chunks:
+            async for chunk in chunks:
+                await queue.put(chunk)
+    finally:
+        queue.put_nowait(_END)
+
+
+async def _relay(request, upstream: AsyncIterator[str], started: float, tick: float, cached: bool):
+    """
+    Produit les chunks de `upstream`, ou None toutes les `tick` secondes sans nouveau chunk.
+    Si le client se déconnecte, la génération est annulée et le relais s'arrête.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    producer = asyncio.ensure_future(_pump(upstream, queue))
+    getter = None
+    ttft, chars, cancelled = None, 0, True
+    last_check = time.perf_counter()
+    try:
+        while True:
+            getter = getter or asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=tick)
+            # Vérifié aussi pendant que les tokens arrivent : pas seulement quand Bedrock se tait
+            if request is not None and time.perf_counter() - last_check >= tick:
+                last_check = time.perf_counter()
+                if await request.is_disconnected():
+                    return
+            if not done:
+                yield None
+                continue
+            chunk, getter = getter.result(), None
+            if chunk is _END:
+                cancelled = False
+                return
+            if ttft is None and chunk:
+                ttft = time.perf_counter() - started
+            chars += len(chunk)
+            yield chunk
+    finally:
+        # Fin normale, déconnexion détectée ou annulation par le serveur ASGI
+        for task in (getter, producer):
+            if task is not None and not task.done():
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+        stream_metrics.record(ttft, time.perf_counter() - started, chars, cancelled, cached)
+
+
+async def text_stream(request, upstream: AsyncIterator[str], started: float, cached: bool = False):
+    """
+    Réponse texte brut (mode historique du chatbot), avec arrêt sur déconnexion.
+    """
+    async with aclosing(_relay(request, upstream, started, CHAT_DISCONNECT_POLL_SECONDS, cached)) as chunks:
+        async for chunk in chunks:
+            if chunk:
+                yield chunk
+
+
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def sse_stream(request, upstream: AsyncIterator[str], started: float, cached: bool = False):
+    """
+    Réponse en Server-Sent Events : les petits deltas sont regroupés (CHAT_SSE_COALESCE_MS /
+    CHAT_SSE_COALESCE_CHARS), un commentaire `: ping` part si rien n'a été envoyé depuis
+    CHAT_SSE_HEARTBEAT_SECONDS, et un événement `done` clôt le flux.
+    """
+    window = CHAT_SSE_COALESCE_MS / 1000
+    tick = min(window, CHAT_DISCONNECT_POLL_SECONDS) if window > 0 else CHAT_DISCONNECT_POLL_SECONDS
+    buffer, buffered_at = [], None
+    last_sent = time.perf_counter()
+    async with aclosing(_relay(request, upstream, started, tick, cached)) as chunks:
+        async for chunk in chunks:
+            now = time.perf_counter()
+            if chunk:
+                buffer.append(chunk)
+                buffered_at = buffered_at or now
+            if buffer and (now - buffered_at >= window or sum(map(len, buffer)) >= CHAT_SSE_COALESCE_CHARS):
+                yield _sse({"delta": "".join(buffer)})
+                buffer, buffered_at, last_sent = [], None, now
+            elif not buffer and now - last_sent >= CHAT_SSE_HEARTBEAT_SECONDS:
+                yield ": ping\n\n"
+                last_sent = now
+    if buffer:
+        yield _sse({"delta": "".join(buffer)})
+    yield _sse({"duration_ms": round((time.perf_counter() - started) * 1000)}, event="done")
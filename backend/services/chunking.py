@@ -0,0 +1,88 @@
+import hashlib
+import os
+import re
+from typing import List, Dict, Any
+
+# Taille cible d'un chunk et recouvrement entre chunks voisins (en caractères)
+RAG_CHUNK_SIZE = int(os.getenv("RAG_CHUNK_SIZE", "800"))
+RAG_CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "150"))
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _is_heading(line: str) -> bool:
+    # Titres de section du CV : lignes courtes entièrement en majuscules (ex: "FORMATIONS ET DIPLOMES")
+    letters = [c for c in line if c.isalpha()]
+    return 3 <= len(line) <= 80 and len(letters) >= 3 and all(c.isupper() for c in letters)
+
+
+def _split_sections(text: str) -> List[Dict[str, Any]]:
+    sections = [{"title": None, "lines": []}]
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        if _is_heading(line):
+            sections.append({"title": line, "lines": []})
+        else:
+            sections[-1]["lines"].append(line)
+    return [s for s in sections if s["lines"]]
+
+
+def _split_units(line: str, chunk_size: int) -> List[str]:
+    # Une ligne (puce, paragraphe) est l'unité de base ; trop longue, on la coupe en phrases
+    if len(line) <= chunk_size:
+        return [line]
+    units = []
+    for sentence in _SENTENCE_END.split(line):
+        while len(sentence) > chunk_size:
+            cut = sentence.rfind(" ", 0, chunk_size)
+            cut = cut if cut > 0 else chunk_size
+            units.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if sentence:
+            units.append(sentence)
+    return units
+
+
+def chunk_text(text: str, source: str, chunk_size: int = RAG_CHUNK_SIZE,
+               overlap: int = RAG_CHUNK_OVERLAP) -> List[Dict[str, Any]]:
+    """
+    Découpe un document en chunks par section puis par phrase.
+    Chaque chunk porte ses métadonnées : source, titre de section et position dans le document.
+    Le titre de section est répété en tête du chunk pour que l'embedding et Claude en aient le contexte.
+    """
+    chunks = []
+    for section in _split_sections(text):
+        title = section["title"]
+        header = f"{title}\n" if title else ""
+        budget = max(chunk_size - len(header), 1)
+
+        units = [u for line in section["lines"] for u in _split_units(line, budget)]
+        current: List[str] = []
+        length = 0
+        for unit in units:
+            if current and length + len(unit) + 1 > budget:
+                chunks.append({"source": source, "section": title, "content": header + "\n".join(current)})
+                # Recouvrement : on reprend les dernières unités tant qu'elles tiennent dans `overlap`
+                carried: List[str] = []
+                carried_len = 0
+                for previous in reversed(current):
+                    if carried_len + len(previous) + 1 > overlap:
+                        break
+                    carried.insert(0, previous)
+                    carried_len += len(previous) + 1
+                current, length = carried, carried_len
+            current.append(unit)
+            length += len(unit) + 1
+        if current:
+            chunks.append({"source": source, "section": title, "content": header + "\n".join(current)})
+
+    for i, chunk in enumerate(chunks):
+        chunk["chunk_index"] = i
+        chunk["content_hash"] = content_hash(chunk["content"])
+    return chunks
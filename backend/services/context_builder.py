@@ -0,0 +1,80 @@
+import os
+import re
+from typing import List, Dict, Any
+
+# Budget (en tokens estimés) du contexte RAG injecté dans le prompt système de Claude
+RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1200"))
+# Au-delà de cette similarité (Jaccard sur les trigrammes de mots), un passage est un doublon
+RAG_DUPLICATE_THRESHOLD = float(os.getenv("RAG_DUPLICATE_THRESHOLD", "0.8"))
+# En dessous de ce reste de budget, on n'essaie pas de tronquer un passage de plus
+MIN_PASSAGE_TOKENS = 40
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_WORD = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimation locale du nombre de tokens Claude, sans tokenizer :
+    un token par mot court ou signe de ponctuation, un de plus tous les 6 caractères d'un mot long.
+    """
+    return sum(1 + (len(t) - 1) // 6 for t in _TOKEN.findall(text))
+
+
+def _shingles(text: str) -> set:
+    words = [w.lower() for w in _WORD.findall(text)]
+    if len(words) < 3:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+def _is_duplicate(shingles: set, selected: List[set]) -> bool:
+    for other in selected:
+        union = len(shingles | other)
+        if union and len(shingles & other) / union >= RAG_DUPLICATE_THRESHOLD:
+            return True
+    return False
+
+
+def truncate_to_budget(text: str, budget: int) -> str:
+    """
+    Coupe un texte à la dernière fin de phrase qui tient dans le budget.
+    """
+    if estimate_tokens(text) <= budget:
+        return text
+    kept = []
+    used = 0
+    for sentence in _SENTENCE_END.split(text):
+        cost = estimate_tokens(sentence)
+        if used + cost > budget:
+            break
+        kept.append(sentence)
+        used += cost
+    return " ".join(kept)
+
+
+def build_context(docs: List[Dict[str, Any]], budget: int = RAG_CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Assemble le contexte RAG dans l'ordre de pertinence des documents, sans doublons,
+    jusqu'à épuisement du budget de tokens ; le dernier passage est tronqué en fin de phrase.
+    """
+    passages = []
+    selected: List[set] = []
+    remaining = budget
+    for doc in docs:
+        shingles = _shingles(doc["content"])
+        if _is_duplicate(shingles, selected):
+            continue
+        passage = f"[{doc['source']}] {doc['content']}"
+        cost = estimate_tokens(passage)
+        if cost > remaining:
+            if remaining >= MIN_PASSAGE_TOKENS:
+                truncated = truncate_to_budget(passage, remaining)
+                if truncated:
+                    passages.append(truncated)
+            break
+        passages.append(passage)
+        selected.append(shingles)
+        remaining -= cost
+    return "\n\n".join(passages)
@@ -0,0 +1,161 @@
+import array
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional
+from sqlalchemy import select, insert
+from sqlalchemy.exc import IntegrityError
+
+import models
+from database import engine
+
+# Cache des embeddings Titan à deux niveaux :
+# 1. LRU en mémoire du process, borné en octets
+# 2. Table Oracle `embedding_cache`, partagée entre les Lambdas et les workers EC2
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+EMBEDDING_CACHE_DB = os.getenv("EMBEDDING_CACHE_DB", "true").lower() == "true"
+_IN_CHUNK = 500        # Oracle limite une liste IN à 1000 éléments
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(model_id: str, dimensions: int, text: str) -> str:
+    payload = f"{model_id}\x1f{dimensions}\x1f{normalize_text(text)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, max_bytes: int = EMBEDDING_CACHE_MAX_BYTES, use_db: bool = EMBEDDING_CACHE_DB):
+        self.max_bytes = max_bytes
+        self.use_db = use_db
+        self._entries: "OrderedDict[str, array.array]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    # --- Niveau 1 : LRU mémoire ---
+    def _memory_get(self, key: str) -> Optional[array.array]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+            return vector
+
+    def _memory_put(self, key: str, vector: array.array):
+        size = vector.itemsize * len(vector)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = vector
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.itemsize * len(evicted)
+
+    # --- Niveau 2 : table Oracle ---
+    def _db_get(self, key: str) -> Optional[array.array]:
+        table = models.EmbeddingCache.__table__
+        with engine.connect() as conn:
+            blob = conn.execute(select(table.c.embedding).where(table.c.key_hash == key)).scalar()
+        if blob is None:
+            return None
+        vector = array.array("f")
+        vector.frombytes(blob)
+        return vector
+
+    def _db_put(self, key: str, model_id: str, dimensions: int, vector: array.array):
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert(models.EmbeddingCache.__table__).values(
+                    key_hash=key, model_id=model_id, dimensions=dimensions, embedding=vector.tobytes()
+                ))
+        except IntegrityError:
+            # Un autre worker a inséré la même clé entre-temps
+            pass
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, model_id: str, dimensions: int, text: str) -> Optional[List[float]]:
+        key = cache_key(model_id, dimensions, text)
+        vector = self._memory_get(key)
+        if vector is not None:
+            self._count("memory_hits")
+            return vector.tolist()
+        if self.use_db:
+            try:
+                vector = self._db_get(key)
+            except Exception as e:
+                print(f"Warning: embedding cache lookup failed: {e}")
+            if vector is not None:
+                self._count("db_hits")
+                self._memory_put(key, vector)
+                return vector.tolist()
+        self._count("misses")
+        return None
+
+    def get_many(self, model_id: str, dimensions: int, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Lecture groupée (reconstruction d'un index) : LRU mémoire, puis un SELECT ... IN
+        par tranche de clés sur la table Oracle. None à la place des textes jamais vectorisés.
+        """
+        keys = [cache_key(model_id, dimensions, t) for t in texts]
+        found = {}
+        for key in keys:
+            vector = self._memory_get(key)
+            if vector is not None:
+                found[key] = vector
+        memory_hits = len(found)
+        missing = list({k for k in keys if k not in found})
+        if self.use_db and missing:
+            table = models.EmbeddingCache.__table__
+            try:
+                with engine.connect() as conn:
+                    for start in range(0, len(missing), _IN_CHUNK):
+                        for key, blob in conn.execute(select(table.c.key_hash, table.c.embedding)
+                                                      .where(table.c.key_hash.in_(missing[start:start + _IN_CHUNK]))):
+                            vector = array.array("f")
+                            vector.frombytes(blob)
+                            found[key] = vector
+            except Exception as e:
+                print(f"Warning: embedding cache lookup failed: {e}")
+        with self._lock:
+            self.memory_hits += memory_hits
+            self.db_hits += len(found) - memory_hits
+            self.misses += len([k for k in keys if k not in found])
+        return [found[k].tolist() if k in found else None for k in keys]
+
+    def put(self, model_id: str, dimensions: int, text: str, embedding: List[float]):
+        key = cache_key(model_id, dimensions, text)
+        vector = array.array("f", embedding)
+        self._memory_put(key, vector)
+        if self.use_db:
+            try:
+                self._db_put(key, model_id, dimensions, vector)
+            except Exception as e:
+                print(f"Warning: embedding cache write failed: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.db_hits) / lookups, 3) if lookups else 0.0,
+            "entries": len(self._entries),
+            "memory_bytes": self._bytes,
+        }
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,217 @@
+import json
+import os
+import threading
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+from services import quantization as quant
+
+
+class EmbeddingIndex:
+    """
+    Index vectoriel en mémoire : tous les embeddings dans une seule matrice float32
+    contiguë (une ligne normalisée par chunk), le top-k se fait en un seul produit matriciel.
+    Si `path` est fourni, la matrice est persistée en .npy (chargée en memory-map)
+    et les métadonnées dans un fichier JSON voisin.
+    Avec `quantization` ("int8" ou "binary"), une copie compacte des vecteurs sert au scan
+    des candidats et seuls les `k * rescore_factor` meilleurs sont re-classés en float32 exact ;
+    une fois persistée, la matrice float32 n'est plus lue qu'à travers le memory-map.
+    """
+
+    def __init__(self, dimensions: int, path: Optional[str] = None, quantization: str = "none",
+                 rescore_factor: int = 10):
+        self.dimensions = dimensions
+        self.path = path
+        self.quantization = quantization if quantization in quant.QUANTIZATIONS else "none"
+        self.rescore_factor = max(rescore_factor, 1)
+        self._lock = threading.Lock()
+        self._matrix = np.empty((0, dimensions), dtype=np.float32)
+        self._codes = np.empty((0, quant.code_width(self.quantization, dimensions)),
+                               dtype=quant.code_dtype(self.quantization))
+        self._scales = np.empty(0, dtype=np.float32)
+        self._size = 0
+        self._ids: List[int] = []
+        self._sources: List[str] = []
+        self._contents: List[str] = []
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def ids(self) -> List[int]:
+        return list(self._ids)
+
+    @property
+    def quantized(self) -> bool:
+        return self.quantization != "none"
+
+    def memory_bytes(self) -> dict:
+        """
+        Octets occupés par l'index : codes compacts (en RAM) et matrice float32
+        (en RAM, ou seulement mappée depuis le fichier .npy).
+        """
+        matrix_bytes = self._size * self.dimensions * 4
+        resident = not isinstance(self._matrix, np.memmap)
+        return {
+            "quantization": self.quantization,
+            "vectors": self._size,
+            "scan_bytes": int(self._codes[:self._size].nbytes + self._scales[:self._size].nbytes)
+                          if self.quantized else matrix_bytes,
+            "float32_bytes": matrix_bytes,
+            "float32_in_ram": resident,
+        }
+
+    def _meta_path(self) -> str:
+        return os.path.splitext(self.path)[0] + ".meta.json"
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _reserve(self, extra: int):
+        # Croissance géométrique : la matrice reste contiguë et les ajouts sont amortis.
+        # Une matrice memory-mappée (lecture seule) est recopiée en RAM au premier ajout.
+        needed = self._size + extra
+        if needed <= self._matrix.shape[0] and not isinstance(self._matrix, np.memmap):
+            return
+        capacity = max(needed, 2 * self._matrix.shape[0], 16)
+        grown = np.empty((capacity, self.dimensions), dtype=np.float32)
+        grown[:self._size] = self._matrix[:self._size]
+        self._matrix = grown
+        if self.quantized:
+            codes = np.empty((capacity, self._codes.shape[1]), dtype=self._codes.dtype)
+            codes[:self._size] = self._codes[:self._size]
+            scales = np.empty(capacity, dtype=np.float32)
+            scales[:self._size] = self._scales[:self._size]
+            self._codes, self._scales = codes, scales
+
+    def add(self, doc_ids: List[int], sources: List[str], contents: List[str], embeddings: List[List[float]]):
+        """
+        Ajoute (ou remplace) des documents dans l'index.
+        """
+        if not doc_ids:
+            return
+        vectors = self._normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(doc_ids), self.dimensions))
+        with self._lock:
+            replaced = set(doc_ids) & set(self._ids)
+            if replaced:
+                self._drop(replaced)
+            self._reserve(len(doc_ids))
+            self._matrix[self._size:self._size + len(doc_ids)] = vectors
+            if self.quantized:
+                codes, scales = quant.encode(self.quantization, vectors)
+                self._codes[self._size:self._size + len(doc_ids)] = codes
+                self._scales[self._size:self._size + len(doc_ids)] = scales
+            self._size += len(doc_ids)
+            self._ids.extend(doc_ids)
+            self._sources.extend(sources)
+            self._contents.extend(contents)
+
+    def _drop(self, doc_ids: set):
+        keep = [i for i, doc_id in enumerate(self._ids) if doc_id not in doc_ids]
+        self._matrix = np.ascontiguousarray(self._matrix[keep], dtype=np.float32)
+        if self.quantized:
+            self._codes = np.ascontiguousarray(self._codes[keep])
+            self._scales = np.ascontiguousarray(self._scales[keep])
+        self._size = len(keep)
+        self._ids = [self._ids[i] for i in keep]
+        self._sources = [self._sources[i] for i in keep]
+        self._contents = [self._contents[i] for i in keep]
+
+    def remove(self, doc_ids: List[int]):
+        with self._lock:
+            self._drop(set(doc_ids))
+
+    def search(self, embedding: List[float], k: int) -> List[Dict[str, Any]]:
+        """
+        Top-k par similarité cosinus (produit scalaire sur vecteurs normalisés).
+        Index quantifié : scan sur les codes compacts, puis re-classement exact des candidats.
+        """
+        with self._lock:
+            matrix = self._matrix[:self._size]
+            codes, scales = self._codes[:self._size], self._scales[:self._size]
+            ids, sources, contents = self._ids, self._sources, self._contents
+        if not len(ids):
+            return []
+
+        query = self._normalize(np.asarray(embedding, dtype=np.float32))
+        k = min(k, len(ids))
+        candidates = min(k * self.rescore_factor, len(ids))
+        if self.quantized and candidates < len(ids):
+            approx = quant.scan(self.quantization, codes, scales, query)
+            rows = np.argpartition(-approx, candidates - 1)[:candidates]
+            rows.sort()  # lecture séquentielle du memory-map
+            exact = matrix[rows] @ query
+            top = np.argpartition(-exact, k - 1)[:k]
+            top = top[np.argsort(-exact[top])]
+            top, scores = rows[top], dict(zip(rows[top], exact[top]))
+            return [
+                {"id": ids[i], "source": sources[i], "content": contents[i], "score": float(scores[i])}
+                for i in top
+            ]
+
+        scores = matrix @ query
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {"id": ids[i], "source": sources[i], "content": contents[i], "score": float(scores[i])}
+            for i in top
+        ]
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            matrix = np.ascontiguousarray(self._matrix[:self._size])
+            meta = {"dimensions": self.dimensions, "ids": list(self._ids)}
+        # Écriture atomique : un lecteur ne voit jamais un fichier à moitié écrit
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, matrix)
+        os.replace(tmp_path, self.path)
+        with open(self._meta_path() + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(self._meta_path() + ".tmp", self._meta_path())
+        if self.quantized:
+            # Le scan se fait sur les codes : la matrice float32 peut quitter la RAM
+            # et n'être lue (via le memory-map) que pour re-classer les candidats
+            mapped = np.load(self.path, mmap_mode="r")
+            with self._lock:
+                if self._ids == meta["ids"]:
+                    self._matrix = mapped
+
+    def load_file(self):
+        """
+        Ouvre la matrice persistée en memory-map (sans copie).
+        Retourne (ids, matrice) ou ([], None) si le fichier est absent ou incompatible.
+        """
+        if not self.path or not os.path.exists(self.path) or not os.path.exists(self._meta_path()):
+            return [], None
+        with open(self._meta_path(), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        matrix = np.load(self.path, mmap_mode="r")
+        if meta.get("dimensions") != self.dimensions or matrix.shape[0] != len(meta["ids"]):
+            return [], None
+        return meta["ids"], matrix
+
+    def reset(self, doc_ids: List[int], sources: List[str], contents: List[str], vectors: np.ndarray,
+              normalized: bool = False):
+        """
+        Remplace tout le contenu de l'index (reconstruction complète).
+        Une matrice déjà normalisée (ex: memory-map du fichier .npy) est gardée telle quelle, sans copie.
+        """
+        if not normalized:
+            vectors = self._normalize(np.asarray(vectors, dtype=np.float32).reshape(len(doc_ids), self.dimensions))
+        if self.quantized:
+            codes, scales = quant.encode(self.quantization, vectors)
+        with self._lock:
+            self._matrix = vectors
+            if self.quantized:
+                self._codes, self._scales = codes, scales
+            self._size = len(doc_ids)
+            self._ids = list(doc_ids)
+            self._sources = list(sources)
+            self._contents = list(contents)
@@ -0,0 +1,133 @@
+import datetime
+import os
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from sqlalchemy.orm import Session
+
+import models
+
+# Chaque ligne de rag_portfolio porte la version de son embedding (modèle Titan, dimension,
+# normalisation). Une seule version est "active" à la fois : c'est elle que lisent les recherches.
+# Le job de ré-embedding (services/reembed.py) construit la version configurée à côté,
+# puis la bascule se fait en une transaction sur rag_embedding_versions.
+# Chaque process relit la version active au plus toutes les EMBEDDING_VERSION_REFRESH_SECONDS.
+EMBEDDING_VERSION_REFRESH_SECONDS = float(os.getenv("EMBEDDING_VERSION_REFRESH_SECONDS", "30"))
+
+
+class EmbeddingVersion(NamedTuple):
+    model_id: str
+    dimensions: int
+    normalize: bool = True
+
+    @property
+    def key(self) -> str:
+        return f"{self.model_id}|{self.dimensions}|{'norm' if self.normalize else 'raw'}"
+
+    @property
+    def cache_model(self) -> str:
+        # Identifiant du modèle dans le cache d'embeddings (la dimension y est déjà)
+        return self.model_id if self.normalize else f"{self.model_id}|raw"
+
+    @classmethod
+    def parse(cls, key: str) -> "EmbeddingVersion":
+        model_id, dimensions, normalize = key.rsplit("|", 2)
+        return cls(model_id, int(dimensions), normalize == "norm")
+
+
+# Version de toutes les lignes indexées avant le suivi des versions
+LEGACY_VERSION = EmbeddingVersion("amazon.titan-embed-text-v2:0", 512, True)
+
+
+def configured_version() -> EmbeddingVersion:
+    from services import bedrock_service
+    return EmbeddingVersion(bedrock_service.TITAN_EMBEDDING_MODEL, bedrock_service.TITAN_EMBEDDING_DIMENSIONS,
+                            bedrock_service.TITAN_EMBEDDING_NORMALIZE)
+
+
+class VersionRegistry:
+    """
+    Version active des embeddings RAG, lue en base et gardée en mémoire quelques secondes.
+    Quand elle change (bascule faite par ce process ou par un autre), les index en mémoire
+    et le cache de réponses sont vidés.
+    """
+
+    def __init__(self, refresh_seconds: float = EMBEDDING_VERSION_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._active: Optional[EmbeddingVersion] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._warned = False
+
+    def current(self) -> EmbeddingVersion:
+        # Dernière version active connue, sans accès base
+        return self._active or configured_version()
+
+    def active(self, db: Session) -> EmbeddingVersion:
+        if self._active is not None and time.monotonic() - self._checked_at < self.refresh_seconds:
+            return self._active
+        try:
+            row = db.query(models.RagEmbeddingVersion).filter(models.RagEmbeddingVersion.status == "active").first()
+            version = EmbeddingVersion.parse(row.version) if row else self._bootstrap(db)
+        except Exception as e:
+            print(f"Warning: Version d'embedding active illisible, {self.current().key} conservée : {e}")
+            db.rollback()
+            version = self.current()
+        self._set(version)
+        return version
+
+    def _bootstrap(self, db: Session) -> EmbeddingVersion:
+        # Première lecture : les lignes déjà indexées sont dans la version historique
+        has_rows = db.query(models.RagPortfolio.id).first() is not None
+        version = LEGACY_VERSION if has_rows else configured_version()
+        db.add(models.RagEmbeddingVersion(
+            version=version.key, model_id=version.model_id, dimensions=version.dimensions,
+            normalize=version.normalize, status="active", activated_at=datetime.datetime.utcnow(),
+        ))
+        db.commit()
+        return version
+
+    def _set(self, version: EmbeddingVersion):
+        with self._lock:
+            previous, self._active = self._active, version
+            self._checked_at = time.monotonic()
+        if previous is not None and previous != version:
+            print(f"✅ Version d'embedding active : {previous.key} -> {version.key}")
+            _on_switch()
+        if version != configured_version() and not self._warned:
+            self._warned = True
+            print(f"⚠️  Embeddings RAG en {version.key}, configuration en {configured_version().key} : "
+                  "lancer POST /api/rag/reembed pour migrer")
+
+    def activate(self, db: Session, version: EmbeddingVersion):
+        """
+        Bascule atomique : l'ancienne version passe "retired" et la nouvelle "active"
+        dans la même transaction.
+        """
+        versions = models.RagEmbeddingVersion
+        db.query(versions).filter(versions.status == "active", versions.version != version.key) \
+          .update({"status": "retired"}, synchronize_session=False)
+        db.query(versions).filter(versions.version == version.key) \
+          .update({"status": "active", "activated_at": datetime.datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+        self._set(version)
+
+
+def _on_switch():
+    # Nouveaux identifiants de chunks et nouvel espace vectoriel : tout ce qui est en mémoire est à jeter
+    from services import vector_store
+    from services.answer_cache import answer_cache
+    from services.lexical_index import bm25_index
+
+    vector_store.reset_stores()
+    bm25_index.reset()
+    answer_cache.clear()
+    vector_store.bump_knowledge_version()
+
+
+embedding_versions = VersionRegistry()
+
+
+def active_version(db: Session) -> EmbeddingVersion:
+    return embedding_versions.active(db)
@@ -0,0 +1,201 @@
+import math
+import os
+import random
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import List, Set
+
+from services.lexical_index import STOPWORDS, bm25_index
+
+# Classifieur local placé devant le chatbot : le charabia ("qsdfgh", "azerty") et les
+# politesses ("bonjour", "merci") reçoivent une réponse toute faite, sans appel Titan ni Claude.
+CHAT_LOCAL_CLASSIFIER = os.getenv("CHAT_LOCAL_CLASSIFIER", "true").lower() == "true"
+# Entropie croisée (bits par caractère) au-delà de laquelle un mot inconnu est jugé imprononçable
+GIBBERISH_CROSS_ENTROPY = float(os.getenv("GIBBERISH_CROSS_ENTROPY", "5.8"))
+
+QUESTION, GIBBERISH, GREETING, THANKS, GOODBYE = "question", "gibberish", "greeting", "thanks", "goodbye"
+
+_WORD = re.compile(r"[a-z0-9]+")
+_ACRONYM = re.compile(r"\b[A-Z][A-Z0-9]+\b")
+_VOWELS = set("aeiouy")
+# Mots courts (3-4 lettres) : le plus souvent des sigles ("hdfs", "kpmg"), seuls une lettre répétée
+# et une suite de touches voisines les rendent imprononçables. Contrôle des voyelles à partir de 6 lettres.
+_SHORT_WORD = 5
+_LONG_WORD = 6
+_KEYBOARD_ROWS = ("azertyuiop", "qsdfghjklm", "wxcvbn", "qwertyuiop", "asdfghjkl", "zxcvbnm", "1234567890")
+
+# Vocabulaire courant d'un visiteur de portfolio (français / anglais, sans accents).
+# Complété à l'exécution par le vocabulaire de la base de connaissance (index BM25).
+COMMON_WORDS = set("""
+quel quelle quels quelles qui quoi comment pourquoi combien quand ou est sont suis es etes a ai as avez ont
+fait faire fais peux peut pouvez veux voudrais aimerais parle parler parlez dis dire dites montre explique
+moi toi vous il elle lui ses son sa ton ta tes votre vos mon ma mes je tu nous on ca cela ceci aussi tres
+bien bon bonne super genial cool interessant encore autre autres tout tous toutes plus moins deja jamais
+competences competence projets projet experience experiences formation formations diplome diplomes etudes
+certification certifications certifie travail travaille travailler emploi poste postes entreprise entreprises
+stage alternance ecole universite master licence langages langage outils outil technologies technologie
+contact contacter email mail telephone numero linkedin github cv age ans habite vit ville pays paris france
+disponible disponibilite salaire freelance mission missions recrute recruter embauche embaucher profil
+parcours passion passions loisirs hobbies langues anglais francais donnees data analyste analyst ingenieur
+engineer developpeur scientist science intelligence artificielle machine learning apprentissage modele
+modeles tableau tableaux bord dashboard dashboards rapport rapports cloud base bases pipeline pipelines
+python sql nosql ia ai ml bi etl elt llm rag nlp api aws azure gcp excel vba spark docker kubernetes
+chatbot assistant site portfolio createur cree concu power powerbi fabric qlik sense looker snowflake databricks
+synapse kafka airflow hadoop dbt mlflow oracle postgresql mysql mongodb react fastapi nextjs java javascript
+typescript scala terraform git linux
+bonjour salut hello coucou bonsoir hey hi yo merci thanks thank thx revoir bye ciao bientot oui non ok
+what who where when why how which is are am was were does do did can could would will tell about his her
+him he she you your me my i it this that the a an of and to in for on with skills skill projects experience
+education degree job jobs work works worked company companies contact phone hobbies languages available
+hire hiring resume background certified studies study school university please know show explain
+""".split())
+
+# Sigles tapés en minuscules : jamais du charabia, même sans voyelle ni bigramme courant.
+# Gardés hors du vocabulaire d'apprentissage des bigrammes, dont ils fausseraient les probabilités.
+ACRONYMS = set("""
+html css json xml yaml csv http https ssis ssas ssrs hdfs llms spss sas grpc rest soap jwt sncf kpmg pwc
+ey rgpd gdpr crm erp sap kpi kpis olap oltp dwh mdm cicd nlp ocr gpt dax mdx ssms tsql plsql pdf
+""".split())
+
+# Politesses reconnues, et mots qui peuvent les accompagner sans en faire une vraie question
+GREETING_WORDS = {"bonjour", "salut", "hello", "coucou", "bonsoir", "hey", "hi", "yo", "hola", "wesh", "cc"}
+THANKS_WORDS = {"merci", "thanks", "thank", "thx", "mercii", "remercie"}
+GOODBYE_WORDS = {"revoir", "bye", "ciao", "bientot", "goodbye", "adieu", "bonne", "journee", "soiree"}
+SMALL_TALK_FILLERS = {
+    "a", "au", "ca", "va", "comment", "allez", "vas", "toi", "vous", "tu", "le", "la", "les", "tout", "monde",
+    "berthoni", "passo", "bot", "assistant", "chatbot", "there", "everyone", "you", "ok", "super", "beaucoup",
+    "bien", "tres", "much", "so", "a", "lot", "de", "rien", "et", "cher", "chere", "encore", "plus", "to",
+}
+
+CANNED_ANSWERS = {
+    GIBBERISH: [
+        "😊 Je n'ai pas bien compris ! Posez-moi une vraie question sur Berthoni : son parcours, ses projets ou ses compétences en Data & IA.",
+        "😄 Oups, ça ressemble à une faute de frappe ! Que voulez-vous savoir sur Berthoni ? Ses projets Data, ses certifications, son expérience...",
+    ],
+    GREETING: [
+        "Bonjour ! 👋 Je suis l'assistant IA de Berthoni. Posez-moi vos questions sur son parcours, ses projets ou ses compétences en Data & IA !",
+        "Salut ! 😊 Que voulez-vous savoir sur Berthoni ? Ses projets, ses certifications Microsoft, son expérience de Data Analyst...",
+    ],
+    THANKS: [
+        "Avec plaisir ! 😊 N'hésitez pas si vous avez d'autres questions sur Berthoni.",
+        "Je vous en prie ! Une autre question sur ses projets ou son parcours ?",
+    ],
+    GOODBYE: [
+        "À bientôt ! 👋 N'hésitez pas à contacter Berthoni directement via la page contact.",
+    ],
+}
+
+
+def _strip_accents(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def _words(text: str) -> List[str]:
+    # Minuscules, sans accents, sans ponctuation
+    return _WORD.findall(_strip_accents(text))
+
+
+def _non_latin(text: str) -> bool:
+    # Lettres d'un autre alphabet (cyrillique, CJK, arabe...) : hors de portée des signaux du classifieur
+    return any(c.isalpha() and not "a" <= c <= "z" for c in _strip_accents(text))
+
+
+class IntentClassifier:
+    """
+    Trois signaux, sans appel réseau :
+    - taux de mots connus (vocabulaire courant + vocabulaire de la base de connaissance + sigles) ;
+    - entropie croisée des bigrammes de caractères, apprise sur ce vocabulaire :
+      "qsdfgh" ou "xkcdvfj" enchaînent des lettres qui ne se suivent jamais en français / anglais ;
+    - lexique de politesses (salutations, remerciements, au revoir).
+    Dans le doute, le message est traité comme une question : seuls les signaux forts
+    (lettre répétée, suite de touches voisines, mot de 5 lettres ou plus imprononçable) court-circuitent le chatbot.
+    """
+
+    def __init__(self, vocabulary=COMMON_WORDS | STOPWORDS):
+        bigrams, firsts = Counter(), Counter()
+        for word in vocabulary:
+            padded = f"^{word}$"
+            for a, b in zip(padded, padded[1:]):
+                bigrams[a + b] += 1
+                firsts[a] += 1
+        self._vocabulary = vocabulary
+        self._bigrams, self._firsts = bigrams, firsts
+        self._alphabet = len({c for w in vocabulary for c in w}) + 2
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    def cross_entropy(self, word: str) -> float:
+        padded = f"^{word}$"
+        bits = 0.0
+        for a, b in zip(padded, padded[1:]):
+            p = (self._bigrams[a + b] + 0.1) / (self._firsts[a] + 0.1 * self._alphabet)
+            bits -= math.log2(p)
+        return bits / (len(padded) - 1)
+
+    def _known(self, word: str) -> bool:
+        return word in self._vocabulary or word in ACRONYMS or bm25_index.has_term(word)
+
+    def _implausible(self, word: str) -> bool:
+        if len(word) < 3 or word.isdigit():
+            return False
+        if len(set(word)) == 1:                                          # "aaaa", "zzz"
+            return True
+        if len(word) >= 4 and any(word in row or word[::-1] in row for row in _KEYBOARD_ROWS):
+            return True                                                  # "qsdf", "azerty", "poiu"
+        if len(word) < _SHORT_WORD:
+            return False
+        if len(set(word)) <= 2:                                          # "ababa"
+            return True
+        if len(word) >= _LONG_WORD:
+            if not _VOWELS & set(word):                                  # "fdsghk"
+                return True
+            for size in (2, 3):                                          # "sdfsdf", "azeaze"
+                if word == (word[:size] * len(word))[:len(word)]:
+                    return True
+        return self.cross_entropy(word) >= GIBBERISH_CROSS_ENTROPY      # "efdsg", "xkcdvfj"
+
+    def classify(self, text: str) -> str:
+        if _non_latin(text):
+            intent = QUESTION
+        else:
+            acronyms = {a.lower() for a in _ACRONYM.findall(text)}
+            intent = self._classify(_words(text), acronyms)
+        with self._lock:
+            self.counts[intent] += 1
+        return intent
+
+    def _classify(self, words: List[str], acronyms: Set[str] = frozenset()) -> str:
+        letters = [w for w in words if not w.isdigit()]
+        if not letters:
+            # Que des chiffres, des symboles ou des emojis
+            return GIBBERISH
+
+        unique = set(letters)
+        if unique <= GREETING_WORDS | THANKS_WORDS | GOODBYE_WORDS | SMALL_TALK_FILLERS:
+            if unique & THANKS_WORDS:
+                return THANKS
+            if unique & GOODBYE_WORDS:
+                return GOODBYE
+            if unique & GREETING_WORDS:
+                return GREETING
+
+        unknown = [w for w in letters if w not in acronyms and not self._known(w)]
+        implausible = [w for w in unknown if self._implausible(w)]
+        known_rate = 1 - len(unknown) / len(letters)
+        if known_rate < 0.5 and len(implausible) * 2 >= len(letters):
+            return GIBBERISH
+        return QUESTION
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counts)
+
+
+def canned_answer(intent: str) -> str:
+    return random.choice(CANNED_ANSWERS[intent])
+
+
+intent_classifier = IntentClassifier()
@@ -0,0 +1,146 @@
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from typing import List, Dict, Any, Optional
+
+from sqlalchemy.orm import Session
+
+import models
+
+# Paramètres BM25 classiques
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_WORD = re.compile(r"[a-z0-9]+(?:[.+#][a-z0-9]+)*")
+
+# Mots vides français/anglais les plus fréquents : sans intérêt pour le classement
+STOPWORDS = {
+    "le", "la", "les", "un", "une", "des", "de", "du", "et", "en", "au", "aux", "a", "est", "il", "elle",
+    "que", "qui", "quoi", "pour", "par", "sur", "dans", "avec", "son", "sa", "ses", "ce", "cette", "ces",
+    "ou", "se", "ne", "pas", "plus", "quel", "quelle", "quels", "quelles", "t", "d", "l", "s", "y",
+    "the", "of", "and", "to", "in", "is", "for", "on", "with", "what", "does", "he", "his",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    # Minuscules, sans accents : "Certifié" et "certifie" doivent se retrouver
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [t for t in _WORD.findall(text) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Index inversé BM25 en mémoire sur RagPortfolio.content (lignes de la version d'embedding active).
+    Construit depuis Oracle à la première recherche, tenu à jour à chaque ingestion locale,
+    et rechargé quand la base de connaissance change dans un autre process (vector_store.KnowledgeVersion).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        # Rechargé depuis Oracle à la prochaine recherche (ex: après une bascule de version d'embedding)
+        with self._lock:
+            self._loaded = False
+            self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)  # terme -> {doc_id: tf}
+            self._lengths: Dict[int, int] = {}
+            self._docs: Dict[int, Dict[str, Any]] = {}
+            self._total_length = 0
+
+    def _add(self, doc_id: int, source: str, content: str):
+        if doc_id in self._docs:
+            self._remove(doc_id)
+        terms = Counter(tokenize(content))
+        for term, tf in terms.items():
+            self._postings[term][doc_id] = tf
+        length = sum(terms.values())
+        self._lengths[doc_id] = length
+        self._total_length += length
+        self._docs[doc_id] = {"source": source, "content": content, "terms": list(terms)}
+
+    def _remove(self, doc_id: int):
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for term in doc["terms"]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id, 0)
+
+    def ensure_loaded(self, db: Session, version: Optional[str] = None):
+        if self._loaded:
+            return
+        query = db.query(models.RagPortfolio.id, models.RagPortfolio.source, models.RagPortfolio.content)
+        if version is not None:
+            query = query.filter(models.RagPortfolio.embedding_version == version)
+        rows = query.all()
+        with self._lock:
+            if self._loaded:
+                return
+            for row in rows:
+                self._add(row.id, row.source, row.content or "")
+            self._loaded = True
+
+    def add_many(self, docs: List[Dict[str, Any]]):
+        # Avant le premier chargement, les nouvelles lignes seront lues depuis Oracle
+        with self._lock:
+            if not self._loaded:
+                return
+            for doc in docs:
+                self._add(doc["id"], doc["source"], doc["content"])
+
+    def remove(self, doc_ids: List[int]):
+        with self._lock:
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+
+    def has_term(self, term: str) -> bool:
+        # Vocabulaire de la base de connaissance (utilisé par services/intent_classifier.py)
+        return term in self._postings
+
+    def search(self, query: str, k: int) -> List[Dict[str, Any]]:
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self._docs)
+            if not n or not terms:
+                return []
+            avg_length = self._total_length / n
+            scores: Dict[int, float] = defaultdict(float)
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[doc_id] / avg_length)
+                    scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+            top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [
+                {"id": doc_id, "source": self._docs[doc_id]["source"],
+                 "content": self._docs[doc_id]["content"], "score": score}
+                for doc_id, score in top
+            ]
+
+
+def reciprocal_rank_fusion(rankings: List[List[Dict[str, Any]]], k: int, rrf_k: int = 60) -> List[Dict[str, Any]]:
+    """
+    Fusionne plusieurs classements (vectoriel, lexical...) : score = somme des 1 / (rrf_k + rang).
+    """
+    fused: Dict[int, float] = defaultdict(float)
+    docs: Dict[int, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            fused[doc["id"]] += 1.0 / (rrf_k + rank)
+            docs.setdefault(doc["id"], doc)
+    top = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+    return [{**docs[doc_id], "score": score} for doc_id, score in top]
+
+
+bm25_index = BM25Index()
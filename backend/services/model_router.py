@@ -0,0 +1,239 @@
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import suppress
+from typing import AsyncIterator, Callable, Dict, List, NamedTuple, Optional
+
+from services.chat_stream import StreamMetrics
+
+# Routage des générations Claude : une route = un modèle dans une région Bedrock.
+# Si le premier token de la route principale n'est pas arrivé après CLAUDE_HEDGE_DELAY_MS,
+# la même requête part sur la route suivante : le premier stream qui répond est relayé, l'autre annulé.
+# Un disjoncteur par route écarte quelque temps une route en erreur ou qui perd ses courses.
+# Routes de secours, dans l'ordre : "modèle@région", "@région" (même modèle) ou "modèle" (même région)
+# ex: "@eu-central-1,eu.anthropic.claude-3-haiku-20240307-v1:0"
+CLAUDE_CHAT_FALLBACKS = os.getenv("CLAUDE_CHAT_FALLBACKS", "")
+# Autour du p95 du time-to-first-token (visible dans /api/rag/chat/stats). 0 = bascule sur erreur seulement
+CLAUDE_HEDGE_DELAY_MS = float(os.getenv("CLAUDE_HEDGE_DELAY_MS", "2000"))
+CLAUDE_BREAKER_FAILURES = int(os.getenv("CLAUDE_BREAKER_FAILURES", "3"))
+CLAUDE_BREAKER_COOLDOWN_SECONDS = float(os.getenv("CLAUDE_BREAKER_COOLDOWN_SECONDS", "30"))
+CLAUDE_ROUTER_METRICS_WINDOW = 200
+
+
+class Route(NamedTuple):
+    model_id: str
+    region: str
+
+    @property
+    def name(self) -> str:
+        return f"{self.model_id}@{self.region}"
+
+
+def parse_routes(primary: Route, fallbacks: str) -> List[Route]:
+    routes = [primary]
+    for entry in fallbacks.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        model_id, _, region = entry.rpartition("@") if "@" in entry else (entry, "", "")
+        route = Route(model_id or primary.model_id, region or primary.region)
+        if route not in routes:
+            routes.append(route)
+    return routes
+
+
+class NoRouteAvailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    closed : la route reçoit les requêtes. Après N échecs consécutifs, open : plus aucune requête
+    pendant le refroidissement. Ensuite half_open : une seule requête d'essai, qui referme
+    le disjoncteur si elle réussit et le rouvre sinon.
+    """
+
+    def __init__(self, threshold: int = CLAUDE_BREAKER_FAILURES, cooldown: float = CLAUDE_BREAKER_COOLDOWN_SECONDS):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.trips = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._probing or time.monotonic() - self._opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return state == "closed"
+
+    def record_success(self):
+        self.failures, self._opened_at, self._probing = 0, None, False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.threshold:
+            if self._opened_at is None:
+                self.trips += 1
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        # Requête annulée sans verdict (visiteur parti, course perdue de justesse) : l'essai est à refaire
+        self._probing = False
+
+
+async def _first_chunk(chunks: AsyncIterator[str]) -> Optional[str]:
+    try:
+        return await chunks.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+class ModelRouter:
+    def __init__(self, routes: List[Route], hedge_delay: float = CLAUDE_HEDGE_DELAY_MS / 1000):
+        self.routes = routes
+        self.hedge_delay = hedge_delay
+        self.breakers: Dict[Route, CircuitBreaker] = {r: CircuitBreaker() for r in routes}
+        self._ttfts: Dict[Route, deque] = {r: deque(maxlen=CLAUDE_ROUTER_METRICS_WINDOW) for r in routes}
+        self._wins: Dict[Route, int] = {r: 0 for r in routes}
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    def _next_route(self, tried: List[Route]) -> Optional[Route]:
+        for route in self.routes:
+            if route not in tried and self.breakers[route].allow():
+                return route
+        if not tried:
+            # Toutes les routes sont écartées : on tente quand même la principale plutôt que de refuser
+            return self.routes[0]
+        return None
+
+    async def _abandon(self, attempts: dict, winner_started: Optional[float]):
+        """
+        Annule les requêtes encore en attente de leur premier token (et leur connexion Bedrock).
+        Une requête partie avant la gagnante a perdu la course : c'est un échec pour sa route.
+        """
+        for task, (route, chunks, started) in list(attempts.items()):
+            task.cancel()
+            with suppress(BaseException):
+                await task
+            with suppress(BaseException):
+                await chunks.aclose()
+            if winner_started is not None and started < winner_started:
+                self.breakers[route].record_failure()
+            else:
+                self.breakers[route].release()
+        attempts.clear()
+
+    async def stream(self, open_stream: Callable[[Route], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Relaie le stream de la première route qui produit un token. `open_stream(route)` ouvre
+        la même requête sur une route donnée. Une erreur avant le premier token bascule
+        sur la route suivante ; les erreurs en cours de stream remontent à l'appelant.
+        """
+        self.requests += 1
+        attempts = {}   # tâche du premier chunk -> (route, stream, lancement)
+        tried: List[Route] = []
+        hedges: List[Route] = []
+        last_error: Optional[Exception] = None
+        winner = None
+
+        def launch() -> bool:
+            route = self._next_route(tried)
+            if route is None:
+                return False
+            tried.append(route)
+            chunks = open_stream(route)
+            attempts[asyncio.ensure_future(_first_chunk(chunks))] = (route, chunks, time.monotonic())
+            return True
+
+        try:
+            launch()
+            while winner is None:
+                if not attempts:
+                    if not launch():
+                        raise last_error or NoRouteAvailable("Aucune route Claude disponible")
+                    self.failovers += 1
+                    continue
+                hedge = self.hedge_delay > 0 and len(tried) < len(self.routes)
+                done, _ = await asyncio.wait(list(attempts), timeout=self.hedge_delay if hedge else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if launch():
+                        self.hedged += 1
+                        hedges.append(tried[-1])
+                    continue
+                for task in done:
+                    route, chunks, started = attempts.pop(task)
+                    try:
+                        first = task.result()
+                    except Exception as e:
+                        last_error = e
+                        self.breakers[route].record_failure()
+                        print(f"Warning: Route Claude {route.name} en échec avant le premier token : {e}")
+                        continue
+                    winner = (route, chunks, started, first)
+                    break
+
+            route, chunks, started, first = winner
+            self.breakers[route].record_success()
+            self._wins[route] += 1
+            self._ttfts[route].append(time.monotonic() - started)
+            if route in hedges:
+                self.hedge_wins += 1
+            await self._abandon(attempts, started)
+
+            if first is None:
+                return
+            yield first
+            try:
+                async for chunk in chunks:
+                    yield chunk
+            except Exception:
+                self.breakers[route].record_failure()
+                raise
+        finally:
+            # Visiteur parti pendant la course, ou erreur : rien ne doit rester ouvert côté Bedrock
+            await self._abandon(attempts, None)
+            if winner is not None:
+                with suppress(BaseException):
+                    await winner[1].aclose()
+
+    def stats(self) -> dict:
+        return {
+            "hedge_delay_ms": self.hedge_delay * 1000,
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "routes": [{
+                "route": route.name,
+                "state": self.breakers[route].state,
+                "wins": self._wins[route],
+                "consecutive_failures": self.breakers[route].failures,
+                "trips": self.breakers[route].trips,
+                "ttft_ms_p50": StreamMetrics._percentile(list(self._ttfts[route]), 50),
+                "ttft_ms_p95": StreamMetrics._percentile(list(self._ttfts[route]), 95),
+            } for route in self.routes],
+        }
+
+
+def _default_routes() -> List[Route]:
+    from services import bedrock_service
+    return parse_routes(Route(bedrock_service.CLAUDE_CHAT_MODEL, bedrock_service.region), CLAUDE_CHAT_FALLBACKS)
+
+
+claude_router = ModelRouter(_default_routes())
@@ -0,0 +1,82 @@
+from typing import List, Tuple
+
+import numpy as np
+
+# Représentations compactes des embeddings RAG :
+# - "int8"   : 1 octet par dimension (4x moins que float32), échelle propre à chaque vecteur
+# - "binary" : 1 bit par dimension (32x moins), signe de chaque composante, distance de Hamming
+# Le scan des candidats se fait sur ces codes ; les meilleurs sont re-classés en float32 exact.
+QUANTIZATIONS = ("none", "int8", "binary")
+
+# Nombre de bits à 1 de chaque octet (popcount pour la distance de Hamming)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# Le scan int8 convertit les codes en float32 par petits blocs (qui restent dans le cache CPU)
+_SCAN_BLOCK_ROWS = 1024
+
+
+def code_width(quantization: str, dimensions: int) -> int:
+    return dimensions // 8 if quantization == "binary" else dimensions
+
+
+def code_dtype(quantization: str):
+    return np.uint8 if quantization == "binary" else np.int8
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Codes int8 et échelle par vecteur : v ≈ code * échelle.
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def pack_binary(vectors: np.ndarray) -> np.ndarray:
+    """
+    Un bit par dimension (composante positive), 8 dimensions par octet.
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return np.packbits(vectors > 0, axis=1)
+
+
+def encode(quantization: str, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Retourne (codes, échelles). Les échelles ne servent qu'au format int8.
+    """
+    if quantization == "binary":
+        codes = pack_binary(vectors)
+        return codes, np.ones(codes.shape[0], dtype=np.float32)
+    return quantize_int8(vectors)
+
+
+def _hamming(codes: np.ndarray, query_bits: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count") and codes.shape[1] % 8 == 0:
+        # NumPy >= 2.0 : popcount natif sur des mots de 64 bits
+        words = np.ascontiguousarray(codes).view(np.uint64)
+        return np.bitwise_count(words ^ query_bits.view(np.uint64)).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT[np.bitwise_xor(codes, query_bits)].sum(axis=1, dtype=np.int32)
+
+
+def scan(quantization: str, codes: np.ndarray, scales: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """
+    Score approximatif de chaque vecteur codé (plus grand = plus proche).
+    """
+    if quantization == "binary":
+        return -_hamming(codes, pack_binary(query)[0]).astype(np.float32)
+    scores = np.empty(codes.shape[0], dtype=np.float32)
+    for start in range(0, codes.shape[0], _SCAN_BLOCK_ROWS):
+        block = codes[start:start + _SCAN_BLOCK_ROWS]
+        scores[start:start + len(block)] = (block.astype(np.float32) @ query) * scales[start:start + len(block)]
+    return scores
+
+
+def oracle_literal(quantization: str, embedding: List[float]) -> str:
+    """
+    Représentation JSON attendue par TO_VECTOR(..., INT8) ou TO_VECTOR(..., BINARY)
+    (pour BINARY : un entier 0-255 par groupe de 8 dimensions).
+    """
+    codes, _ = encode(quantization, np.asarray(embedding, dtype=np.float32))
+    return "[" + ",".join(str(int(c)) for c in codes[0]) + "]"
@@ -0,0 +1,103 @@
+from typing import Dict, Any
+
+import models
+from database import SessionLocal
+from services import rag_ingest, vector_store
+from services.answer_cache import answer_cache
+from services.chunking import chunk_text
+from services.embedding_versions import active_version
+
+
+def project_source(project_id: int) -> str:
+    return f"project_{project_id}"
+
+
+def project_document(project: models.Project) -> str:
+    """
+    Texte indexé pour un projet. Le titre n'est répété que dans le premier chunk :
+    le modifier ne ré-embedde pas le reste de la description.
+    """
+    lines = [f"Projet : {project.title}"]
+    if project.tags:
+        lines.append(f"Technologies : {project.tags}")
+    lines.append(project.description or "")
+    for label, url in (("GitHub", project.github_url), ("Démo", project.demo_url), ("Power BI", project.powerbi_url)):
+        if url:
+            lines.append(f"{label} : {url}")
+    return "\n".join(lines)
+
+
+def sync_project(project_id: int) -> Dict[str, Any]:
+    """
+    Met les chunks RAG d'un projet en phase avec la table projects.
+    Seuls les chunks dont le hash de contenu a changé sont ré-embeddés ;
+    un projet supprimé voit tous ses chunks retirés.
+    Les chunks sont comparés dans la version d'embedding active ; un chunk retiré l'est de
+    toutes les versions (le job de ré-embedding rattrape les ajouts faits pendant qu'il tourne).
+    Prévu pour tourner en tâche de fond (BackgroundTasks), avec sa propre session.
+    """
+    db = SessionLocal()
+    source = project_source(project_id)
+    try:
+        version = active_version(db)
+        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        existing = db.query(models.RagPortfolio.id, models.RagPortfolio.content_hash) \
+                     .filter(models.RagPortfolio.source == source,
+                             models.RagPortfolio.embedding_version == version.key).all()
+
+        chunks = chunk_text(project_document(project), source) if project else []
+        wanted = {c["content_hash"] for c in chunks}
+        known = {row.content_hash for row in existing}
+
+        stale_ids = [row.id for row in existing if row.content_hash not in wanted]
+        new_chunks = [c for c in chunks if c["content_hash"] not in known]
+        if not stale_ids and not new_chunks:
+            return {"source": source, "added": 0, "removed": 0}
+
+        embeddings = rag_ingest.embed_texts([c["content"] for c in new_chunks], version=version)
+        if stale_ids:
+            stale_hashes = {row.content_hash for row in existing if row.id in stale_ids}
+            db.query(models.RagPortfolio).filter(models.RagPortfolio.id.in_(stale_ids)) \
+              .delete(synchronize_session=False)
+            # Copies de ces chunks dans une version en cours de construction
+            db.query(models.RagPortfolio).filter(models.RagPortfolio.source == source,
+                                                 models.RagPortfolio.embedding_version != version.key,
+                                                 models.RagPortfolio.content_hash.in_(stale_hashes)) \
+              .delete(synchronize_session=False)
+        rag_ingest.insert_chunks(db, new_chunks, embeddings, version)
+        db.commit()
+
+        vector_store.remove_documents(db, stale_ids, version)
+        answer_cache.clear()
+        print(f"✅ RAG {source} : {len(new_chunks)} chunk(s) ré-indexé(s), {len(stale_ids)} retiré(s)")
+        return {"source": source, "added": len(new_chunks), "removed": len(stale_ids)}
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️  Indexation RAG du projet {project_id} impossible : {e}")
+        return {"source": source, "error": str(e)}
+    finally:
+        db.close()
+
+
+def sync_all_projects() -> Dict[str, Any]:
+    """
+    Ré-indexe tout le catalogue (seuls les chunks modifiés coûtent un appel Titan).
+    Les projets disparus de la table sont aussi retirés de la base de connaissance.
+    """
+    db = SessionLocal()
+    try:
+        project_ids = [p.id for p in db.query(models.Project.id).all()]
+        indexed_sources = {s for (s,) in db.query(models.RagPortfolio.source).distinct()
+                           if s and s.startswith("project_")}
+    finally:
+        db.close()
+
+    orphan_ids = [int(s.split("_", 1)[1]) for s in indexed_sources
+                  if s.split("_", 1)[1].isdigit() and int(s.split("_", 1)[1]) not in project_ids]
+    results = [sync_project(pid) for pid in project_ids + orphan_ids]
+    return {
+        "projects": len(results),
+        "added": sum(r.get("added", 0) for r in results),
+        "removed": sum(r.get("removed", 0) for r in results),
+        "errors": [r for r in results if "error" in r],
+    }
@@ -0,0 +1,99 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Dict, Any, Optional
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+import models
+from services import bedrock_service, vector_store
+from services.chunking import chunk_text, RAG_CHUNK_SIZE, RAG_CHUNK_OVERLAP
+from services.embedding_versions import EmbeddingVersion, active_version
+
+# Nombre maximum d'appels Titan simultanés (évite le throttling Bedrock)
+RAG_EMBED_CONCURRENCY = int(os.getenv("RAG_EMBED_CONCURRENCY", "4"))
+
+
+def embed_texts(texts: List[str], concurrency: int = RAG_EMBED_CONCURRENCY,
+                version: Optional[EmbeddingVersion] = None) -> List[List[float]]:
+    """
+    Vectorise plusieurs textes en parallèle (pool borné), en conservant l'ordre.
+    `version` : modèle / dimension / normalisation Titan (par défaut la configuration courante).
+    """
+    embed = partial(bedrock_service.get_embedding, version=version)
+    if len(texts) <= 1 or concurrency <= 1:
+        return [embed(t) for t in texts]
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(texts))) as pool:
+        return list(pool.map(embed, texts))
+
+
+async def embed_texts_async(texts: List[str], concurrency: int = RAG_EMBED_CONCURRENCY,
+                            return_exceptions: bool = False,
+                            version: Optional[EmbeddingVersion] = None) -> List[List[float]]:
+    """
+    Équivalent asynchrone de embed_texts (client Bedrock natif asyncio, concurrence bornée).
+    Avec return_exceptions=True, un échec est renvoyé à sa place dans la liste au lieu d'être levé.
+    """
+    from services import bedrock_async
+
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def embed(text: str) -> List[float]:
+        async with semaphore:
+            return await bedrock_async.get_embedding_async(text, version)
+
+    return list(await asyncio.gather(*(embed(t) for t in texts), return_exceptions=return_exceptions))
+
+
+def insert_chunks(db: Session, chunks: List[Dict[str, Any]], embeddings: List[List[float]],
+                  version: Optional[EmbeddingVersion] = None, store=None) -> List[int]:
+    """
+    Insère une ligne RagPortfolio par chunk en un seul executemany, puis leurs vecteurs.
+    Les lignes sont marquées de la version de leurs embeddings (par défaut la version active).
+    Avec `store`, les vecteurs ne vont que dans cet index (job de ré-embedding) :
+    la recherche en cours n'en voit rien. Le commit reste à la charge de l'appelant :
+    les index en mémoire (NumPy, BM25) ne sont mis à jour qu'une fois ce commit passé.
+    """
+    if not chunks:
+        return []
+    version = version or active_version(db)
+    rows = [
+        {"source": c["source"], "section": c["section"], "chunk_index": c["chunk_index"],
+         "content_hash": c["content_hash"], "content": c["content"], "embedding_version": version.key}
+        for c in chunks
+    ]
+    ids = list(db.scalars(
+        insert(models.RagPortfolio).returning(models.RagPortfolio.id, sort_by_parameter_order=True),
+        rows,
+    ))
+
+    docs = [
+        {"id": doc_id, "source": c["source"], "content": c["content"], "embedding": e}
+        for doc_id, c, e in zip(ids, chunks, embeddings)
+    ]
+    try:
+        with db.begin_nested():
+            if store is not None:
+                store.add_many(db, docs)
+            else:
+                vector_store.store_embeddings(db, docs, version)
+    except Exception as e:
+        print(f"Warning: Vector column missing or insert failed: {e}")
+    return ids
+
+
+def ingest_document(db: Session, source: str, content: str, chunk_size: int = RAG_CHUNK_SIZE,
+                    overlap: int = RAG_CHUNK_OVERLAP) -> List[Dict[str, Any]]:
+    """
+    Découpe un document, vectorise ses chunks en parallèle et les insère en base.
+    Retourne les chunks créés (id, section, chunk_index, content, embedding).
+    """
+    version = active_version(db)
+    chunks = chunk_text(content, source, chunk_size, overlap)
+    embeddings = embed_texts([c["content"] for c in chunks], version=version)
+    ids = insert_chunks(db, chunks, embeddings, version)
+    for doc_id, chunk, embedding in zip(ids, chunks, embeddings):
+        chunk["id"] = doc_id
+        chunk["embedding"] = embedding
+    return chunks
@@ -0,0 +1,170 @@
+import os
+import threading
+import time
+from typing import Dict, Any, Optional
+
+from sqlalchemy import exists, func
+from sqlalchemy.orm import Session, aliased
+
+import models
+from database import SessionLocal, engine
+from migrations import (SUPPORTED_EMBEDDING_DIMENSIONS, ensure_rag_vector_column, ensure_rag_quantized_column,
+                        ensure_rag_vector_index)
+from services import rag_ingest, vector_store
+from services.chunking import content_hash
+from services.embedding_versions import (EmbeddingVersion, EMBEDDING_VERSION_REFRESH_SECONDS, configured_version,
+                                         embedding_versions)
+
+# Job de ré-embedding sans interruption : les chunks de la version active sont copiés dans la
+# nouvelle version (modèle, dimension ou normalisation) par petits lots espacés, pendant que les
+# questions continuent d'utiliser l'ancienne. La bascule est atomique (rag_embedding_versions),
+# puis les lignes de l'ancienne version sont supprimées une fois tous les process passés à la nouvelle.
+RAG_REEMBED_BATCH_SIZE = int(os.getenv("RAG_REEMBED_BATCH_SIZE", "32"))
+# Appels Titan simultanés et pause entre deux lots : le job ne doit pas provoquer de throttling Bedrock
+RAG_REEMBED_CONCURRENCY = int(os.getenv("RAG_REEMBED_CONCURRENCY", "2"))
+RAG_REEMBED_PAUSE_SECONDS = float(os.getenv("RAG_REEMBED_PAUSE_SECONDS", "1.0"))
+# Délai avant de supprimer l'ancienne version (les autres process relisent la version active)
+RAG_REEMBED_GRACE_SECONDS = float(os.getenv("RAG_REEMBED_GRACE_SECONDS", str(2 * EMBEDDING_VERSION_REFRESH_SECONDS)))
+
+_running = threading.Lock()
+
+
+def _register(db: Session, version: EmbeddingVersion):
+    row = db.get(models.RagEmbeddingVersion, version.key)
+    if row is None:
+        db.add(models.RagEmbeddingVersion(
+            version=version.key, model_id=version.model_id, dimensions=version.dimensions,
+            normalize=version.normalize, status="building",
+        ))
+    elif row.status != "active":
+        row.status = "building"
+    db.commit()
+
+
+def _backfill_hashes(db: Session, version: EmbeddingVersion):
+    # Les lignes d'avant le chunking n'ont pas de hash : il sert à apparier les deux versions
+    rows = db.query(models.RagPortfolio).filter(models.RagPortfolio.embedding_version == version.key,
+                                                models.RagPortfolio.content_hash.is_(None)).all()
+    for row in rows:
+        row.content_hash = content_hash(row.content or "")
+    db.commit()
+
+
+def _counterpart(other: EmbeddingVersion):
+    # Une ligne de même source et même contenu existe dans `other`
+    chunk, twin = models.RagPortfolio, aliased(models.RagPortfolio)
+    return exists().where(twin.embedding_version == other.key,
+                          func.coalesce(twin.source, "") == func.coalesce(chunk.source, ""),
+                          twin.content_hash == chunk.content_hash)
+
+
+def _unmatched(db: Session, version: EmbeddingVersion, other: EmbeddingVersion):
+    """
+    Lignes de `version` sans équivalent (même source, même contenu) dans `other`.
+    """
+    chunk = models.RagPortfolio
+    return db.query(chunk).filter(chunk.embedding_version == version.key, ~_counterpart(other)).order_by(chunk.id)
+
+
+def _copy_missing(db: Session, source: EmbeddingVersion, target: EmbeddingVersion, batch_size: int,
+                  pause: float) -> int:
+    store = vector_store.get_vector_store(target)
+    if isinstance(store, vector_store.NumpyVectorStore):
+        # Reprise d'un job interrompu : les vecteurs déjà calculés sont dans le fichier .npy
+        store.ensure_loaded(db)
+    copied = 0
+    while True:
+        rows = _unmatched(db, source, target).limit(batch_size).all()
+        if not rows:
+            return copied
+        chunks = [{"source": r.source, "section": r.section, "chunk_index": r.chunk_index,
+                   "content_hash": r.content_hash, "content": r.content} for r in rows]
+        embeddings = rag_ingest.embed_texts([c["content"] for c in chunks], RAG_REEMBED_CONCURRENCY, target)
+        rag_ingest.insert_chunks(db, chunks, embeddings, target, store)
+        db.commit()
+        copied += len(rows)
+        print(f"Ré-embedding {target.key} : {copied} chunk(s)")
+        time.sleep(pause)
+
+
+def _drop_orphans(db: Session, source: EmbeddingVersion, target: EmbeddingVersion) -> int:
+    # Chunks retirés de l'ancienne version pendant le job
+    orphan_ids = [r.id for r in _unmatched(db, target, source).all()]
+    if orphan_ids:
+        db.query(models.RagPortfolio).filter(models.RagPortfolio.id.in_(orphan_ids)) \
+          .delete(synchronize_session=False)
+        db.commit()
+        vector_store.get_vector_store(target).remove(db, orphan_ids)
+    return len(orphan_ids)
+
+
+def _discard_numpy_index(version: EmbeddingVersion):
+    path = vector_store.numpy_index_path(version)
+    if vector_store.RAG_RETRIEVAL_BACKEND != "numpy" or not path:
+        return
+    for file in (path, os.path.splitext(path)[0] + ".meta.json"):
+        if os.path.exists(file):
+            os.remove(file)
+
+
+def reembed(target: Optional[EmbeddingVersion] = None, batch_size: int = RAG_REEMBED_BATCH_SIZE,
+            pause: float = RAG_REEMBED_PAUSE_SECONDS, grace: float = RAG_REEMBED_GRACE_SECONDS) -> Dict[str, Any]:
+    """
+    Construit la version `target` (par défaut la configuration courante) à côté de la version active,
+    bascule dessus, puis supprime l'ancienne. Un job interrompu reprend là où il s'était arrêté.
+    Prévu pour tourner en tâche de fond (BackgroundTasks), avec sa propre session.
+    """
+    target = target or configured_version()
+    if target.dimensions not in SUPPORTED_EMBEDDING_DIMENSIONS:
+        raise ValueError(f"Dimension {target.dimensions} non supportée ({SUPPORTED_EMBEDDING_DIMENSIONS})")
+    if not _running.acquire(blocking=False):
+        return {"version": target.key, "error": "Un ré-embedding est déjà en cours"}
+
+    db = SessionLocal()
+    try:
+        source = embedding_versions.active(db)
+        if source == target:
+            return {"version": target.key, "status": "active", "embedded": 0}
+        _register(db, target)
+        if vector_store.RAG_RETRIEVAL_BACKEND != "numpy":
+            if not ensure_rag_vector_column(engine, target.dimensions):
+                return {"version": target.key, "error": "Colonne VECTOR indisponible"}
+            ensure_rag_quantized_column(engine, target.dimensions)
+
+        _backfill_hashes(db, source)
+        embedded = _copy_missing(db, source, target, batch_size, pause)
+        removed = _drop_orphans(db, source, target)
+        embedding_versions.activate(db, target)
+        if vector_store.RAG_RETRIEVAL_BACKEND != "numpy":
+            ensure_rag_vector_index(engine, target.dimensions)
+        print(f"✅ Version d'embedding {target.key} active ({embedded} chunk(s) ré-embeddé(s))")
+
+        # Pendant le délai de grâce, les process qui n'ont pas encore relu la version active
+        # continuent d'ingérer dans l'ancienne : ces chunks sont rattrapés après le délai
+        time.sleep(grace)
+        _backfill_hashes(db, source)
+        embedded += _copy_missing(db, source, target, batch_size, pause)
+        db.query(models.RagEmbeddingVersion).filter(models.RagEmbeddingVersion.version == target.key) \
+          .update({"chunks": embedded}, synchronize_session=False)
+        db.commit()
+
+        # Seules les lignes déjà présentes dans la nouvelle version sont supprimées : rien ne se perd
+        chunk = models.RagPortfolio
+        purged = db.query(chunk).filter(chunk.embedding_version == source.key, _counterpart(target)) \
+                   .delete(synchronize_session=False)
+        db.commit()
+        kept = _unmatched(db, source, target).count()
+        if kept:
+            print(f"⚠️  {kept} chunk(s) ajouté(s) à {source.key} après le rattrapage : conservés (non supprimés)")
+        else:
+            _discard_numpy_index(source)
+        print(f"✅ {purged} chunk(s) de l'ancienne version {source.key} supprimé(s)")
+        return {"from": source.key, "version": target.key, "embedded": embedded, "orphans_removed": removed,
+                "purged": purged, "kept": kept}
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️  Ré-embedding RAG vers {target.key} impossible : {e}")
+        return {"version": target.key, "error": str(e)}
+    finally:
+        db.close()
+        _running.release()
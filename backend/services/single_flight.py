@@ -0,0 +1,134 @@
+import asyncio
+import re
+import unicodedata
+from contextlib import aclosing, suppress
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+# Single-flight des questions du chatbot : des visiteurs qui posent la même question
+# (même texte normalisé, même version de la base de connaissance) au même moment
+# partagent un seul appel Titan et un seul stream Claude, diffusé à chacun.
+
+_TRAILING = re.compile(r"[\s?!.…]+$")
+
+
+def normalize_question(question: str) -> str:
+    text = unicodedata.normalize("NFC", question).casefold()
+    return _TRAILING.sub("", " ".join(text.split()))
+
+
+class FlightAbandoned(Exception):
+    """
+    Le leader a renoncé avant de fournir le flux (ex: son budget de tokens est épuisé) :
+    ses abonnés relancent la question, l'un d'eux devient leader.
+    """
+
+
+class Flight:
+    """
+    Une génération en cours et ses abonnés. Les chunks produits sont conservés :
+    un abonné arrivé en retard reçoit d'abord ce qui a déjà été généré, puis la suite en direct.
+    """
+
+    def __init__(self, key: Tuple[str, int], flights: "FlightRegistry"):
+        self.key = key
+        self._flights = flights
+        self._ready = asyncio.get_running_loop().create_future()
+        self._upstream: Optional[AsyncIterator[str]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+        self.chunks = []
+        self.done = False
+        self.completed = False
+        self.cached = False
+        self.remember = True
+        self.subscribers = 0
+
+    def start(self, upstream: AsyncIterator[str], cached: bool = False, remember: bool = True):
+        """
+        Le leader fournit le flux de la réponse (stream Claude, réponse en cache...).
+        `remember` indique si la réponse doit entrer dans l'historique des sessions.
+        """
+        self._upstream, self.cached, self.remember = upstream, cached, remember
+        self._ready.set_result(None)
+
+    def fail(self, error: Exception):
+        # Erreur avant le stream (ex: Titan indisponible) : tous les abonnés la reçoivent
+        self.done = True
+        self._flights.forget(self)
+        self._ready.set_exception(error)
+        self._ready.exception()  # évite l'avertissement asyncio si aucun abonné n'attendait
+
+    async def wait_started(self):
+        await asyncio.shield(self._ready)
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _run(self):
+        try:
+            async with aclosing(self._upstream) as chunks:
+                async for chunk in chunks:
+                    self.chunks.append(chunk)
+                    self._notify()
+            self.completed = True
+        finally:
+            self.done = True
+            self._flights.forget(self)
+            self._notify()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """
+        Flux d'un abonné. La génération démarre avec le premier abonné et
+        s'arrête si tous les abonnés se déconnectent avant la fin.
+        """
+        self.subscribers += 1
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        position = 0
+        try:
+            while True:
+                while position < len(self.chunks):
+                    position += 1
+                    yield self.chunks[position - 1]
+                if self.done:
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self._task.done():
+                self._task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await self._task
+
+
+class FlightRegistry:
+    def __init__(self):
+        self._flights: Dict[Tuple[str, int], Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def join(self, question: str, kb_version: int) -> Tuple[Flight, bool]:
+        """
+        Rejoint la génération en cours pour cette question, ou en ouvre une nouvelle.
+        Retourne (flight, leader) : le leader est chargé de fournir le flux.
+        """
+        key = (normalize_question(question), kb_version)
+        flight = self._flights.get(key)
+        if flight is not None and not flight.done:
+            self.followers += 1
+            return flight, False
+        flight = Flight(key, self)
+        self._flights[key] = flight
+        self.leaders += 1
+        return flight, True
+
+    def forget(self, flight: Flight):
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    def stats(self) -> dict:
+        return {"generations": self.leaders, "coalesced": self.followers, "in_flight": len(self._flights)}
+
+
+chat_flights = FlightRegistry()
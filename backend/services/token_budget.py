@@ -0,0 +1,224 @@
+import datetime
+import math
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Dict, List
+
+from sqlalchemy import insert, select, update
+
+import models
+from database import engine
+from services.context_builder import estimate_tokens, RAG_CONTEXT_TOKEN_BUDGET
+
+# Limitation du chatbot au coût plutôt qu'au nombre de requêtes : chaque client (IP) dispose d'un
+# seau de tokens (entrée + sortie Claude estimées). Une question hors budget reçoit un 429 immédiat,
+# avant tout appel Titan ou Claude. Un plafond quotidien global borne la facture Bedrock.
+CHAT_BUDGET_ENABLED = os.getenv("CHAT_BUDGET_ENABLED", "true").lower() == "true"
+CHAT_CLIENT_TOKENS_PER_MINUTE = int(os.getenv("CHAT_CLIENT_TOKENS_PER_MINUTE", "4000"))   # recharge du seau
+CHAT_CLIENT_TOKEN_BURST = int(os.getenv("CHAT_CLIENT_TOKEN_BURST", "12000"))             # capacité du seau
+CHAT_DAILY_TOKEN_CAP = int(os.getenv("CHAT_DAILY_TOKEN_CAP", "2000000"))                 # 0 = sans plafond
+# Streams Claude simultanés : au total, et pour un même client
+CHAT_MAX_CONCURRENT_GENERATIONS = int(os.getenv("CHAT_MAX_CONCURRENT_GENERATIONS", "8"))
+CHAT_CLIENT_MAX_CONCURRENT = int(os.getenv("CHAT_CLIENT_MAX_CONCURRENT", "2"))
+# Compteur quotidien partagé via Oracle (plusieurs Lambdas), synchronisé au plus toutes les N secondes
+CHAT_BUDGET_ORACLE = os.getenv("CHAT_BUDGET_ORACLE", "true").lower() == "true"
+CHAT_BUDGET_SYNC_SECONDS = float(os.getenv("CHAT_BUDGET_SYNC_SECONDS", "10"))
+CHAT_BUDGET_MAX_CLIENTS = int(os.getenv("CHAT_BUDGET_MAX_CLIENTS", "10000"))
+
+# Prompt système hors contexte RAG (consignes, format), compté dans chaque estimation
+SYSTEM_PROMPT_TOKENS = 400
+
+
+class BudgetExceeded(Exception):
+    def __init__(self, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = max(int(retry_after), 1)
+
+
+def estimate_chat_tokens(question: str, history: List[Dict[str, str]], summary: str = "") -> int:
+    """
+    Coût maximal d'une question avant tout appel : prompt système, contexte RAG complet,
+    historique, question, et réponse de longueur maximale.
+    """
+    from services.bedrock_service import CLAUDE_MAX_TOKENS
+
+    history_tokens = estimate_tokens(summary) + sum(estimate_tokens(t["content"]) for t in history)
+    return SYSTEM_PROMPT_TOKENS + RAG_CONTEXT_TOKEN_BUDGET + history_tokens + estimate_tokens(question) \
+        + CLAUDE_MAX_TOKENS
+
+
+class Reservation:
+    """
+    Tokens réservés pour une question (et place de génération occupée).
+    `settle` rembourse la part non consommée : réponse en cache, mutualisée ou plus courte que prévu.
+    Une réservation abandonnée sans `settle` (réponse jamais lue) libère sa place à sa destruction,
+    sans remboursement.
+    """
+
+    def __init__(self, budget: "TokenBudget", client: str, amount: int):
+        self.client = client
+        self.amount = amount
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self._release = weakref.finalize(self, budget._settle, client, amount, amount)
+
+    @property
+    def settled(self) -> bool:
+        return not self._release.alive
+
+    def settle(self):
+        detached = self._release.detach()
+        if detached is None:
+            return
+        _, release, (client, amount, _), _ = detached
+        release(client, amount, min(self.input_tokens + self.output_tokens, amount))
+
+
+class TokenBudget:
+    def __init__(self, rate_per_minute: int = CHAT_CLIENT_TOKENS_PER_MINUTE, burst: int = CHAT_CLIENT_TOKEN_BURST,
+                 daily_cap: int = CHAT_DAILY_TOKEN_CAP, max_generations: int = CHAT_MAX_CONCURRENT_GENERATIONS,
+                 max_per_client: int = CHAT_CLIENT_MAX_CONCURRENT, use_oracle: bool = CHAT_BUDGET_ORACLE):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.daily_cap = daily_cap
+        self.max_generations = max_generations
+        self.max_per_client = max_per_client
+        self.use_oracle = use_oracle
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()   # client -> [tokens, horodatage]
+        self._active: Dict[str, int] = {}
+        self._generations = 0
+        self._day = self._today()
+        self._spent_synced = 0      # total du jour lu en base à la dernière synchronisation
+        self._spent_pending = 0     # dépense de ce process pas encore reportée en base
+        self._requests_pending = 0
+        self._synced_at = 0.0
+        self.rejected = {"client_budget": 0, "daily_cap": 0, "concurrency": 0}
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.datetime.utcnow().strftime("%Y-%m-%d")
+
+    @staticmethod
+    def _seconds_to_midnight() -> int:
+        now = datetime.datetime.utcnow()
+        tomorrow = (now + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return int((tomorrow - now).total_seconds())
+
+    def _bucket(self, client: str, now: float) -> List[float]:
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = [float(self.burst), now]
+            while len(self._buckets) > CHAT_BUDGET_MAX_CLIENTS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        return bucket
+
+    def _roll_day(self):
+        today = self._today()
+        if today != self._day:
+            self._day, self._spent_synced, self._spent_pending, self._requests_pending = today, 0, 0, 0
+
+    def spent_today(self) -> int:
+        with self._lock:
+            self._roll_day()
+            return self._spent_synced + self._spent_pending
+
+    def reserve(self, client: str, amount: int) -> Reservation:
+        """
+        Réserve `amount` tokens pour `client`, ou lève BudgetExceeded (avec le délai avant nouvel essai).
+        """
+        self._sync()
+        now = time.monotonic()
+        with self._lock:
+            self._roll_day()
+            if self.daily_cap and self._spent_synced + self._spent_pending + amount > self.daily_cap:
+                self.rejected["daily_cap"] += 1
+                raise BudgetExceeded("Le chatbot a atteint son quota du jour, revenez demain !",
+                                     self._seconds_to_midnight())
+            if self._generations >= self.max_generations or self._active.get(client, 0) >= self.max_per_client:
+                self.rejected["concurrency"] += 1
+                raise BudgetExceeded("Trop de réponses en cours, réessayez dans un instant.", 2)
+            bucket = self._bucket(client, now)
+            needed = min(amount, self.burst)    # une question plus chère que le seau passe s'il est plein
+            if bucket[0] < needed:
+                self.rejected["client_budget"] += 1
+                missing = needed - bucket[0]
+                raise BudgetExceeded("Trop de questions en peu de temps, réessayez dans un moment.",
+                                     math.ceil(missing / self.rate) if self.rate > 0 else 3600)
+            bucket[0] -= amount
+            self._spent_pending += amount
+            self._requests_pending += 1
+            self._active[client] = self._active.get(client, 0) + 1
+            self._generations += 1
+        return Reservation(self, client, amount)
+
+    def _settle(self, client: str, amount: int, used: int):
+        refund = amount - used
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is not None:
+                bucket[0] = min(self.burst, bucket[0] + refund)
+            self._spent_pending -= refund
+            self._generations -= 1
+            active = self._active.get(client, 1) - 1
+            if active:
+                self._active[client] = active
+            else:
+                self._active.pop(client, None)
+
+    def _sync(self):
+        """
+        Reporte la dépense locale dans chat_token_usage et relit le total du jour (tous process confondus).
+        """
+        if not self.use_oracle or not self.daily_cap or time.monotonic() - self._synced_at < CHAT_BUDGET_SYNC_SECONDS:
+            return
+        with self._lock:
+            self._roll_day()
+            day, pending, requests = self._day, self._spent_pending, self._requests_pending
+            self._spent_pending, self._requests_pending = 0, 0
+            self._synced_at = time.monotonic()
+        usage = models.ChatTokenUsage.__table__
+        try:
+            with engine.begin() as conn:
+                updated = conn.execute(
+                    update(usage).where(usage.c.day == day).values(
+                        tokens=usage.c.tokens + pending, requests=usage.c.requests + requests,
+                        updated_at=datetime.datetime.utcnow(),
+                    )
+                ).rowcount
+                if not updated:
+                    conn.execute(insert(usage).values(day=day, tokens=pending, requests=requests,
+                                                      updated_at=datetime.datetime.utcnow()))
+                total = conn.execute(select(usage.c.tokens).where(usage.c.day == day)).scalar() or 0
+        except Exception as e:
+            print(f"Warning: Compteur de tokens du chatbot non synchronisé : {e}")
+            with self._lock:
+                self._spent_pending += pending
+                self._requests_pending += requests
+            return
+        with self._lock:
+            if self._day == day:
+                self._spent_synced = total
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._roll_day()
+            return {
+                "day": self._day,
+                "spent_tokens": self._spent_synced + self._spent_pending,
+                "daily_cap": self.daily_cap,
+                "generations_in_progress": self._generations,
+                "clients": len(self._buckets),
+                "rejected": dict(self.rejected),
+            }
+
+
+token_budget = TokenBudget()
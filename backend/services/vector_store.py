@@ -0,0 +1,421 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Callable, List, Dict, Any, Optional
+from sqlalchemy import event, func, text
+from sqlalchemy.orm import Session
+
+import models
+from migrations import (RAG_VECTOR_INDEX, RAG_VECTOR_QUANTIZATION, QUANTIZED_VECTOR_FORMATS,
+                        quantized_vector_column, vector_column)
+from services import quantization
+from services.embedding_versions import (EmbeddingVersion, EMBEDDING_VERSION_REFRESH_SECONDS, LEGACY_VERSION,
+                                         embedding_versions)
+from services.lexical_index import bm25_index
+
+# Nombre de passages envoyés à Claude pour chaque question
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "3"))
+
+# Moteur de recherche vectorielle :
+# - "oracle" : colonne VECTOR d'Oracle 23ai (VECTOR_DISTANCE en SQL)
+# - "numpy"  : index en mémoire dans le process (Lambda, dev local, Oracle sans 23ai)
+RAG_RETRIEVAL_BACKEND = os.getenv("RAG_RETRIEVAL_BACKEND", "oracle").strip().lower()
+# Fichier .npy optionnel de l'index NumPy (ex: /tmp/rag_index.npy sur Lambda),
+# un fichier par version d'embedding (/tmp/rag_index_<hash de la version>.npy)
+RAG_NUMPY_INDEX_PATH = os.getenv("RAG_NUMPY_INDEX_PATH", "") or None
+# Index quantifié : nombre de candidats re-classés en float32 exact = k * RAG_RESCORE_FACTOR
+RAG_RESCORE_FACTOR = int(os.getenv("RAG_RESCORE_FACTOR", "10"))
+
+
+def _to_vector_literal(embedding: List[float]) -> str:
+    # TO_VECTOR accepte la représentation JSON '[0.1, 0.2, ...]'
+    return json.dumps(embedding)
+
+
+_PENDING_UPDATES = "rag_pending_index_updates"
+
+
+def after_commit(db: Session, update: Callable[[], None]):
+    """
+    Applique `update` (index en mémoire : NumPy, BM25) une fois la transaction de `db` validée :
+    une ingestion annulée (rollback) n'y laisse aucun chunk absent de la base.
+    Sans transaction en cours, `update` est appliqué tout de suite.
+    """
+    if not db.in_transaction():
+        update()
+        return
+    # Rattaché au savepoint en cours, s'il y en a un : abandonné avec lui
+    db.info.setdefault(_PENDING_UPDATES, []).append((db.get_nested_transaction(), update))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending_updates(session: Session):
+    # Aussi appelé à la libération d'un savepoint : seul le commit de la transaction principale compte
+    if session.get_nested_transaction() is not None:
+        return
+    for _, update in session.info.pop(_PENDING_UPDATES, []):
+        try:
+            update()
+        except Exception as e:
+            print(f"Warning: Index en mémoire non mis à jour après le commit : {e}")
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_pending_updates(session: Session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop(_PENDING_UPDATES, None)
+    elif _PENDING_UPDATES in session.info:
+        session.info[_PENDING_UPDATES] = [(savepoint, update) for savepoint, update in session.info[_PENDING_UPDATES]
+                                          if savepoint is not previous_transaction]
+
+
+def numpy_index_path(version: EmbeddingVersion) -> Optional[str]:
+    if not RAG_NUMPY_INDEX_PATH or version == LEGACY_VERSION:
+        return RAG_NUMPY_INDEX_PATH
+    root, ext = os.path.splitext(RAG_NUMPY_INDEX_PATH)
+    return f"{root}_{hashlib.sha256(version.key.encode()).hexdigest()[:12]}{ext}"
+
+
+class OracleVectorStore:
+    """
+    Recherche top-k dans la colonne `vector_data VECTOR(512)` d'Oracle 23ai
+    (ou `vector_data_256` / `vector_data_1024` selon la dimension de l'index),
+    parmi les lignes d'une seule version d'embedding.
+    Avec RAG_VECTOR_QUANTIZATION, les candidats sont d'abord sélectionnés sur la colonne
+    compacte (INT8 ou BINARY), puis re-classés sur les vecteurs float32.
+    """
+
+    def __init__(self, version: EmbeddingVersion):
+        self.version = version
+        self.dimensions = version.dimensions
+        self.column = vector_column(self.dimensions)
+        self.quantization = RAG_VECTOR_QUANTIZATION if RAG_VECTOR_QUANTIZATION in QUANTIZED_VECTOR_FORMATS else None
+
+    def add_many(self, db: Session, docs: List[Dict[str, Any]]):
+        # Un seul executemany pour tous les chunks ; le commit reste à la charge de l'appelant
+        if not docs:
+            return
+        if not self.quantization:
+            db.execute(
+                text(
+                    f"UPDATE rag_portfolio SET {self.column} = TO_VECTOR(:vec, {self.dimensions}, FLOAT32) "
+                    "WHERE id = :id"
+                ),
+                [{"vec": _to_vector_literal(d["embedding"]), "id": d["id"]} for d in docs],
+            )
+            return
+        vector_format = QUANTIZED_VECTOR_FORMATS[self.quantization]
+        db.execute(
+            text(
+                f"UPDATE rag_portfolio SET {self.column} = TO_VECTOR(:vec, {self.dimensions}, FLOAT32), "
+                f"{quantized_vector_column(self.dimensions)} = TO_VECTOR(:qvec, {self.dimensions}, {vector_format}) "
+                "WHERE id = :id"
+            ),
+            [{"vec": _to_vector_literal(d["embedding"]),
+              "qvec": quantization.oracle_literal(self.quantization, d["embedding"]),
+              "id": d["id"]} for d in docs],
+        )
+
+    def remove(self, db: Session, doc_ids: List[int]):
+        # Le vecteur est une colonne de la ligne : supprimer la ligne suffit
+        pass
+
+    def search(self, db: Session, embedding: List[float], k: int = RAG_TOP_K) -> List[Dict[str, Any]]:
+        # Avec un index HNSW/IVF, la recherche passe en mode approximatif pour l'utiliser
+        fetch = "FETCH APPROXIMATE FIRST" if RAG_VECTOR_INDEX in ("hnsw", "ivf") else "FETCH FIRST"
+        if self.quantization:
+            return self._search_quantized(db, embedding, k, fetch)
+        rows = db.execute(
+            text(
+                "SELECT id, source, content, "
+                f"VECTOR_DISTANCE({self.column}, TO_VECTOR(:vec, {self.dimensions}, FLOAT32), COSINE) AS distance "
+                f"FROM rag_portfolio WHERE {self.column} IS NOT NULL AND embedding_version = :version "
+                f"ORDER BY distance {fetch} :k ROWS ONLY"
+            ),
+            {"vec": _to_vector_literal(embedding), "version": self.version.key, "k": k},
+        ).all()
+        return [
+            {"id": r.id, "source": r.source, "content": r.content, "score": 1.0 - float(r.distance)}
+            for r in rows
+        ]
+
+    def _search_quantized(self, db: Session, embedding: List[float], k: int, fetch: str) -> List[Dict[str, Any]]:
+        # Scan sur la colonne compacte, re-classement exact des k * RAG_RESCORE_FACTOR meilleurs
+        column = quantized_vector_column(self.dimensions)
+        vector_format = QUANTIZED_VECTOR_FORMATS[self.quantization]
+        metric = "HAMMING" if self.quantization == "binary" else "COSINE"
+        rows = db.execute(
+            text(
+                "SELECT id, source, content, "
+                f"VECTOR_DISTANCE({self.column}, TO_VECTOR(:vec, {self.dimensions}, FLOAT32), COSINE) AS distance "
+                f"FROM (SELECT id, source, content, {self.column} FROM rag_portfolio "
+                f"WHERE {column} IS NOT NULL AND embedding_version = :version "
+                f"ORDER BY VECTOR_DISTANCE({column}, TO_VECTOR(:qvec, {self.dimensions}, {vector_format}), {metric}) "
+                f"{fetch} :candidates ROWS ONLY) "
+                "ORDER BY distance FETCH FIRST :k ROWS ONLY"
+            ),
+            {"vec": _to_vector_literal(embedding),
+             "qvec": quantization.oracle_literal(self.quantization, embedding),
+             "version": self.version.key, "candidates": k * RAG_RESCORE_FACTOR, "k": k},
+        ).all()
+        return [
+            {"id": r.id, "source": r.source, "content": r.content, "score": 1.0 - float(r.distance)}
+            for r in rows
+        ]
+
+
+class NumpyVectorStore:
+    """
+    Index NumPy en mémoire (une version d'embedding). Il est construit une seule fois par
+    process à partir d'Oracle : texte des chunks, vecteurs du fichier .npy, puis vecteurs déjà
+    stockés en base (colonne VECTOR, table embedding_cache). Seuls les chunks qui n'ont de vecteur
+    nulle part sont ré-embeddés via Bedrock, en parallèle. Ensuite, une question ne coûte aucun aller-retour Oracle.
+    """
+
+    def __init__(self, version: EmbeddingVersion, path: Optional[str] = None):
+        from services.embedding_index import EmbeddingIndex
+        self.version = version
+        self.index = EmbeddingIndex(version.dimensions, path, RAG_VECTOR_QUANTIZATION, RAG_RESCORE_FACTOR)
+        self._loaded = False
+        self._load_lock = threading.Lock()
+
+    def ensure_loaded(self, db: Session):
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            self.rebuild(db)
+            self._loaded = True
+
+    def _column_vectors(self, db: Session) -> Dict[int, Any]:
+        # Colonne VECTOR remplie par le backend "oracle" : absente sans Oracle 23ai
+        column = vector_column(self.version.dimensions)
+        try:
+            with db.begin_nested():
+                rows = db.execute(
+                    text(f"SELECT id, {column} AS vec FROM rag_portfolio "
+                         f"WHERE embedding_version = :version AND {column} IS NOT NULL"),
+                    {"version": self.version.key},
+                ).all()
+        except Exception:
+            return {}
+        return {r.id: r.vec for r in rows if r.vec is not None}
+
+    def rebuild(self, db: Session):
+        import numpy as np
+        from services.embedding_cache import embedding_cache
+        from services.rag_ingest import embed_texts
+
+        docs = db.query(models.RagPortfolio.id, models.RagPortfolio.source, models.RagPortfolio.content) \
+                 .filter(models.RagPortfolio.embedding_version == self.version.key) \
+                 .order_by(models.RagPortfolio.id).all()
+        file_ids, matrix = self.index.load_file()
+        ids = [d.id for d in docs]
+        sources = [d.source for d in docs]
+        contents = [d.content for d in docs]
+
+        if file_ids == ids and matrix is not None:
+            # Fichier à jour : on garde le memory-map tel quel, sans copie
+            self.index.reset(ids, sources, contents, matrix, normalized=True)
+            return
+
+        position = {doc_id: i for i, doc_id in enumerate(file_ids)}
+        vectors = np.empty((len(docs), self.index.dimensions), dtype=np.float32)
+        missing = []
+        for i, d in enumerate(docs):
+            if d.id in position:
+                vectors[i] = matrix[position[d.id]]
+            else:
+                missing.append(i)
+
+        stored = self._column_vectors(db) if missing else {}
+        remaining = []
+        for i in missing:
+            if ids[i] in stored:
+                vectors[i] = np.asarray(stored[ids[i]], dtype=np.float32)
+            else:
+                remaining.append(i)
+
+        # Vecteurs déjà calculés lors de l'ingestion : une lecture groupée de la table embedding_cache
+        cached = embedding_cache.get_many(self.version.cache_model, self.version.dimensions,
+                                          [contents[i] or "" for i in remaining]) if remaining else []
+        to_embed = []
+        for i, vector in zip(remaining, cached):
+            if vector is not None:
+                vectors[i] = vector
+            else:
+                to_embed.append(i)
+
+        if to_embed:
+            for i, vector in zip(to_embed, embed_texts([contents[i] or "" for i in to_embed], version=self.version)):
+                vectors[i] = vector
+        self.index.reset(ids, sources, contents, vectors)
+        self.index.save()
+        print(f"✅ Index NumPy RAG reconstruit ({len(ids)} chunks, {self.index.dimensions} dimensions, "
+              f"{len(to_embed)} ré-embeddé(s) via Bedrock)")
+
+    def add_many(self, db: Session, docs: List[Dict[str, Any]]):
+        if not self._loaded or not docs:
+            # Le prochain chargement lira les lignes depuis Oracle
+            return
+
+        def add():
+            self.index.add(
+                [d["id"] for d in docs], [d["source"] for d in docs],
+                [d["content"] for d in docs], [d["embedding"] for d in docs],
+            )
+            self.index.save()
+        after_commit(db, add)
+
+    def remove(self, db: Session, doc_ids: List[int]):
+        if not self._loaded or not doc_ids:
+            return
+        self.index.remove(doc_ids)
+        self.index.save()
+
+    def search(self, db: Session, embedding: List[float], k: int = RAG_TOP_K) -> List[Dict[str, Any]]:
+        self.ensure_loaded(db)
+        return self.index.search(embedding, k)
+
+
+# Un moteur par version d'embedding (la version active, plus celle en construction pendant un job)
+_stores: Dict[str, Any] = {}
+_stores_lock = threading.Lock()
+
+# Version de la base de connaissance : empreinte (nombre de chunks, dernier id) des lignes de la
+# version d'embedding active, relue en base au plus toutes les RAG_KNOWLEDGE_REFRESH_SECONDS.
+# Une ingestion ou une suppression faite par un autre process (Lambda, worker) est ainsi vue ici :
+# les index en mémoire (BM25, NumPy) sont rechargés et les réponses en cache invalidées.
+RAG_KNOWLEDGE_REFRESH_SECONDS = float(os.getenv("RAG_KNOWLEDGE_REFRESH_SECONDS",
+                                                str(EMBEDDING_VERSION_REFRESH_SECONDS)))
+
+
+class KnowledgeVersion:
+    """
+    Numéro de génération de la base de connaissance dans ce process (clé du cache de réponses
+    et du single-flight). Incrémenté à chaque ingestion locale et quand l'empreinte lue en base change.
+    """
+
+    def __init__(self, refresh_seconds: float = RAG_KNOWLEDGE_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._generation = 0
+        self._fingerprint = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def current(self, db: Optional[Session] = None) -> int:
+        # Sans session : dernière génération connue, sans accès base
+        if db is not None and time.monotonic() - self._checked_at >= self.refresh_seconds:
+            self._refresh(db)
+        return self._generation
+
+    def _refresh(self, db: Session):
+        version = embedding_versions.active(db)
+        chunk = models.RagPortfolio
+        try:
+            count, last_id = db.query(func.count(chunk.id), func.max(chunk.id)) \
+                               .filter(chunk.embedding_version == version.key).one()
+        except Exception as e:
+            print(f"Warning: Version de la base de connaissance illisible : {e}")
+            db.rollback()
+            self._checked_at = time.monotonic()
+            return
+        fingerprint = (version.key, count, last_id)
+        with self._lock:
+            previous, self._fingerprint = self._fingerprint, fingerprint
+            self._checked_at = time.monotonic()
+        if previous is not None and previous != fingerprint:
+            print(f"✅ Base de connaissance modifiée ({count} chunks) : index en mémoire rechargés")
+            _on_knowledge_change()
+
+    def bump(self):
+        with self._lock:
+            self._generation += 1
+
+
+def _on_knowledge_change():
+    from services.answer_cache import answer_cache
+
+    reset_stores()
+    bm25_index.reset()
+    answer_cache.clear()
+    knowledge.bump()
+
+
+knowledge = KnowledgeVersion()
+
+
+def knowledge_version(db: Optional[Session] = None) -> int:
+    return knowledge.current(db)
+
+
+def bump_knowledge_version():
+    knowledge.bump()
+
+
+def get_vector_store(version: Optional[EmbeddingVersion] = None):
+    """
+    Moteur de recherche d'une version d'embedding (par défaut la dernière version active connue).
+    """
+    version = version or embedding_versions.current()
+    with _stores_lock:
+        store = _stores.get(version.key)
+        if store is None:
+            store = NumpyVectorStore(version, numpy_index_path(version)) if RAG_RETRIEVAL_BACKEND == "numpy" \
+                else OracleVectorStore(version)
+            _stores[version.key] = store
+        return store
+
+
+def reset_stores():
+    # Après une bascule de version : les index des versions précédentes sont libérés
+    with _stores_lock:
+        _stores.clear()
+
+
+def index_stats() -> Dict[str, Any]:
+    """
+    Version, format et empreinte mémoire de l'index vectoriel (octets scannés, matrice float32).
+    """
+    store = get_vector_store()
+    if isinstance(store, NumpyVectorStore):
+        return {"backend": "numpy", "version": store.version.key, "dimensions": store.index.dimensions,
+                **store.index.memory_bytes()}
+    return {"backend": "oracle", "version": store.version.key, "dimensions": store.dimensions,
+            "quantization": store.quantization or "none"}
+
+
+def store_embeddings(db: Session, docs: List[Dict[str, Any]], version: Optional[EmbeddingVersion] = None):
+    """
+    Enregistre les embeddings de documents déjà insérés dans le moteur de recherche configuré.
+    Chaque document est un dict {id, source, content, embedding}.
+    Les index en mémoire ne voient les documents qu'une fois le commit de l'appelant passé.
+    """
+    get_vector_store(version).add_many(db, docs)
+
+    def publish():
+        # L'index lexical BM25 (recherche hybride) suit les mêmes ingestions
+        bm25_index.add_many(docs)
+        bump_knowledge_version()
+    after_commit(db, publish)
+
+
+def remove_documents(db: Session, doc_ids: List[int], version: Optional[EmbeddingVersion] = None):
+    """
+    Retire des documents (déjà supprimés d'Oracle) du moteur de recherche configuré.
+    """
+    get_vector_store(version).remove(db, doc_ids)
+    bm25_index.remove(doc_ids)
+    bump_knowledge_version()
+
+
+def search_similar(db: Session, embedding: List[float], k: int = RAG_TOP_K,
+                   version: Optional[EmbeddingVersion] = None) -> List[Dict[str, Any]]:
+    """
+    Retourne les k documents les plus proches de l'embedding (similarité cosinus).
+    L'embedding doit avoir été calculé avec la même `version` que l'index interrogé.
+    """
+    return get_vector_store(version).search(db, embedding, k)
@@ -0,0 +1,79 @@
+import os
+import sys
+
+# Configuration lue à l'import des services : fixée avant tout import (SQLite, index NumPy, faux Bedrock)
+os.environ.update({
+    "RAG_RETRIEVAL_BACKEND": "numpy",
+    "RAG_NUMPY_INDEX_PATH": "",
+    "EMBEDDING_CACHE_DB": "false",
+    "ANSWER_CACHE_ENABLED": "false",
+    "CHAT_SESSION_ORACLE": "false",
+    "CHAT_BUDGET_ORACLE": "false",
+    "ANALYTICS_BUFFER_ENABLED": "true",
+    "AWS_ACCESS_KEY_ID": "test",
+    "AWS_SECRET_ACCESS_KEY": "test",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    """
+    Base SQLite en mémoire, substituée à Oracle dans les modules qui ouvrent leurs propres connexions.
+    """
+    from services import analytics_buffer, analytics_rollup, embedding_cache, reembed, token_budget
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    for module in (analytics_buffer, analytics_rollup, embedding_cache, reembed, token_budget):
+        monkeypatch.setattr(module, "engine", engine)
+    monkeypatch.setattr(reembed, "SessionLocal", session_factory)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def fresh_rag_state(monkeypatch):
+    # Version active, index en mémoire et single-flight propres à chaque test
+    from services import single_flight, vector_store
+    from services.embedding_versions import embedding_versions
+    from services.lexical_index import bm25_index
+
+    monkeypatch.setattr(embedding_versions, "_active", None)
+    monkeypatch.setattr(vector_store, "_stores", {})
+    monkeypatch.setattr(vector_store, "knowledge", vector_store.KnowledgeVersion())
+    monkeypatch.setattr(single_flight.chat_flights, "_flights", {})
+    bm25_index.reset()
+    yield
+    bm25_index.reset()
+
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def fake_bedrock(monkeypatch):
+    """
+    Faux bedrock-runtime du benchmark (Titan déterministe, Claude scripté), sans réseau.
+    """
+    from benchmarks.fake_bedrock import FakeBedrockRuntime
+    from services import bedrock_async, bedrock_service
+
+    fake = FakeBedrockRuntime(embed_latency=0.0, first_token_latency=0.05, token_latency=0.0)
+    monkeypatch.setattr(bedrock_service, "bedrock_runtime", fake)
+    monkeypatch.setattr(bedrock_async, "_transport", fake.transport())
+    monkeypatch.setattr(bedrock_async, "_clients", {})
+    monkeypatch.setattr(bedrock_async, "_semaphores", {})
+    return fake
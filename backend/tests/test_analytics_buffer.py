@@ -0,0 +1,105 @@
+import datetime
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from services.analytics_buffer import EventBuffer
+
+MOMENT = datetime.datetime(2026, 3, 2, 10)
+
+
+def _rows(count, bad=()):
+    # event_type NULL : refusé par la base (NOT NULL), comme une valeur trop longue sur Oracle
+    return [{"event_type": None if i in bad else "page_view", "target_id": None, "ip_hash": f"hash-{i}",
+             "user_agent": "pytest", "created_at": MOMENT} for i in range(count)]
+
+
+def _buffer(**kwargs) -> EventBuffer:
+    # Pas de flush par le thread pendant le test : seulement les appels explicites
+    return EventBuffer(**{"flush_size": 100, "flush_seconds": 3600, **kwargs})
+
+
+def _counts(engine):
+    with engine.connect() as conn:
+        events = conn.execute(text("SELECT COUNT(*) FROM analytics")).scalar()
+        rolled_up = conn.execute(text("SELECT COALESCE(SUM(events), 0) FROM analytics_daily")).scalar()
+    return events, rolled_up
+
+
+def _connection_lost():
+    return OperationalError("INSERT INTO analytics", {}, Exception("ORA-03113: end-of-file on communication channel"))
+
+
+def test_bad_rows_are_isolated_and_the_rest_is_written(engine):
+    buffer = _buffer()
+    buffer.add_many(_rows(16, bad={3, 11}))
+
+    assert buffer.flush() == 14
+    assert _counts(engine) == (14, 14)
+    stats = buffer.stats()
+    assert (stats["written"], stats["rejected"], stats["pending"], stats["batches"]) == (14, 2, 0, 1)
+
+
+def test_connection_error_requeues_the_batch(engine, monkeypatch):
+    buffer = _buffer()
+    write = buffer.write
+    calls = []
+
+    def flaky_write(rows):
+        calls.append(len(rows))
+        if len(calls) == 1:
+            raise _connection_lost()
+        write(rows)
+
+    monkeypatch.setattr(buffer, "write", flaky_write)
+    buffer.add_many(_rows(10))
+
+    assert buffer.flush() == 0
+    assert buffer.stats()["pending"] == 10
+    assert buffer.stats()["failed_batches"] == 1
+    assert buffer.flush() == 10
+    assert _counts(engine) == (10, 10)
+
+
+def test_connection_error_during_bisection_keeps_only_unwritten_rows(engine, monkeypatch):
+    buffer = _buffer()
+    write = buffer.write
+    calls = []
+
+    def flaky_write(rows):
+        # Lot refusé (ligne 1) puis coupé : [0-3], [0-1], [0] écrite, [1] rejetée, puis perte de connexion sur [2-3]
+        calls.append(len(rows))
+        if len(calls) == 6:
+            raise _connection_lost()
+        write(rows)
+
+    monkeypatch.setattr(buffer, "write", flaky_write)
+    buffer.add_many(_rows(8, bad={1}))
+
+    assert buffer.flush() == 1
+    stats = buffer.stats()
+    assert (stats["written"], stats["rejected"], stats["pending"]) == (1, 1, 6)
+    assert calls == [8, 4, 2, 1, 1, 2]
+    assert _counts(engine) == (1, 1)
+
+    # Les événements remis en file sont écrits une seule fois
+    monkeypatch.setattr(buffer, "write", write)
+    buffer.flush()
+    assert _counts(engine) == (7, 7)
+    assert buffer.stats()["written"] == 7
+
+
+def test_batch_is_dropped_after_max_retries(engine, monkeypatch):
+    buffer = _buffer(max_retries=3)
+
+    def down(rows):
+        raise _connection_lost()
+
+    monkeypatch.setattr(buffer, "write", down)
+    buffer.add_many(_rows(5))
+    for _ in range(3):
+        buffer.flush()
+
+    stats = buffer.stats()
+    assert (stats["pending"], stats["dropped"], stats["failed_batches"]) == (0, 5, 3)
+    assert _counts(engine) == (0, 0)
@@ -0,0 +1,93 @@
+import datetime
+
+from sqlalchemy import inspect, select, text
+
+import models
+from migrations import drop_obsolete_tables
+from services import analytics_rollup
+from services.analytics_buffer import EventBuffer
+
+DAY = datetime.datetime(2026, 3, 2)
+
+
+def _event(event_type, target_id, visitor, moment):
+    return {"event_type": event_type, "target_id": target_id, "ip_hash": f"hash-{visitor}",
+            "user_agent": "pytest", "created_at": moment}
+
+
+def _events():
+    # 2 jours, 300 visiteurs : tous voient la page d'accueil, un sur trois ouvre un projet
+    rows = []
+    for day in range(2):
+        for visitor in range(300):
+            moment = DAY + datetime.timedelta(days=day, hours=visitor % 24)
+            rows.append(_event("page_view", None, visitor + day * 100, moment))
+            if visitor % 3 == 0:
+                rows.append(_event("project_view", 1 + visitor % 2, visitor, moment))
+    return rows
+
+
+def _daily(conn):
+    table = models.AnalyticsDaily.__table__
+    return {(r.bucket, r.event_type, r.target_id): r.events for r in conn.execute(select(table))}
+
+
+def test_apply_counts_each_batch_in_the_rollups(engine):
+    rows = _events()
+    buffer = EventBuffer()
+    # Deux lots qui se chevauchent sur les mêmes clés : INSERT puis UPDATE
+    buffer.write(rows[:250])
+    buffer.write(rows[250:])
+
+    with engine.connect() as conn:
+        daily = _daily(conn)
+        hourly = conn.execute(text("SELECT SUM(events) FROM analytics_hourly")).scalar()
+    assert daily[(DAY, "page_view", analytics_rollup.NO_TARGET)] == 300
+    assert daily[(DAY, "project_view", 1)] == 50
+    assert daily[(DAY, "project_view", 2)] == 50
+    assert sum(daily.values()) == hourly == len(rows)
+
+    # `rebuild` depuis la table analytics retrouve exactement les mêmes compteurs
+    with engine.connect() as conn:
+        incremental = _daily(conn)
+    analytics_rollup.rebuild()
+    with engine.connect() as conn:
+        assert _daily(conn) == incremental
+
+
+def test_unique_visitors_from_daily_sketches(engine):
+    EventBuffer().write(_events())
+
+    with engine.connect() as conn:
+        first_day = analytics_rollup.unique_visitors(conn, DAY, DAY)
+        both_days = analytics_rollup.unique_visitors(conn, DAY, DAY + datetime.timedelta(days=1))
+        none = analytics_rollup.unique_visitors(conn, DAY + datetime.timedelta(days=5))
+
+    # Visiteurs 0-299 le premier jour, 100-399 le second : 400 sur les deux jours
+    assert abs(first_day["*"] - 300) <= 9
+    assert abs(both_days["*"] - 400) <= 12
+    assert abs(both_days["project_view"] - 100) <= 3
+    assert none == {"*": 0}
+
+
+def test_summary_reads_the_rollups(db, engine):
+    from routers.analytics import get_analytics_summary
+
+    EventBuffer().write(_events())
+    summary = get_analytics_summary(from_date=DAY.date(), to_date=DAY.date(), event_type=None,
+                                    window_days=7, db=db)
+    assert summary["global"] == {"page_view": 300, "project_view": 100}
+    assert summary["projects_views"] == {"project_1": 50, "project_2": 50}
+    assert abs(summary["unique_visitors"] - 300) <= 9
+
+    filtered = get_analytics_summary(from_date=None, to_date=None, event_type="project_view",
+                                     window_days=7, db=db)
+    assert filtered["global"] == {"project_view": 200}
+    assert abs(filtered["unique_visitors"] - 100) <= 3
+
+
+def test_obsolete_visitors_table_is_dropped(engine):
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE analytics_visitors (ip_hash VARCHAR(64) PRIMARY KEY)"))
+    drop_obsolete_tables(engine)
+    assert "analytics_visitors" not in inspect(engine).get_table_names()
@@ -0,0 +1,39 @@
+import pytest
+
+from services.bedrock_service import build_system_prompt
+from services.intent_classifier import GIBBERISH, GOODBYE, GREETING, QUESTION, THANKS, IntentClassifier
+
+
+@pytest.fixture
+def classifier():
+    return IntentClassifier()
+
+
+@pytest.mark.parametrize("text", [
+    "efdsg", "aaaa", "zzz", "qsdf", "sdfg", "poiu", "azerty", "qsdfghjk", "fdsghk", "sdfsdf", "xkcdvfj", "123 456", "!!!",
+])
+def test_gibberish(classifier, text):
+    assert classifier.classify(text) == GIBBERISH
+
+
+@pytest.mark.parametrize("text", [
+    # Sigles courts, en minuscules ou non : jamais court-circuités
+    "html", "RGPD ?", "ssis", "hdfs", "llms", "spss", "grpc", "sncf", "Kpmg", "KPMG", "dbt",
+    "nginx", "mlops", "pyspark", "Quelles sont ses certifications ?", "what are his skills",
+    # Autres alphabets
+    "Какой у него опыт?", "他有什么经验？",
+])
+def test_questions(classifier, text):
+    assert classifier.classify(text) == QUESTION
+
+
+@pytest.mark.parametrize("text, intent", [
+    ("Bonjour !", GREETING), ("salut ça va ?", GREETING), ("merci beaucoup", THANKS), ("au revoir", GOODBYE),
+])
+def test_small_talk(classifier, text, intent):
+    assert classifier.classify(text) == intent
+
+
+def test_system_prompt_keeps_the_gibberish_rule():
+    # Le classifieur laisse passer le charabia court qu'il ne distingue pas d'un sigle ("kqdj")
+    assert "charabia" in build_system_prompt("contexte")
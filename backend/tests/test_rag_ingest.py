@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+from pydantic import ValidationError
+
+import models
+import schemas
+
+
+@pytest.mark.parametrize("content", [" " * 50, "\n\t \n" * 20, "   court   "])
+def test_blank_document_is_rejected(content):
+    with pytest.raises(ValidationError):
+        schemas.RagDocumentCreate(source="doc", content=content)
+
+
+def test_document_fields_are_stripped():
+    document = schemas.RagDocumentCreate(source="  doc  ", content="\n  Berthoni est Data Engineer.  \n")
+    assert document.source == "doc"
+    assert document.content == "Berthoni est Data Engineer."
+
+
+def test_bulk_ingest_reports_documents_without_chunks(db, fake_bedrock, monkeypatch):
+    from routers import rag
+    from services import chunking
+
+    real_chunk_text = chunking.chunk_text
+    monkeypatch.setattr(chunking, "chunk_text",
+                        lambda text, source, *args: [] if source == "vide" else real_chunk_text(text, source, *args))
+    documents = [schemas.RagDocumentCreate(source="vide", content="Rien d'indexable ici."),
+                 schemas.RagDocumentCreate(source="cv", content="Berthoni est Data Engineer certifié Fabric.")]
+
+    statuses = asyncio.run(rag._bulk_ingest(documents, db, []))
+
+    assert [(s.source, s.status, s.chunks) for s in statuses] == [("vide", "error", 0), ("cv", "indexed", 1)]
+    assert db.query(models.RagPortfolio).filter(models.RagPortfolio.source == "vide").count() == 0
+    assert len(statuses[1].ids) == 1
+
+
+def _ingest(db, content):
+    from services import chunking, rag_ingest
+
+    chunks = chunking.chunk_text(content, "late_doc")
+    return rag_ingest.insert_chunks(db, chunks, rag_ingest.embed_texts([c["content"] for c in chunks]))
+
+
+def test_in_memory_indexes_follow_the_commit(db, fake_bedrock):
+    from benchmarks.fake_bedrock import fake_embedding
+    from services import vector_store
+    from services.lexical_index import bm25_index
+
+    bm25_index.ensure_loaded(db)
+    vector_store.get_vector_store().ensure_loaded(db)
+    generation = vector_store.knowledge_version()
+
+    ids = _ingest(db, "Berthoni a publié un article sur Kubeflow et Dagster.")
+    # Pas encore validé : ni BM25, ni l'index NumPy, ni la version de la base ne voient le chunk
+    assert not bm25_index.has_term("kubeflow")
+    assert vector_store.search_similar(db, fake_embedding("Kubeflow Dagster"), 1) == []
+    assert vector_store.knowledge_version() == generation
+
+    db.commit()
+    assert bm25_index.has_term("kubeflow")
+    assert vector_store.search_similar(db, fake_embedding("Kubeflow Dagster"), 1)[0]["id"] == ids[0]
+    assert vector_store.knowledge_version() > generation
+
+
+def test_rolled_back_ingest_leaves_no_phantom_chunk(db, fake_bedrock):
+    from benchmarks.fake_bedrock import fake_embedding
+    from services import vector_store
+    from services.lexical_index import bm25_index
+
+    bm25_index.ensure_loaded(db)
+    vector_store.get_vector_store().ensure_loaded(db)
+
+    _ingest(db, "Berthoni a publié un article sur Kubeflow et Dagster.")
+    db.rollback()
+    db.commit()
+    assert not bm25_index.has_term("kubeflow")
+    assert vector_store.search_similar(db, fake_embedding("Kubeflow Dagster"), 1) == []
+    assert db.query(models.RagPortfolio).count() == 0
+
+
+def test_updates_registered_in_a_rolled_back_savepoint_are_dropped(db):
+    from services import vector_store
+
+    applied = []
+    db.execute(models.RagPortfolio.__table__.select())
+    vector_store.after_commit(db, lambda: applied.append("transaction"))
+    try:
+        with db.begin_nested():
+            vector_store.after_commit(db, lambda: applied.append("savepoint"))
+            raise RuntimeError("colonne VECTOR absente")
+    except RuntimeError:
+        pass
+    assert applied == []
+    db.commit()
+    assert applied == ["transaction"]
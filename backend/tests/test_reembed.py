@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+from benchmarks.fake_bedrock import fake_embedding
+from services import chunking, rag_ingest, reembed, vector_store
+from services.embedding_versions import EmbeddingVersion, active_version
+
+import models
+
+GRACE = 2.0
+
+
+def _seed(db):
+    chunks = chunking.chunk_text(open("data/cv_berthoni_rag.txt", encoding="utf-8").read(), "cv_complet")
+    rag_ingest.insert_chunks(db, chunks, rag_ingest.embed_texts([c["content"] for c in chunks]))
+    db.commit()
+    return len(chunks)
+
+
+def _rows(db, version):
+    return db.query(models.RagPortfolio).filter(models.RagPortfolio.embedding_version == version.key).all()
+
+
+def test_reembed_switches_version_and_keeps_late_ingests(db, engine, fake_bedrock, monkeypatch):
+    """
+    Un process qui n'a pas encore relu la version active ingère dans l'ancienne pendant le délai de grâce :
+    son chunk doit se retrouver dans la nouvelle version, pas disparaître avec la purge.
+    """
+    count = _seed(db)
+    source = active_version(db)
+    target = EmbeddingVersion(source.model_id, 256, source.normalize)
+
+    def sleep(seconds):
+        if seconds != GRACE:
+            return
+        late = chunking.chunk_text("late_doc : Berthoni a publié un article sur dbt et Airflow.", "late_doc")
+        rag_ingest.insert_chunks(db, late, rag_ingest.embed_texts([c["content"] for c in late], version=source),
+                                 source, store=vector_store.get_vector_store(source))
+        db.commit()
+
+    monkeypatch.setattr(reembed, "time", SimpleNamespace(sleep=sleep))
+    result = reembed.reembed(target, batch_size=4, pause=0, grace=GRACE)
+
+    db.expire_all()
+    assert result["version"] == target.key and "error" not in result
+    assert active_version(db) == target
+    assert result["kept"] == 0
+    assert _rows(db, source) == []
+    sources = [r.source for r in _rows(db, target)]
+    assert sources.count("cv_complet") == count
+    assert "late_doc" in sources
+    hits = vector_store.search_similar(db, fake_embedding("article dbt Airflow", 256), 1, target)
+    assert hits[0]["source"] == "late_doc"
+
+
+def test_reembed_is_a_no_op_on_the_active_version(db, engine, fake_bedrock):
+    _seed(db)
+    result = reembed.reembed(active_version(db), pause=0, grace=0)
+    assert result["embedded"] == 0 and result["status"] == "active"
@@ -0,0 +1,140 @@
+import asyncio
+import gc
+import time
+
+import pytest
+from starlette.requests import Request
+
+from services.token_budget import BudgetExceeded, TokenBudget
+
+
+def make_budget(**kwargs) -> TokenBudget:
+    options = dict(rate_per_minute=600, burst=1000, daily_cap=0, max_generations=8, max_per_client=2,
+                   use_oracle=False)
+    options.update(kwargs)
+    return TokenBudget(**options)
+
+
+def test_reserve_debits_bucket_and_settle_refunds_unused_tokens():
+    budget = make_budget()
+    reservation = budget.reserve("1.1.1.1", 600)
+    assert budget.stats()["generations_in_progress"] == 1
+
+    reservation.input_tokens, reservation.output_tokens = 100, 50
+    reservation.settle()
+    assert budget.stats()["generations_in_progress"] == 0
+    assert budget.spent_today() == 150
+    # 1000 - 600 + 450 remboursés : une question à 800 passe
+    budget.reserve("1.1.1.1", 800).settle()
+
+
+def test_client_bucket_exhausted_raises_with_retry_after():
+    budget = make_budget()
+    budget.reserve("1.1.1.1", 1000)
+    with pytest.raises(BudgetExceeded) as error:
+        budget.reserve("1.1.1.1", 500)
+    assert error.value.retry_after >= 1
+    assert budget.stats()["rejected"]["client_budget"] == 1
+    # Un autre client a son propre seau
+    budget.reserve("2.2.2.2", 500)
+
+
+def test_concurrency_limits_per_client_and_global():
+    budget = make_budget(max_generations=3, max_per_client=2, burst=100000)
+    held = [budget.reserve("1.1.1.1", 10), budget.reserve("1.1.1.1", 10)]
+    with pytest.raises(BudgetExceeded):
+        budget.reserve("1.1.1.1", 10)
+    held.append(budget.reserve("2.2.2.2", 10))
+    with pytest.raises(BudgetExceeded):
+        budget.reserve("3.3.3.3", 10)
+    held.pop().settle()
+    budget.reserve("3.3.3.3", 10).settle()
+    assert budget.stats()["rejected"]["concurrency"] == 2
+
+
+def test_daily_cap():
+    budget = make_budget(daily_cap=1500, burst=100000)
+    spent = budget.reserve("1.1.1.1", 1000)
+    spent.input_tokens = 1000
+    spent.settle()
+    reservation = budget.reserve("2.2.2.2", 400)
+    with pytest.raises(BudgetExceeded) as error:
+        budget.reserve("3.3.3.3", 200)
+    assert "quota du jour" in error.value.detail
+    reservation.settle()
+
+
+def test_abandoned_reservation_frees_its_slot_without_refund():
+    budget = make_budget(max_generations=1)
+    budget.reserve("1.1.1.1", 300)
+    gc.collect()
+    assert budget.stats()["generations_in_progress"] == 0
+    assert budget.spent_today() == 300
+
+
+def _request(ip: str) -> Request:
+    return Request({"type": "http", "method": "POST", "path": "/api/rag/chat", "headers": [],
+                    "query_string": b"", "client": (ip, 40000)})
+
+
+@pytest.fixture
+def chat(db, fake_bedrock, monkeypatch):
+    from routers import rag
+    from services import chunking, rag_ingest
+
+    chunks = chunking.chunk_text(open("data/cv_berthoni_rag.txt", encoding="utf-8").read(), "cv_complet")
+    rag_ingest.insert_chunks(db, chunks, rag_ingest.embed_texts([c["content"] for c in chunks]))
+    db.commit()
+    budget = make_budget(burst=100000)
+    monkeypatch.setattr(rag, "CHAT_BUDGET_ENABLED", True)
+    monkeypatch.setattr(rag, "token_budget", budget)
+    return rag, budget
+
+
+def _burst(rag, db, clients, stagger: float = 0.0):
+    from fastapi import HTTPException
+
+    async def ask(position: int, ip: str):
+        # `stagger` : le premier client arrive seul et devient le leader
+        await asyncio.sleep(stagger if position else 0)
+        try:
+            response = await rag.ask_chatbot(_request(ip), "Quelles sont ses certifications ?", db=db)
+        except HTTPException as e:
+            return e.status_code
+        "".join([chunk async for chunk in response.body_iterator])
+        return 200
+
+    async def burst():
+        return await asyncio.gather(*(ask(position, ip) for position, ip in enumerate(clients)))
+
+    return asyncio.run(burst())
+
+
+def test_single_flight_followers_do_not_take_budget_slots(chat, db, fake_bedrock):
+    """
+    20 visiteurs (IP différentes) posent la même question au même moment : un seul appel Claude,
+    et aucun 429 pour ceux qui ne font qu'attendre la réponse du leader.
+    """
+    rag, budget = chat
+    statuses = _burst(rag, db, [f"10.0.0.{i}" for i in range(20)])
+    assert statuses == [200] * 20
+    assert len(fake_bedrock.claude_requests) == 1
+    assert budget.stats()["generations_in_progress"] == 0
+
+
+def test_followers_take_over_when_the_leader_is_over_budget(chat, db, fake_bedrock, monkeypatch):
+    rag, budget = chat
+    held = [budget.reserve("10.0.0.0", 10), budget.reserve("10.0.0.0", 10)]
+    reserve = budget.reserve
+
+    def slow_reserve(client, amount):
+        # Les autres visiteurs rejoignent la question pendant que le leader se fait refuser
+        time.sleep(0.05)
+        return reserve(client, amount)
+
+    monkeypatch.setattr(budget, "reserve", slow_reserve)
+    statuses = _burst(rag, db, [f"10.0.0.{i}" for i in range(5)], stagger=0.02)
+    assert statuses == [429, 200, 200, 200, 200]
+    assert len(fake_bedrock.claude_requests) == 1
+    for reservation in held:
+        reservation.settle()
@@ -1,6 +1,7 @@
 "use client";
 import Navbar from "../components/Navbar";
 import ParticlesCanvas from "../components/ParticlesCanvas";
+import { trackEvent } from "../hooks/useAnalytics";
 
 export default function AboutPage() {
     return (
@@ -42,11 +43,7 @@ export default function AboutPage() {
                                     download
                                     className="btn-primary"
                                     onClick={() => {
-                                        fetch(`https://www.berthonipassoportfolio.com/api/analytics/`, {
-                                            method: "POST",
-                                            headers: { "Content-Type": "application/json" },
-                                            body: JSON.stringify({ event_type: "cv_download" })
-                                        }).catch(console.warn);
+                                        trackEvent("cv_download");
                                     }}
                                 >
                                     📥 Télécharger CV (PDF)
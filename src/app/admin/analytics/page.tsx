@@ -4,7 +4,21 @@ import { useRouter } from "next/navigation";
 import Link from "next/link";
 import Navbar from "../../components/Navbar";
 
+// Période affichée : N derniers jours (jours UTC, comme les rollups côté API) ou tout l'historique
+const PERIODS: { label: string; days: number | null }[] = [
+    { label: "7 derniers jours", days: 7 },
+    { label: "30 jours", days: 30 },
+    { label: "Tout", days: null },
+];
+
+function periodStart(days: number): string {
+    const start = new Date();
+    start.setUTCDate(start.getUTCDate() - (days - 1));
+    return start.toISOString().slice(0, 10);
+}
+
 interface AnalyticsData {
+    range: { from: string | null; to: string | null; event_type: string | null };
     global: {
         page_view?: number;
         cv_download?: number;
@@ -14,12 +28,19 @@ interface AnalyticsData {
     };
     unique_visitors: number;
     projects_views: Record<string, number>;
+    window_unique_visitors: {
+        days: number;
+        since: string;
+        visitors: number;
+        by_event_type: Record<string, number>;
+    };
 }
 
 export default function AdminAnalytics() {
     const router = useRouter();
     const [stats, setStats] = useState<AnalyticsData | null>(null);
     const [loading, setLoading] = useState(true);
+    const [period, setPeriod] = useState<number | null>(7);
 
     useEffect(() => {
         const token = localStorage.getItem("admin_token");
@@ -29,8 +50,9 @@ export default function AdminAnalytics() {
         }
 
         const fetchStats = async () => {
+            const query = period ? `?from=${periodStart(period)}` : "";
             try {
-                const res = await fetch(`https://www.berthonipassoportfolio.com/api/analytics/summary`, {
+                const res = await fetch(`https://www.berthonipassoportfolio.com/api/analytics/summary${query}`, {
                     headers: {
                         "Authorization": `Bearer ${token}`
                     }
@@ -47,7 +69,7 @@ export default function AdminAnalytics() {
         };
 
         fetchStats();
-    }, [router]);
+    }, [router, period]);
 
     if (loading || !stats) return (
         <div style={{ minHeight: "100vh", background: "var(--bg-primary)" }}>
@@ -70,10 +92,25 @@ export default function AdminAnalytics() {
                             ← Retour au Dashboard
                         </Link>
                         <h1 style={{ fontSize: "2.5rem", fontWeight: "800" }}>Analytics & Trafic</h1>
+                        <p style={{ color: "var(--text-muted)", marginTop: "8px" }}>
+                            {stats.range.from ? `Depuis le ${stats.range.from}` : "Tout l'historique"}
+                        </p>
+                    </div>
+                    <div style={{ display: "flex", gap: "8px" }}>
+                        {PERIODS.map(({ label, days }) => (
+                            <button
+                                key={label}
+                                onClick={() => setPeriod(days)}
+                                className={period === days ? "btn-primary" : "btn-secondary"}
+                                style={{ padding: "8px 16px" }}
+                            >
+                                {label}
+                            </button>
+                        ))}
+                        <button onClick={() => window.location.reload()} className="btn-secondary" style={{ padding: "8px 16px" }}>
+                            🔄 Rafraîchir
+                        </button>
                     </div>
-                    <button onClick={() => window.location.reload()} className="btn-secondary" style={{ padding: "8px 16px" }}>
-                        🔄 Rafraîchir
-                    </button>
                 </div>
 
                 {/* KPIs Principaux */}
@@ -113,7 +150,7 @@ export default function AdminAnalytics() {
                         <h2 style={{ fontSize: "1.5rem", marginBottom: "32px" }}>Popularité des Projets (Vues)</h2>
                         <div style={{ display: "flex", flexDirection: "column", gap: "24px" }}>
                             {Object.entries(stats.projects_views).length === 0 ? (
-                                <p style={{ color: "var(--text-muted)", fontStyle: "italic" }}>Aucun projet consulté récemment.</p>
+                                <p style={{ color: "var(--text-muted)", fontStyle: "italic" }}>Aucun projet consulté sur la période.</p>
                             ) : (
                                 Object.entries(stats.projects_views)
                                     .sort(([, a], [, b]) => b - a)
@@ -16,6 +16,8 @@ export default function Chatbot() {
     const [input, setInput] = useState("");
     const [isLoading, setIsLoading] = useState(false);
     const messagesEndRef = useRef<HTMLDivElement>(null);
+    // Identifiant de conversation renvoyé par le backend (historique conservé côté serveur)
+    const sessionIdRef = useRef<string | null>(null);
 
     // État pour la bulle d'accueil temporaire
     const [showGreeting, setShowGreeting] = useState(false);
@@ -76,9 +78,18 @@ export default function Chatbot() {
         setIsLoading(true);
 
         try {
-            const res = await fetch(`https://www.berthonipassoportfolio.com/api/rag/chat?question=${encodeURIComponent(userMsg.content)}`, {
+            const sessionParam = sessionIdRef.current ? `&session_id=${sessionIdRef.current}` : "";
+            const res = await fetch(`https://www.berthonipassoportfolio.com/api/rag/chat?question=${encodeURIComponent(userMsg.content)}${sessionParam}`, {
                 method: "POST"
             });
+            sessionIdRef.current = res.headers.get("X-Chat-Session") ?? sessionIdRef.current;
+
+            // Budget de questions dépassé : le serveur explique quand réessayer
+            if (res.status === 429) {
+                const { detail } = await res.json().catch(() => ({ detail: null }));
+                setMessages(prev => [...prev, { id: (Date.now() + 1).toString(), role: "bot", content: `⏳ ${detail ?? "Trop de questions en peu de temps, réessayez dans un moment."}` }]);
+                return;
+            }
 
             if (!res.ok || !res.body) {
                 throw new Error("Erreur serveur RAG");
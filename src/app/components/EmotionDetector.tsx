@@ -1,5 +1,6 @@
 "use client";
 import { useState, useRef, useCallback, useEffect } from "react";
+import { trackEvent } from "../hooks/useAnalytics";
 
 const MAX_DAILY_USES = 5;
 const CAMERA_TIMEOUT_SEC = 30;
@@ -222,11 +223,7 @@ export default function EmotionDetector() {
             }
 
             // Track analytics
-            fetch(`https://www.berthonipassoportfolio.com/api/analytics/`, {
-                method: "POST",
-                headers: { "Content-Type": "application/json" },
-                body: JSON.stringify({ event_type: "ml_emotion_test" })
-            }).catch(() => { });
+            trackEvent("ml_emotion_test");
         } catch (e: unknown) {
             const msg = e instanceof Error ? e.message : "Erreur inconnue";
             setError(msg);
@@ -1,37 +1,70 @@
 "use client";
 import { useEffect } from "react";
 
-export function useAnalytics(eventType: string, targetId?: number) {
-    useEffect(() => {
-        // Enregistrer la page_view silencieusement sans bloquer le rendu
-        const trackEvent = async () => {
-            try {
-                // Afin de ne pas spamer en développement local, on peut ignorer ou faire tourner.
-                const res = await fetch(`https://www.berthonipassoportfolio.com/api/analytics/`, {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({
-                        event_type: eventType,
-                        target_id: targetId || null
-                    }),
-                });
+const ANALYTICS_BATCH_URL = `https://www.berthonipassoportfolio.com/api/analytics/batch`;
+// Les événements sont regroupés puis envoyés en une seule requête (max 50 par lot côté API)
+const FLUSH_DELAY_MS = 2000;
+const MAX_BATCH = 50;
+
+type AnalyticsEvent = { event_type: string; target_id: number | null };
+
+let queue: AnalyticsEvent[] = [];
+let flushTimer: ReturnType<typeof setTimeout> | null = null;
+let listenersReady = false;
+
+function flushAnalytics() {
+    if (flushTimer) {
+        clearTimeout(flushTimer);
+        flushTimer = null;
+    }
+    while (queue.length > 0) {
+        // Corps en text/plain : requête CORS "simple", sans preflight OPTIONS
+        const body = JSON.stringify(queue.splice(0, MAX_BATCH));
+        try {
+            // sendBeacon survit à la fermeture de l'onglet et ne bloque pas la navigation
+            if (navigator.sendBeacon && navigator.sendBeacon(ANALYTICS_BATCH_URL, body)) continue;
+            fetch(ANALYTICS_BATCH_URL, {
+                method: "POST",
+                headers: { "Content-Type": "text/plain" },
+                body,
+                keepalive: true,
+            }).catch((error) => console.warn("Analytics Endpoint injoignable", error));
+        } catch (error) {
+            // Silencieux pour ne pas perturber l'UX du site
+            console.warn("Analytics non tracké", error);
+        }
+    }
+}
+
+function ensureListeners() {
+    if (listenersReady) return;
+    listenersReady = true;
+    // Onglet masqué ou page quittée : on envoie tout de suite ce qui attend
+    document.addEventListener("visibilitychange", () => {
+        if (document.visibilityState === "hidden") flushAnalytics();
+    });
+    window.addEventListener("pagehide", flushAnalytics);
+}
 
-                if (!res.ok) {
-                    console.warn(`Analytics non tracké: ${res.status}`);
-                }
-            } catch (error) {
-                // Silencieux pour ne pas perturber l'UX du site
-                console.warn("Analytics Endpoint injoignable", error);
-            }
-        };
+// Enregistrer un événement silencieusement, sans bloquer le rendu (envoi groupé différé)
+export function trackEvent(eventType: string, targetId?: number) {
+    if (typeof window === "undefined") return;
+    ensureListeners();
+    queue.push({ event_type: eventType, target_id: targetId || null });
+    if (queue.length >= MAX_BATCH) {
+        flushAnalytics();
+    } else if (!flushTimer) {
+        flushTimer = setTimeout(flushAnalytics, FLUSH_DELAY_MS);
+    }
+}
 
+export function useAnalytics(eventType: string, targetId?: number) {
+    useEffect(() => {
         // Empêche le doublon strict via sessionStorage pour 'page_view' (Optionnel)
         const sessionKey = `tracked_${eventType}_${targetId || 'global'}`;
         if (!sessionStorage.getItem(sessionKey)) {
             sessionStorage.setItem(sessionKey, "true");
-            trackEvent();
+            trackEvent(eventType, targetId);
         }
     }, [eventType, targetId]);
 }